@@ -0,0 +1,174 @@
+﻿from __future__ import annotations
+
+import argparse
+import importlib.util
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from types import ModuleType
+from typing import Dict, List, Optional, Sequence
+
+from workloads import WORKLOADS, Workload
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(PROJECT_ROOT / "stage4_predicate"))
+
+_MODULES: Dict[str, ModuleType] = {}
+
+# compare()와 --tolerance가 같이 쓰는 허용 오차 (README의 "기본 50%"도 이 값)
+DEFAULT_TOLERANCE = 0.5
+
+
+def load_stage(stage: str) -> ModuleType:
+    """The ``reasoner`` module of a stage; every stage names it reasoner.py, so stage2/3 get aliases."""
+    if stage not in _MODULES:
+        if stage == "stage4":
+            # stage4는 compact/columnar가 `from reasoner import ...`를 하므로 원래 이름으로 불러옴
+            import reasoner  # type: ignore
+
+            module = reasoner
+        else:
+            folder = {"stage2": "stage2_fc_mp", "stage3": "stage3_all9"}[stage]
+            spec = importlib.util.spec_from_file_location(f"{stage}_reasoner", PROJECT_ROOT / folder / "reasoner.py")
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+        _MODULES[stage] = module
+    return _MODULES[stage]
+
+
+@dataclass
+class BenchResult:
+    name: str
+    seconds: float
+    peak_bytes: int
+    iterations: Optional[int]
+    facts: int
+
+
+def _chain(workload: Workload, scale: float, profile: bool = False):
+    # profile=False면 반복 수를 세는 계측 없이 돌려 시간만 잼 (stage2는 원래 단계 수를 돌려줌)
+    facts, rules = workload.build(scale)
+    kb = load_stage(workload.stage).KB(facts=facts, rules=rules)
+    if workload.stage == "stage4":
+        kb.forward_chain(max_iterations=10_000, engine=workload.engine, profile=profile)
+        return kb, kb.stats.iterations if profile else None
+    if workload.stage == "stage2":
+        # stage2의 agenda 방식 forward_chain은 처리한 단계 수를 돌려줌
+        return kb, kb.forward_chain(max_steps=10_000)
+    if not profile:
+        kb.forward_chain(max_steps=10_000)
+        return kb, None
+    # stage3의 forward_chain은 반복마다 rule_modus_ponens를 정확히 한 번 부름
+    steps = [0]
+    modus_ponens = kb.rule_modus_ponens
+
+    def counted():
+        steps[0] += 1
+        return modus_ponens()
+
+    kb.rule_modus_ponens = counted
+    kb.forward_chain(max_steps=10_000)
+    return kb, steps[0]
+
+
+def run_workload(workload: Workload, scale: float = 1.0, repeat: int = 3) -> BenchResult:
+    """Best wall time over ``repeat`` unprofiled runs, then one profiled run for
+    the iteration count and one run under tracemalloc for peak memory."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        _chain(workload, scale)
+        best = min(best, time.perf_counter() - started)
+    kb, iterations = _chain(workload, scale, profile=True)
+    tracemalloc.start()
+    try:
+        _chain(workload, scale)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return BenchResult(workload.name, best, peak, iterations, len(kb.facts))
+
+
+def run_suite(names: Optional[Sequence[str]] = None, scale: float = 1.0, repeat: int = 3) -> Dict[str, BenchResult]:
+    selected = [WORKLOADS[name] for name in names] if names else list(WORKLOADS.values())
+    return {workload.name: run_workload(workload, scale, repeat) for workload in selected}
+
+
+def save_baseline(results: Dict[str, BenchResult], path: str, scale: float) -> None:
+    data = {
+        "meta": {"python": platform.python_version(), "machine": platform.machine(), "scale": scale},
+        "results": {name: asdict(result) for name, result in results.items()},
+    }
+    Path(path).write_text(json.dumps(data, indent=2) + "\n", encoding="utf-8")
+
+
+def load_baseline(path: str) -> dict:
+    return json.loads(Path(path).read_text(encoding="utf-8"))
+
+
+def compare(results: Dict[str, BenchResult], baseline: dict, tolerance: float = DEFAULT_TOLERANCE) -> List[str]:
+    """Regressions against ``baseline``: slower or larger by more than ``tolerance``, or different output."""
+    problems = []
+    for name, result in results.items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        workload = WORKLOADS.get(name)
+        deterministic = workload is None or workload.deterministic
+        if deterministic and (result.facts != base["facts"] or result.iterations != base["iterations"]):
+            problems.append(
+                f"{name}: output changed ({base['facts']} -> {result.facts} facts, "
+                f"{base['iterations']} -> {result.iterations} iterations)"
+            )
+        if result.seconds > base["seconds"] * (1 + tolerance):
+            problems.append(f"{name}: {base['seconds']:.3f}s -> {result.seconds:.3f}s")
+        if result.peak_bytes > base["peak_bytes"] * (1 + tolerance):
+            problems.append(f"{name}: peak {base['peak_bytes']} -> {result.peak_bytes} bytes")
+    return problems
+
+
+def format_results(results: Dict[str, BenchResult]) -> str:
+    lines = [f"{'workload':34} {'seconds':>9} {'peak KiB':>10} {'iters':>6} {'facts':>8}"]
+    for result in results.values():
+        lines.append(
+            f"{result.name:34} {result.seconds:9.4f} {result.peak_bytes / 1024:10.1f} "
+            f"{result.iterations if result.iterations is not None else '-':>6} {result.facts:8}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the stage2/3/4 reasoners.")
+    parser.add_argument("workloads", nargs="*", help="workload names (default: all)")
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save", help="write results as a JSON baseline")
+    parser.add_argument("--check", help="compare against a JSON baseline and fail on regressions")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--list", action="store_true", help="list workloads and exit")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        print("\n".join(WORKLOADS))
+        return 0
+    results = run_suite(args.workloads, args.scale, args.repeat)
+    print(format_results(results))
+    if args.save:
+        save_baseline(results, args.save, args.scale)
+    if args.check:
+        baseline = load_baseline(args.check)
+        if baseline["meta"].get("scale") != args.scale:
+            print(f"warning: baseline was recorded at scale {baseline['meta'].get('scale')}")
+        problems = compare(results, baseline, args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+﻿from __future__ import annotations
+
+import argparse
+import sys
+import tracemalloc
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from bench import load_stage
+from workloads import WORKLOADS
+
+MEMORY_WORKLOADS = ("stage4/wide_family_tree", "stage4/random_graph", "stage4/existential_heavy")
+
+
+@dataclass
+class MemoryResult:
+    name: str
+    retained_bytes: int
+    peak_bytes: int
+    facts: int
+    rules: int
+
+    @property
+    def bytes_per_fact(self) -> float:
+        return self.retained_bytes / self.facts if self.facts else 0.0
+
+
+def many_rules(scale: float) -> Tuple[List[object], List[object]]:
+    # 규칙 객체 자체의 크기를 보기 위한 작업: 사실은 적고 규칙이 많음
+    count = max(10, int(5000 * scale))
+    rules = [
+        ("FORALL", ["?x", "?y"], ("IMPLIES", [(f"r{i}", "?x", "?y")], (f"r{i + 1}", "?y", "?x")))
+        for i in range(count)
+    ]
+    return [("r0", "a", "b")], rules
+
+
+def _rebuilt(facts: List[object]) -> List[object]:
+    # 파일에서 읽은 것처럼 사실마다 문자열을 새로 만들어, 같은 이름이 공유되지 않는 입력을 흉내 냄
+    return [tuple("".join(list(arg)) if isinstance(arg, str) else arg for arg in fact) for fact in facts]
+
+
+def measure(name: str, scale: float = 1.0) -> MemoryResult:
+    """Bytes still allocated once the KB has chained to its fixpoint, and the peak on the way."""
+    build = many_rules if name == "stage4/many_rules" else WORKLOADS[name].build
+    facts, rules = build(scale)
+    facts = _rebuilt(facts)
+    KB = load_stage("stage4").KB
+    tracemalloc.start()
+    try:
+        kb = KB(facts=facts, rules=rules)
+        del facts, rules
+        kb.forward_chain(max_iterations=10_000)
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return MemoryResult(name, retained, peak, len(kb.facts), len(kb.rules))
+
+
+def run_memory(names: Optional[Sequence[str]] = None, scale: float = 1.0) -> Dict[str, MemoryResult]:
+    selected = list(names) if names else list(MEMORY_WORKLOADS) + ["stage4/many_rules"]
+    return {name: measure(name, scale) for name in selected}
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Retained and peak memory of chained stage4 KBs.")
+    parser.add_argument("workloads", nargs="*", help="workload names (default: the stage4 memory set)")
+    parser.add_argument("--scale", type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    print(f"{'workload':30} {'retained KiB':>13} {'peak KiB':>10} {'facts':>8} {'rules':>6} {'B/fact':>7}")
+    for result in run_memory(args.workloads, args.scale).values():
+        print(
+            f"{result.name:30} {result.retained_bytes / 1024:13.1f} {result.peak_bytes / 1024:10.1f} "
+            f"{result.facts:8} {result.rules:6} {result.bytes_per_fact:7.0f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+﻿from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+from bench import load_stage
+from workloads import WORKLOADS
+
+DEFAULT_WORKERS = (1, 2, 4, 8, 16)
+
+
+@dataclass
+class ScalingPoint:
+    workers: int
+    seconds: float
+    speedup: float
+    identical: bool
+
+
+def run_scaling(
+    name: str = "stage4/random_graph",
+    workers: Sequence[int] = DEFAULT_WORKERS,
+    scale: float = 1.0,
+    repeat: int = 3,
+) -> List[ScalingPoint]:
+    """Time ``engine="parallel"`` at each worker count against serial semi-naive on one workload.
+
+    ``speedup`` is relative to the serial engine, and ``identical`` checks the
+    parallel fixpoint against the serial one.
+    """
+    workload = WORKLOADS[name]
+    if workload.stage != "stage4":
+        raise ValueError("Parallel chaining is only available for stage4 workloads")
+    KB = load_stage("stage4").KB
+    facts, rules = workload.build(scale)
+
+    def best_of(engine: str, count: Optional[int] = None):
+        best = float("inf")
+        for _ in range(repeat):
+            kb = KB(facts=facts, rules=rules)
+            started = time.perf_counter()
+            kb.forward_chain(max_iterations=10_000, engine=engine, workers=count)
+            best = min(best, time.perf_counter() - started)
+        return best, set(kb.facts)
+
+    serial_seconds, serial_facts = best_of("semi_naive")
+    points = []
+    for count in workers:
+        seconds, derived = best_of("parallel", count)
+        points.append(ScalingPoint(count, seconds, serial_seconds / seconds, derived == serial_facts))
+    return points
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Scaling of forward_chain(engine='parallel') with the worker count.")
+    parser.add_argument("workload", nargs="?", default="stage4/random_graph")
+    parser.add_argument("--workers", type=int, nargs="+", default=list(DEFAULT_WORKERS))
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    points = run_scaling(args.workload, args.workers, args.scale, args.repeat)
+    # 코어 수보다 워커가 많으면 속도 향상 대신 프로세스 간 통신 비용만 늘어남
+    print(f"{args.workload} at scale {args.scale} on {os.cpu_count()} CPU(s)")
+    print(f"{'workers':>7} {'seconds':>9} {'speedup':>8} {'identical':>9}")
+    for point in points:
+        print(f"{point.workers:7} {point.seconds:9.4f} {point.speedup:8.2f} {str(point.identical):>9}")
+    return 0 if all(point.identical for point in points) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
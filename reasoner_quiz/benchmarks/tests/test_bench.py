@@ -0,0 +1,41 @@
+from dataclasses import replace
+
+from bench import compare, load_baseline, run_suite, save_baseline
+from memory import run_memory
+from scaling import run_scaling
+from workloads import WORKLOADS
+
+
+def test_every_workload_reaches_a_fixpoint_at_small_scale():
+    results = run_suite(scale=0.05, repeat=1)
+    assert set(results) == set(WORKLOADS)
+    for result in results.values():
+        assert result.facts > 0 and result.iterations >= 1 and result.peak_bytes > 0
+    assert results["stage2/implication_chain"].facts == 21
+    assert results["stage4/deep_family_tree"].facts == results["stage4/deep_family_tree_naive"].facts
+
+
+def test_baseline_round_trip_and_regression_check(tmp_path):
+    results = run_suite(["stage2/implication_chain", "stage4/deep_family_tree"], scale=0.05, repeat=1)
+    path = str(tmp_path / "baseline.json")
+    save_baseline(results, path, scale=0.05)
+    baseline = load_baseline(path)
+    assert compare(results, baseline) == []
+
+    slower = dict(results)
+    slower["stage4/deep_family_tree"] = replace(results["stage4/deep_family_tree"], seconds=results["stage4/deep_family_tree"].seconds * 2 + 1)
+    slower["stage2/implication_chain"] = replace(results["stage2/implication_chain"], facts=0)
+    problems = compare(slower, baseline, tolerance=0.25)
+    assert len(problems) == 2 and "output changed" in problems[0]
+
+
+def test_parallel_scaling_matches_serial():
+    points = run_scaling("stage4/wide_family_tree", workers=(1, 2), scale=0.05, repeat=1)
+    assert [point.workers for point in points] == [1, 2]
+    assert all(point.identical and point.seconds > 0 for point in points)
+
+
+def test_memory_report_counts_retained_bytes():
+    results = run_memory(["stage4/many_rules", "stage4/wide_family_tree"], scale=0.02)
+    assert results["stage4/many_rules"].rules == 100
+    assert all(result.retained_bytes > 0 and result.peak_bytes >= result.retained_bytes for result in results.values())
@@ -0,0 +1,124 @@
+﻿from __future__ import annotations
+
+import random
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Tuple
+
+Facts = List[object]
+Rules = List[object]
+
+
+@dataclass
+class Workload:
+    name: str
+    stage: str
+    build: Callable[[float], Tuple[Facts, Rules]]
+    engine: str = "semi_naive"
+    # stage3의 conjunction 규칙은 set 순회 순서(문자열 해시)에 따라 (P AND Q)/(Q AND P)를 만들어
+    # 프로세스마다 사실 수가 달라질 수 있으므로 출력 비교에서 제외함
+    deterministic: bool = True
+
+
+def _size(base: int, scale: float, minimum: int = 2) -> int:
+    return max(minimum, int(base * scale))
+
+
+# --- stage2: 명제 함의만 사용 (IMPLIES P Q) ---
+
+def implication_chain(scale: float) -> Tuple[Facts, Rules]:
+    n = _size(400, scale)
+    rules = [("IMPLIES", f"P{i}", f"P{i + 1}") for i in range(n)]
+    return ["P0"], rules
+
+
+def random_horn(scale: float, seed: int = 7) -> Tuple[Facts, Rules]:
+    rng = random.Random(seed)
+    atoms = _size(300, scale)
+    rules = [("IMPLIES", f"A{rng.randrange(atoms)}", f"A{rng.randrange(atoms)}") for _ in range(3 * atoms)]
+    facts = [f"A{i}" for i in rng.sample(range(atoms), max(1, atoms // 20))]
+    return facts, rules
+
+
+# --- stage3: AND/OR/IMPLIES가 섞인 KB (conjunction 규칙이 제곱으로 커지므로 작게 유지) ---
+
+def mixed_connectives(scale: float, seed: int = 11) -> Tuple[Facts, Rules]:
+    rng = random.Random(seed)
+    n = _size(12, scale, minimum=3)
+    facts: Facts = [f"P{i}" for i in range(0, n, 3)]
+    for i in range(1, n, 3):
+        facts.append(("AND", f"Q{i}", ("NOT", f"R{i}")))
+        facts.append(("OR", f"S{i}", f"P{(i + 1) % n}"))
+    rules: Rules = []
+    for i in range(n):
+        rules.append(("IMPLIES", f"P{i}", f"Q{rng.randrange(n)}"))
+        rules.append(("IMPLIES", f"Q{i}", f"S{(i + 1) % n}"))
+    return facts, rules
+
+
+# --- stage4: 술어 논리 ---
+
+ANCESTOR_RULES: Rules = [
+    ("FORALL", ["?x", "?y"], ("IMPLIES", [("parent", "?x", "?y")], ("ancestor", "?x", "?y"))),
+    (
+        "FORALL",
+        ["?x", "?y", "?z"],
+        ("IMPLIES", [("parent", "?x", "?y"), ("ancestor", "?y", "?z")], ("ancestor", "?x", "?z")),
+    ),
+]
+
+
+def deep_family_tree(scale: float) -> Tuple[Facts, Rules]:
+    depth = _size(120, scale)
+    return [("parent", f"p{i}", f"p{i + 1}") for i in range(depth)], list(ANCESTOR_RULES)
+
+
+def wide_family_tree(scale: float) -> Tuple[Facts, Rules]:
+    # 자식 4명씩, 전체 노드 수가 규모에 비례하도록 깊이를 정함
+    nodes = _size(1500, scale)
+    facts = [("parent", f"n{(i - 1) // 4}", f"n{i}") for i in range(1, nodes)]
+    rules = list(ANCESTOR_RULES) + [
+        ("FORALL", ["?x", "?y", "?z"], ("IMPLIES", [("parent", "?x", "?y"), ("parent", "?x", "?z")], ("sibling", "?y", "?z"))),
+    ]
+    return facts, rules
+
+
+def random_graph(scale: float, seed: int = 3) -> Tuple[Facts, Rules]:
+    rng = random.Random(seed)
+    nodes = _size(150, scale)
+    facts = [("edge", f"v{rng.randrange(nodes)}", f"v{rng.randrange(nodes)}") for _ in range(2 * nodes)]
+    rules = [
+        ("FORALL", ["?x", "?y"], ("IMPLIES", [("edge", "?x", "?y")], ("path", "?x", "?y"))),
+        ("FORALL", ["?x", "?y", "?z"], ("IMPLIES", [("path", "?x", "?y"), ("edge", "?y", "?z")], ("path", "?x", "?z"))),
+        ("FORALL", ["?x", "?y"], ("IMPLIES", [("path", "?x", "?y"), ("path", "?y", "?x")], ("scc", "?x", "?y"))),
+    ]
+    return facts, rules
+
+
+def existential_heavy(scale: float) -> Tuple[Facts, Rules]:
+    people = _size(800, scale)
+    facts: Facts = [("person", f"h{i}") for i in range(people)]
+    facts += [("loves", f"h{i}", f"h{i + 1}") for i in range(0, people, 2)]
+    rules = [
+        ("FORALL", ["?x"], ("IMPLIES", [("person", "?x")], ("EXISTS", ["?y"], ("loves", "?x", "?y")))),
+        ("FORALL", ["?x", "?y"], ("IMPLIES", [("loves", "?x", "?y")], ("EXISTS", ["?z"], ("knows", "?y", "?z")))),
+        ("FORALL", ["?x", "?y"], ("IMPLIES", [("knows", "?x", "?y")], ("acquainted", "?x"))),
+    ]
+    return facts, rules
+
+
+WORKLOADS: Dict[str, Workload] = {
+    workload.name: workload
+    for workload in [
+        Workload("stage2/implication_chain", "stage2", implication_chain),
+        Workload("stage2/random_horn", "stage2", random_horn),
+        Workload("stage3/mixed_connectives", "stage3", mixed_connectives, deterministic=False),
+        Workload("stage4/deep_family_tree", "stage4", deep_family_tree),
+        Workload("stage4/deep_family_tree_naive", "stage4", deep_family_tree, engine="naive"),
+        Workload("stage4/wide_family_tree", "stage4", wide_family_tree),
+        Workload("stage4/random_graph", "stage4", random_graph),
+        Workload("stage4/existential_heavy", "stage4", existential_heavy),
+    ]
+}
+
+
+__all__ = ["Workload", "WORKLOADS"]
@@ -1,4 +1,4 @@
-﻿from typing import List, Set, Tuple, Union
+﻿from typing import Dict, List, Optional, Set, Tuple, Union
 
 Expr = Union[str, Tuple[str, str]]
 Rule = Tuple[str, Expr, Expr]
@@ -31,6 +31,22 @@ def negate(literal):
     # raise NotImplementedError("QUIZ: negate needs implementation")
 
 
+def horn_premises(premise) -> Optional[Tuple[Expr, ...]]:
+    # 전제는 리터럴 하나 또는 ("AND", A, B, ...)의 (중첩된) 연언; 그 밖의 형태는 Horn 절이 아님
+    if is_lit(premise):
+        return (premise,)
+    if isinstance(premise, tuple) and len(premise) >= 2 and premise[0] == "AND":
+        literals: List[Expr] = []
+        for part in premise[1:]:
+            sub = horn_premises(part)
+            if sub is None:
+                return None
+            literals.extend(sub)
+        # 같은 전제가 두 번 나와도 카운터는 한 번만 줄어들므로 중복을 없앰
+        return tuple(dict.fromkeys(literals))
+    return None
+
+
 class KB:
     def __init__(self, facts=None, rules=None):
         self.facts: Set[Expr] = set(facts or [])
@@ -69,23 +85,72 @@ class KB:
         return new_facts
         # raise NotImplementedError("QUIZ: rule_modus_ponens needs implementation")
 
+    def _horn_index(self):
+        # 규칙 i마다 아직 만족되지 않은 전제 수와, 원자(리터럴) -> 그 원자를 전제로 가진 규칙 번호 색인
+        counts: List[int] = []
+        conclusions: List[Expr] = []
+        index: Dict[Expr, List[int]] = {}
+        for rule in self.rules:
+            if not (isinstance(rule, tuple) and len(rule) == 3 and rule[0] == "IMPLIES"):
+                continue
+            premises = horn_premises(rule[1])
+            if not premises:
+                continue
+            rule_id = len(conclusions)
+            conclusions.append(rule[2])
+            counts.append(len(premises))
+            for premise in premises:
+                index.setdefault(premise, []).append(rule_id)
+        return counts, index, conclusions
+
+    def _propagate(self, agenda, add, goal=None, max_steps=None, verbose=False) -> int:
+        # PL-FC-Entails: 사실 하나를 꺼낼 때마다 그 사실을 전제로 가진 규칙의 카운터만 줄임
+        # 각 사실은 새로 추가될 때 한 번만 agenda에 들어가므로 전체 비용은 KB 크기에 선형임
+        # 반환값은 처리한 단계 수 (한 단계 = 직전 단계에서 추가된 사실들); goal을 찾으면 -1
+        counts, index, conclusions = self._horn_index()
+        step = 0
+        while agenda and (max_steps is None or step < max_steps):
+            next_agenda = []
+            for fact in agenda:
+                for rule_id in index.get(fact, ()):
+                    counts[rule_id] -= 1
+                    if counts[rule_id] == 0:
+                        conclusion = conclusions[rule_id]
+                        if add(conclusion):
+                            if verbose:
+                                print(f"Step {step}: Inferred {conclusion}")
+                            if conclusion == goal:
+                                return -1
+                            next_agenda.append(conclusion)
+            agenda = next_agenda
+            step += 1
+        return step
+
     def forward_chain(self, max_steps=1000, verbose=False):
         # === QUIZ: drive forward chaining using inference rules ===
-        for step in range(max_steps):
-            added_any = False
-            
-            # 1. MP 규칙으로 도출 가능한 모든 사실을 가져옴
-            inferred = self.rule_modus_ponens()
-            
-            # 2. 도출된 사실들을 하나씩 KB에 추가 시도
-            for fact in inferred:
-                # self.add_fact가 성공(새로운 사실 추가)하면 True를 반환함
-                if self.add_fact(fact):
-                    added_any = True
-                    if verbose:
-                        print(f"Step {step}: Inferred {fact}")
-            
-            # 3. 이번 턴에 새로 추가된 사실이 하나도 없다면 추론 종료
-            if not added_any:
-                break
-        # raise NotImplementedError("QUIZ: forward_chain needs implementation")
\ No newline at end of file
+        # 매 단계 모든 규칙을 다시 훑는 대신, 카운터가 0이 된 규칙만 발화시키는 agenda 방식
+        # 모순 검사는 그대로 add_fact가 맡음
+        return self._propagate(list(self.facts), self.add_fact, max_steps=max_steps, verbose=verbose)
+
+    def entails(self, query) -> bool:
+        """Whether the Horn rules derive ``query`` from the facts; stops as soon as it is derived.
+
+        The KB itself is not modified. A derivation that contradicts a known
+        literal raises ValueError, as ``add_fact`` does.
+        """
+        known = set(self.facts)
+        if query in known:
+            return True
+
+        def add(fact) -> bool:
+            if not is_lit(fact):
+                return False
+            opp = negate(fact)
+            if opp in known:
+                raise ValueError(f"Contradictory fact: {fact} vs {opp}")
+            if fact in known:
+                return False
+            known.add(fact)
+            return True
+
+        return self._propagate(list(known), add, goal=query) == -1
@@ -1,7 +1,55 @@
+import pytest
+
 from reasoner import KB
 
+HORN_RULES = [
+    ("IMPLIES", ("AND", "A", "B"), "C"),
+    ("IMPLIES", ("AND", "C", ("AND", "D", "A")), "E"),
+    ("IMPLIES", "E", ("NOT", "F")),
+    ("IMPLIES", ("OR", "A", "Z"), "Y"),
+]
+
 
 def test_mp_chain():
     kb = KB(facts={"P"}, rules=[("IMPLIES", "P", "Q"), ("IMPLIES", "Q", "R")])
     kb.forward_chain()
     assert "Q" in kb.facts and "R" in kb.facts
+
+
+def test_entails_true_without_changing_facts():
+    kb = KB(facts={"A", "B"}, rules=HORN_RULES)
+    assert kb.entails("C")
+    assert kb.facts == {"A", "B"}
+
+
+def test_entails_false_for_missing_premise_and_non_horn_rule():
+    kb = KB(facts={"A", "B"}, rules=HORN_RULES)
+    assert not kb.entails("E")
+    # OR 전제는 Horn 규칙이 아니므로 agenda에 들어가지 않음
+    assert not kb.entails("Y")
+
+
+def test_forward_chain_fires_conjunctions_once_all_premises_hold():
+    kb = KB(facts={"A", "B"}, rules=HORN_RULES)
+    kb.add_fact("D")
+    kb.forward_chain()
+    assert {"C", "E", ("NOT", "F")} <= kb.facts and "Y" not in kb.facts
+
+
+def test_contradiction_raises_value_error():
+    kb = KB(facts={"A", "B", "D", "F"}, rules=HORN_RULES)
+    with pytest.raises(ValueError):
+        kb.forward_chain()
+    with pytest.raises(ValueError):
+        kb.entails("G")
+
+
+def test_forward_chain_returns_step_count_and_stops_at_max_steps():
+    rules = [("IMPLIES", ("AND", f"P{i}", "P0"), f"P{i + 1}") for i in range(20000)]
+    # 각 사실을 한 번씩만 처리하므로 긴 연쇄도 단계 수 = 연쇄 길이
+    chain = KB(facts={"P0"}, rules=rules)
+    assert chain.forward_chain(max_steps=None) == 20001 and "P20000" in chain.facts
+
+    capped = KB(facts={"P0"}, rules=rules)
+    assert capped.forward_chain(max_steps=10) == 10
+    assert "P10" in capped.facts and "P11" not in capped.facts
@@ -0,0 +1,240 @@
+﻿from __future__ import annotations
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy는 streamlit/pandas와 함께 설치됨
+    np = None
+
+from compact import SymbolTable
+from reasoner import (
+    KB,
+    CompiledRule,
+    FactStore,
+    Predicate,
+    RelationKey,
+    Rule,
+    is_exists,
+    is_variable,
+    plan_join,
+    relation_key,
+)
+
+# (변수 -> 열, 행 수); 전제가 모두 상수면 열이 없어도 행 수는 남아야 함
+Frame = Tuple[Dict[str, "np.ndarray"], int]
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise ImportError("engine='columnar' requires numpy (pip install numpy)")
+
+
+def _empty(width: int) -> "np.ndarray":
+    return np.empty((0, width), dtype=np.int64)
+
+
+def _composite_keys(*blocks: "np.ndarray") -> List["np.ndarray"]:
+    # 여러 열로 된 키를 블록 간에 일관된 정수 하나로 바꿈 (조인/중복 제거용)
+    width = blocks[0].shape[1]
+    if width == 1:
+        return [block[:, 0] for block in blocks]
+    base = max(int(block.max()) + 1 if len(block) else 1 for block in blocks)
+    if base ** width < 2 ** 62:
+        weights = base ** np.arange(width, dtype=np.int64)
+        return [block @ weights for block in blocks]
+    sizes = [len(block) for block in blocks]
+    _, keys = np.unique(np.concatenate(blocks, axis=0), axis=0, return_inverse=True)
+    return np.split(keys.reshape(-1), np.cumsum(sizes)[:-1])
+
+
+def _hash_join(left: "np.ndarray", right: "np.ndarray") -> Tuple["np.ndarray", "np.ndarray"]:
+    """Index pairs (i, j) with left[i] == right[j] for two 1-D key arrays."""
+    order = np.argsort(right, kind="stable")
+    sorted_right = right[order]
+    lo = np.searchsorted(sorted_right, left, side="left")
+    hi = np.searchsorted(sorted_right, left, side="right")
+    counts = hi - lo
+    total = int(counts.sum())
+    left_idx = np.repeat(np.arange(len(left)), counts)
+    within = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    right_idx = order[np.repeat(lo, counts) + within]
+    return left_idx, right_idx
+
+
+class ColumnarEngine:
+    """Set-at-a-time semi-naive evaluation over integer-encoded columns.
+
+    Every relation is an (n, arity - 1) int64 array split into ``old`` and
+    ``delta`` parts. Flat rules without existential conclusions are evaluated
+    as vectorized joins and deduplicated with array operations; any other rule
+    goes through ``KB._fire`` on the same deltas. New facts are written back
+    through ``KB._derive``, so ``kb.facts`` ends up the same as with the
+    semi-naive engine.
+    """
+
+    def __init__(self, kb: KB) -> None:
+        _require_numpy()
+        self.kb = kb
+        self.symbols = SymbolTable()
+        self.old: Dict[RelationKey, "np.ndarray"] = {}
+        self.delta: Dict[RelationKey, "np.ndarray"] = {}
+
+    def run(self, max_iterations: int) -> None:
+        kb = self.kb
+        self.delta = self._encode_facts(kb.facts)
+        vectorized = [rule for rule in kb.rules if self._vectorizable(rule)]
+        generic = [rule for rule in kb.rules if not self._vectorizable(rule)]
+        delta_facts: Optional[FactStore] = None
+        for iteration in range(max_iterations):
+            produced: Dict[RelationKey, List["np.ndarray"]] = {}
+            for rule in vectorized:
+                key = relation_key(rule.conclusion)
+                produced.setdefault(key, []).extend(self._evaluate(rule))
+            new_rows: Dict[RelationKey, "np.ndarray"] = {}
+            new_facts: List[Predicate] = []
+            symbol = self.symbols.symbol
+            for key, blocks in produced.items():
+                rows = self._deduplicate(key, blocks)
+                kept = []
+                for i, row in enumerate(rows.tolist()):
+                    fact = (key[0],) + tuple(symbol(symbol_id) for symbol_id in row)
+                    if kb._derive(fact):
+                        kept.append(i)
+                        new_facts.append(fact)
+                if kept:
+                    new_rows[key] = rows[kept]
+            generic_facts = []
+            for rule in generic:
+                if not rule.premises:
+                    conclusions = kb._fire(rule, ()) if iteration == 0 else ()
+                elif delta_facts is None:
+                    conclusions = kb._fire(rule, plan_join(rule.premises, kb.facts).order)
+                else:
+                    conclusions = kb._delta_conclusions(rule, delta_facts)
+                for fact in conclusions:
+                    if kb._derive(fact):
+                        generic_facts.append(fact)
+            for key, rows in self._encode_facts(generic_facts).items():
+                new_rows[key] = np.concatenate([new_rows[key], rows]) if key in new_rows else rows
+            new_facts.extend(generic_facts)
+
+            for key, rows in self.delta.items():
+                self.old[key] = np.concatenate([self._old(key), rows]) if len(rows) else self._old(key)
+            if not new_facts:
+                kb._reached_fixpoint()
+                break
+            self.delta = new_rows
+            # 일반 해석으로 처리하는 규칙이 있을 때만 튜플 형태의 delta를 만듦
+            delta_facts = FactStore(new_facts) if generic else None
+
+    def _vectorizable(self, rule: Rule) -> bool:
+        if is_exists(rule.conclusion) or not CompiledRule.supports(rule):
+            return False
+        return all(len(pattern) > 1 for pattern in tuple(rule.premises) + (rule.conclusion,))
+
+    def _encode_facts(self, facts) -> Dict[RelationKey, "np.ndarray"]:
+        rows: Dict[RelationKey, List[Tuple[int, ...]]] = {}
+        for fact in facts:
+            key = relation_key(fact)
+            if key is not None:
+                rows.setdefault(key, []).append(tuple(self.symbols.intern(arg) for arg in fact[1:]))
+        return {
+            key: np.array(values, dtype=np.int64).reshape(len(values), key[1] - 1)
+            for key, values in rows.items()
+        }
+
+    def _old(self, key: RelationKey) -> "np.ndarray":
+        return self.old.get(key, _empty(key[1] - 1))
+
+    def _full(self, key: RelationKey) -> "np.ndarray":
+        old, delta = self._old(key), self.delta.get(key)
+        return old if delta is None or not len(delta) else np.concatenate([old, delta])
+
+    def _evaluate(self, rule: Rule) -> List["np.ndarray"]:
+        premises = rule.premises
+        blocks = []
+        for delta_idx, premise in enumerate(premises):
+            delta = self.delta.get(relation_key(premise))
+            if delta is None or not len(delta):
+                continue
+            plan = plan_join(premises, self.kb.facts, delta_idx=delta_idx)
+            frame: Optional[Frame] = None
+            for idx in plan.order:
+                key = relation_key(premises[idx])
+                if idx == delta_idx:
+                    source = delta
+                elif idx < delta_idx:
+                    source = self._old(key)
+                else:
+                    source = self._full(key)
+                frame = self._join(frame, premises[idx], source)
+                if frame is None:
+                    break
+            if frame is not None:
+                blocks.append(self._project(rule.conclusion, frame))
+        return blocks
+
+    def _join(self, frame: Optional[Frame], premise: Predicate, rows: "np.ndarray") -> Optional[Frame]:
+        # 상수와 같은 전제 안의 반복 변수로 먼저 거른 뒤, 공유 변수로 해시 조인함
+        mask = np.ones(len(rows), dtype=bool)
+        first: Dict[str, int] = {}
+        for col, arg in enumerate(premise[1:]):
+            if is_variable(arg):
+                if arg in first:
+                    mask &= rows[:, col] == rows[:, first[arg]]
+                else:
+                    first[arg] = col
+            else:
+                symbol_id = self.symbols.lookup(arg)
+                if symbol_id is None:
+                    return None
+                mask &= rows[:, col] == symbol_id
+        rows = rows[mask]
+        if not len(rows):
+            return None
+        if frame is None:
+            return {var: rows[:, col] for var, col in first.items()}, len(rows)
+
+        columns, size = frame
+        shared = [var for var in first if var in columns]
+        fresh = [var for var in first if var not in columns]
+        if shared:
+            left_keys, right_keys = _composite_keys(
+                np.stack([columns[var] for var in shared], axis=1),
+                rows[:, [first[var] for var in shared]],
+            )
+            left_idx, right_idx = _hash_join(left_keys, right_keys)
+        else:
+            left_idx = np.repeat(np.arange(size), len(rows))
+            right_idx = np.tile(np.arange(len(rows)), size)
+        if not len(left_idx):
+            return None
+        joined = {var: column[left_idx] for var, column in columns.items()}
+        for var in fresh:
+            joined[var] = rows[right_idx, first[var]]
+        return joined, len(left_idx)
+
+    def _project(self, conclusion: Predicate, frame: Frame) -> "np.ndarray":
+        bound, size = frame
+        columns = []
+        for arg in conclusion[1:]:
+            if is_variable(arg):
+                columns.append(bound[arg])
+            else:
+                columns.append(np.full(size, self.symbols.intern(arg), dtype=np.int64))
+        return np.stack(columns, axis=1)
+
+    def _deduplicate(self, key: RelationKey, blocks: Sequence["np.ndarray"]) -> "np.ndarray":
+        candidates = np.concatenate(blocks) if blocks else _empty(key[1] - 1)
+        if not len(candidates):
+            return candidates
+        candidates = np.unique(candidates, axis=0)
+        existing = self._full(key)
+        if not len(existing):
+            return candidates
+        new_keys, existing_keys = _composite_keys(candidates, existing)
+        return candidates[~np.isin(new_keys, existing_keys)]
+
+
+__all__ = ["ColumnarEngine"]
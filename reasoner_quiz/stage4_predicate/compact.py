@@ -0,0 +1,349 @@
+﻿from __future__ import annotations
+
+import tracemalloc
+from array import array
+from collections.abc import MutableSet
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from reasoner import (
+    FactStore,
+    Predicate,
+    RelationKey,
+    Term,
+    is_ground_term,
+    is_variable,
+    relation_key,
+)
+
+EncodedFact = Tuple[int, ...]
+
+
+class SymbolTable:
+    """Interns predicate names and constants to non-negative ints.
+
+    Variables get negative ids, so ``is_variable_id`` is a sign test instead of
+    ``str.startswith("?")``.
+    """
+
+    def __init__(self) -> None:
+        self._ids: Dict[Term, int] = {}
+        self._symbols: List[Term] = []
+        self._variables: Dict[str, int] = {}
+        self._variable_names: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._symbols)
+
+    def intern(self, term: Term) -> int:
+        if isinstance(term, str) and is_variable(term):
+            var_id = self._variables.get(term)
+            if var_id is None:
+                self._variable_names.append(term)
+                var_id = self._variables[term] = -len(self._variable_names)
+            return var_id
+        symbol_id = self._ids.get(term)
+        if symbol_id is None:
+            symbol_id = self._ids[term] = len(self._symbols)
+            self._symbols.append(term)
+        return symbol_id
+
+    def lookup(self, term: Term) -> Optional[int]:
+        # intern과 달리 처음 보는 상수에 새 번호를 매기지 않음 (질의용)
+        if isinstance(term, str) and is_variable(term):
+            return self._variables.get(term)
+        return self._ids.get(term)
+
+    def symbol(self, symbol_id: int) -> Term:
+        if symbol_id < 0:
+            return self._variable_names[-symbol_id - 1]
+        return self._symbols[symbol_id]
+
+    def symbols(self) -> List[Term]:
+        return list(self._symbols)
+
+    @staticmethod
+    def is_variable_id(symbol_id: int) -> bool:
+        return symbol_id < 0
+
+    def encode(self, fact: Predicate) -> EncodedFact:
+        return tuple(self.intern(term) for term in fact)
+
+    def decode(self, encoded: Iterable[int]) -> Predicate:
+        return tuple(self.symbol(symbol_id) for symbol_id in encoded)
+
+
+class CompactRelation:
+    """One (predicate, arity) relation stored as int columns.
+
+    Rows are only appended; a removed row is marked dead and revived in place
+    if the same fact comes back, so row numbers held by a running scan stay valid.
+    Duplicate detection uses an open-addressing table of row numbers instead of
+    a dict of Python ints, which keeps the per-row cost to a few array slots.
+    """
+
+    __slots__ = ("key", "name_id", "columns", "slots", "alive", "live", "index")
+
+    def __init__(self, key: RelationKey, name_id: int) -> None:
+        self.key = key
+        self.name_id = name_id
+        self.columns = [array("i") for _ in range(key[1] - 1)]
+        self.slots = array("i", bytes(4 * 8))
+        self.alive = bytearray()
+        self.live = 0
+        self.index: List[Dict[int, array]] = [{} for _ in self.columns]
+
+    def __len__(self) -> int:
+        return self.live
+
+    def _probe(self, args: EncodedFact) -> Tuple[int, int]:
+        # (슬롯 위치, 행 번호) 반환; 행이 없으면 행 번호는 -1이고 슬롯은 비어 있는 자리
+        slots = self.slots
+        mask = len(slots) - 1
+        pos = hash(args) & mask
+        columns = self.columns
+        while True:
+            entry = slots[pos]
+            if entry == 0:
+                return pos, -1
+            row = entry - 1
+            if all(column[row] == symbol_id for column, symbol_id in zip(columns, args)):
+                return pos, row
+            pos = (pos + 1) & mask
+
+    def _grow(self) -> None:
+        old_rows = len(self.alive)
+        self.slots = array("i", bytes(4 * len(self.slots) * 2))
+        mask = len(self.slots) - 1
+        for row in range(old_rows):
+            pos = hash(self.row(row)) & mask
+            while self.slots[pos]:
+                pos = (pos + 1) & mask
+            self.slots[pos] = row + 1
+
+    def find(self, args: EncodedFact) -> Optional[int]:
+        _, row = self._probe(args)
+        if row < 0 or not self.alive[row]:
+            return None
+        return row
+
+    def add(self, args: EncodedFact) -> bool:
+        pos, row = self._probe(args)
+        if row >= 0:
+            if self.alive[row]:
+                return False
+            self.alive[row] = 1
+            self.live += 1
+            return True
+        row = len(self.alive)
+        self.slots[pos] = row + 1
+        for column, index, symbol_id in zip(self.columns, self.index, args):
+            column.append(symbol_id)
+            rows = index.get(symbol_id)
+            if rows is None:
+                rows = index[symbol_id] = array("i")
+            rows.append(row)
+        self.alive.append(1)
+        self.live += 1
+        if 2 * len(self.alive) > len(self.slots):
+            self._grow()
+        return True
+
+    def discard(self, args: EncodedFact) -> bool:
+        row = self.find(args)
+        if row is None:
+            return False
+        self.alive[row] = 0
+        self.live -= 1
+        return True
+
+    def row(self, row: int) -> EncodedFact:
+        return tuple(column[row] for column in self.columns)
+
+    def scan(self, bound: Dict[int, int]) -> Iterator[int]:
+        """Live row numbers whose columns equal ``bound`` ({column: symbol id})."""
+        smallest = None
+        for column, symbol_id in bound.items():
+            candidates = self.index[column].get(symbol_id)
+            if candidates is None:
+                return
+            if smallest is None or len(candidates) < len(smallest):
+                smallest = candidates
+        # 스캔 시작 시점의 길이까지만 읽으므로 도중에 추가된 행은 보지 않음
+        if smallest is None:
+            rows: Iterable[int] = range(len(self.alive))
+        else:
+            rows = (smallest[i] for i in range(len(smallest)))
+        for row in rows:
+            if not self.alive[row]:
+                continue
+            if all(self.columns[column][row] == symbol_id for column, symbol_id in bound.items()):
+                yield row
+
+
+class CompactFactStore(MutableSet):
+    """Drop-in replacement for FactStore backed by interned int columns.
+
+    Facts go in and come out as the usual tuples; inside, every relation is a
+    CompactRelation, and pattern constants are compared as ints before any row
+    is decoded back to a tuple.
+    """
+
+    def __init__(self, facts: Optional[Iterable[Predicate]] = None, symbols: Optional[SymbolTable] = None) -> None:
+        self.symbols = symbols if symbols is not None else SymbolTable()
+        self._relations: Dict[RelationKey, CompactRelation] = {}
+        self._unkeyed: FactStore = FactStore()
+        if facts:
+            for fact in facts:
+                self.add(fact)
+
+    def __contains__(self, fact: object) -> bool:
+        key = relation_key(fact)
+        if key is None:
+            return fact in self._unkeyed
+        relation = self._relations.get(key)
+        if relation is None:
+            return False
+        args = self._lookup_args(fact)
+        return args is not None and relation.find(args) is not None
+
+    def __iter__(self) -> Iterator[Predicate]:
+        for key in list(self._relations):
+            yield from self.relation(key)
+        yield from self._unkeyed
+
+    def __len__(self) -> int:
+        return sum(len(relation) for relation in self._relations.values()) + len(self._unkeyed)
+
+    def __repr__(self) -> str:
+        return f"CompactFactStore({set(self)!r})"
+
+    def add(self, fact: Predicate) -> bool:
+        key = relation_key(fact)
+        if key is None:
+            return self._unkeyed.add(fact)
+        relation = self._relations.get(key)
+        if relation is None:
+            relation = self._relations[key] = CompactRelation(key, self.symbols.intern(key[0]))
+        return relation.add(tuple(self.symbols.intern(arg) for arg in fact[1:]))
+
+    def discard(self, fact: Predicate) -> bool:
+        key = relation_key(fact)
+        if key is None:
+            return self._unkeyed.discard(fact)
+        relation = self._relations.get(key)
+        args = self._lookup_args(fact)
+        if relation is None or args is None:
+            return False
+        return relation.discard(args)
+
+    def relation(self, key: RelationKey) -> Iterator[Predicate]:
+        relation = self._relations.get(key)
+        if relation is None:
+            return iter(())
+        return (self._decode(relation, row) for row in relation.scan({}))
+
+    def relations(self) -> List[RelationKey]:
+        return list(self._relations)
+
+    def cardinality(self, key: Optional[RelationKey]) -> int:
+        if key is None:
+            return len(self)
+        relation = self._relations.get(key)
+        return len(relation.alive) if relation is not None else 0
+
+    def selectivity(self, key: RelationKey, pos: int, arg: Optional[Term] = None) -> int:
+        relation = self._relations.get(key)
+        if relation is None:
+            return 0
+        index = relation.index[pos - 1]
+        if arg is None:
+            return len(index)
+        symbol_id = self.symbols.lookup(arg)
+        return len(index.get(symbol_id, ())) if symbol_id is not None else 0
+
+    def candidates(self, pattern: Term) -> Iterator[Predicate]:
+        key = relation_key(pattern)
+        if key is None:
+            return iter(list(self))
+        relation = self._relations.get(key)
+        if relation is None:
+            return iter(())
+        bound: Dict[int, int] = {}
+        for pos in range(1, len(pattern)):
+            arg = pattern[pos]
+            if not is_ground_term(arg):
+                continue
+            symbol_id = self.symbols.lookup(arg)
+            if symbol_id is None:
+                return iter(())
+            bound[pos - 1] = symbol_id
+        return (self._decode(relation, row) for row in relation.scan(bound))
+
+    def encoded(self, key: RelationKey) -> Iterator[EncodedFact]:
+        relation = self._relations.get(key)
+        if relation is None:
+            return iter(())
+        return (relation.row(row) for row in relation.scan({}))
+
+    def _lookup_args(self, fact: Predicate) -> Optional[EncodedFact]:
+        args = []
+        for arg in fact[1:]:
+            symbol_id = self.symbols.lookup(arg)
+            if symbol_id is None:
+                return None
+            args.append(symbol_id)
+        return tuple(args)
+
+    def _decode(self, relation: CompactRelation, row: int) -> Predicate:
+        symbol = self.symbols.symbol
+        return (relation.key[0],) + tuple(symbol(column[row]) for column in relation.columns)
+
+
+@dataclass
+class MemoryReport:
+    facts: int
+    tuple_bytes: int
+    compact_bytes: int
+
+    @property
+    def tuple_bytes_per_fact(self) -> float:
+        return self.tuple_bytes / max(1, self.facts)
+
+    @property
+    def compact_bytes_per_fact(self) -> float:
+        return self.compact_bytes / max(1, self.facts)
+
+    def __str__(self) -> str:
+        saving = 1 - self.compact_bytes / max(1, self.tuple_bytes)
+        return (
+            f"{self.facts} facts: tuple store {self.tuple_bytes_per_fact:.1f} B/fact, "
+            f"compact store {self.compact_bytes_per_fact:.1f} B/fact ({saving:.0%} smaller)"
+        )
+
+
+def memory_report(facts: Iterable[Predicate]) -> MemoryReport:
+    """Measure bytes per fact for FactStore versus CompactFactStore with tracemalloc.
+
+    Both stores are built from fresh copies of the fact tuples so that each one
+    pays for its own representation; the constant strings are shared by both.
+    """
+    facts = list(facts)
+
+    def measure(build) -> int:
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            store = build()
+            after = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        del store
+        return after - before
+
+    tuple_bytes = measure(lambda: FactStore(tuple(list(fact)) for fact in facts))
+    compact_bytes = measure(lambda: CompactFactStore(tuple(list(fact)) for fact in facts))
+    return MemoryReport(facts=len(facts), tuple_bytes=tuple_bytes, compact_bytes=compact_bytes)
+
+
+__all__ = ["SymbolTable", "CompactRelation", "CompactFactStore", "MemoryReport", "memory_report"]
@@ -0,0 +1,127 @@
+﻿from __future__ import annotations
+
+import os
+import re
+import sys
+import time
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, List, Optional, Union
+
+from reasoner import KB, FactStore, Predicate
+
+_FACT_LINE = re.compile(r"(\w+)\((.*)\)")
+
+Source = Union[str, "os.PathLike[str]", Iterable[Union[Predicate, str]]]
+
+
+class IngestError(ValueError):
+    """Raised when a line of a fact file cannot be parsed."""
+
+
+def parse_fact_line(line: str) -> Optional[Predicate]:
+    # 파서는 이것 하나 (stage6 app.parse_fact도 이걸 씀): parent(alice,bob); 빈 줄과 # 주석은 None
+    line = line.strip().lower()
+    if not line or line.startswith("#"):
+        return None
+    match = _FACT_LINE.fullmatch(line)
+    if not match:
+        raise IngestError(f"Invalid fact format: {line}")
+    name, args = match.groups()
+    return (name, *(arg.strip() for arg in args.split(",")))
+
+
+def iter_facts(source: Source) -> Iterator[Predicate]:
+    """Facts from tuples, fact-syntax strings, or a file path, read one at a time."""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, encoding="utf-8") as f:
+            yield from iter_facts(f)
+        return
+    for item in source:
+        if isinstance(item, str):
+            item = parse_fact_line(item)
+            if item is None:
+                continue
+        yield item
+
+
+@dataclass
+class IngestReport:
+    read: int = 0
+    added: int = 0
+    derived: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+
+    @property
+    def duplicates(self) -> int:
+        return self.read - self.added
+
+    @property
+    def facts_per_second(self) -> float:
+        return self.read / self.seconds if self.seconds else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.read} facts in {self.batches} batches ({self.duplicates} duplicates), "
+            f"{self.derived} derived, {self.facts_per_second:,.0f} facts/s"
+        )
+
+
+def ingest(
+    kb: KB,
+    source: Source,
+    batch_size: int = 10000,
+    chain: bool = True,
+    max_iterations: Optional[int] = None,
+    on_batch: Optional[Callable[[IngestReport], None]] = None,
+) -> IngestReport:
+    """Stream facts into ``kb`` in batches, chaining incrementally after each one.
+
+    At most ``batch_size`` facts are buffered at a time. Each batch is
+    deduplicated against itself, asserted (and logged) fact by fact, and then
+    propagated semi-naively with the batch as the delta, so the KB is closed
+    under its rules after every batch. The first batch runs a full
+    ``forward_chain`` to also close whatever the KB held before. Each batch
+    chains to a fixpoint unless ``max_iterations`` caps it.
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be positive")
+    report = IngestReport()
+    started = time.perf_counter()
+    pending: List[Predicate] = []
+    # 배치마다 고정점까지 닫아야 하므로 기본 상한을 두지 않음 (delta 실행에는 폐포 지름길이 없어 반복이 길어짐)
+    cap = sys.maxsize if max_iterations is None else max_iterations
+
+    def flush() -> None:
+        before = len(kb.facts)
+        # 이미 유도된 사실도 단언으로 기록해야 지지가 철회돼도 남고 WAL 재생에도 들어감
+        fresh = [fact for fact in dict.fromkeys(pending) if kb.add_fact(fact)]
+        report.read += len(pending)
+        report.added += len(fresh)
+        if chain and (fresh or report.batches == 0):
+            if report.batches == 0:
+                kb.forward_chain(cap)
+            else:
+                kb._log_chain(max_iterations)
+                kb._forward_chain_semi_naive(cap, delta=FactStore(fresh))
+                kb._publish()
+        report.derived += len(kb.facts) - before - len(fresh)
+        report.batches += 1
+        report.seconds = time.perf_counter() - started
+        pending.clear()
+        if on_batch is not None:
+            on_batch(report)
+
+    for fact in iter_facts(source):
+        pending.append(fact)
+        if len(pending) >= batch_size:
+            flush()
+    if pending or report.batches == 0:
+        flush()
+    if chain:
+        kb._reached_fixpoint()
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+__all__ = ["IngestError", "IngestReport", "ingest", "iter_facts", "parse_fact_line"]
@@ -0,0 +1,257 @@
+﻿from __future__ import annotations
+
+import multiprocessing
+import os
+from array import array
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Optional, Tuple
+
+from compact import EncodedFact, SymbolTable
+from reasoner import (
+    KB,
+    CompiledRule,
+    FactStore,
+    Predicate,
+    RelationKey,
+    Rule,
+    Term,
+    is_exists,
+    is_variable,
+    plan_join,
+    relation_key,
+    term_variables,
+)
+
+# (관계 키, 시작 바이트, 행 수) 목록; 공유 메모리 블록 안의 int32 행들을 가리킴
+Manifest = List[Tuple[RelationKey, int, int]]
+
+
+def supports_parallel(kb: KB) -> bool:
+    """Flat, non-existential rules over keyed facts; anything else runs serially.
+
+    Existential rules are excluded because which Skolem witnesses get minted
+    depends on firing order, and the result must match the serial engine.
+    """
+    for rule in kb.rules:
+        if is_exists(rule.conclusion) or (rule.premises and not CompiledRule.supports(rule)):
+            return False
+    return all(relation_key(fact) is not None for fact in kb.facts)
+
+
+def join_key_positions(rule: Rule, premise_idx: int) -> Tuple[int, ...]:
+    # 다른 전제와 공유하는 변수 자리(조인 키); 없으면 모든 인자로 분할함
+    premise = rule.premises[premise_idx]
+    others = set()
+    for idx, other in enumerate(rule.premises):
+        if idx != premise_idx:
+            others |= term_variables(other)
+    positions = tuple(pos for pos in range(1, len(premise)) if is_variable(premise[pos]) and premise[pos] in others)
+    return positions or tuple(range(1, len(premise)))
+
+
+def write_block(rows: Dict[RelationKey, List[EncodedFact]]) -> Tuple[Optional[SharedMemory], Manifest]:
+    """Pack encoded rows into one shared-memory block of int32 values."""
+    manifest: Manifest = []
+    data = array("i")
+    for key, encoded in rows.items():
+        if not encoded:
+            continue
+        manifest.append((key, len(data) * data.itemsize, len(encoded)))
+        for row in encoded:
+            data.extend(row)
+    if not manifest:
+        return None, manifest
+    block = SharedMemory(create=True, size=len(data) * data.itemsize)
+    block.buf[: len(data) * data.itemsize] = data.tobytes()
+    return block, manifest
+
+
+def read_block(name: str, manifest: Manifest) -> Dict[RelationKey, List[EncodedFact]]:
+    block = SharedMemory(name=name)
+    try:
+        rows: Dict[RelationKey, List[EncodedFact]] = {}
+        for key, offset, count in manifest:
+            width = key[1] - 1
+            values = array("i")
+            values.frombytes(bytes(block.buf[offset : offset + 4 * width * count]))
+            rows[key] = [tuple(values[i : i + width]) for i in range(0, len(values), width)]
+        return rows
+    finally:
+        block.close()
+
+
+class _PartitionDelta:
+    """Delta for one premise position: candidates from this worker's partition,
+    but the "was it in the delta?" test still sees the whole delta."""
+
+    def __init__(self, part: FactStore, full: FactStore) -> None:
+        self.part = part
+        self.full = full
+
+    def __contains__(self, fact: object) -> bool:
+        return fact in self.full
+
+    def __len__(self) -> int:
+        return len(self.part)
+
+    def candidates(self, pattern: Term):
+        return self.part.candidates(pattern)
+
+    def cardinality(self, key: Optional[RelationKey]) -> int:
+        return self.part.cardinality(key)
+
+    def selectivity(self, key: RelationKey, pos: int, arg: Optional[Term] = None) -> int:
+        return self.part.selectivity(key, pos, arg)
+
+
+def _worker(worker_id: int, workers: int, rules: List[Rule], symbols: List[Term], compile_rules: bool, conn) -> None:
+    # 각 워커는 전체 사실의 복제본을 갖고, 매 반복 delta 중 자기 해시 구간만 조인함
+    kb = KB(compile_rules=compile_rules, query_cache_size=0)
+    kb.rules = list(rules)
+    ids = {symbol: symbol_id for symbol_id, symbol in enumerate(symbols)}
+    partitions = {
+        (rule_idx, premise_idx): join_key_positions(rule, premise_idx)
+        for rule_idx, rule in enumerate(rules)
+        for premise_idx in range(len(rule.premises))
+    }
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        name, manifest = message
+        rows = read_block(name, manifest)
+        full = FactStore()
+        decoded: Dict[RelationKey, List[Tuple[EncodedFact, Predicate]]] = {}
+        for key, encoded in rows.items():
+            pairs = decoded[key] = [(row, (key[0],) + tuple(symbols[i] for i in row)) for row in encoded]
+            for _, fact in pairs:
+                kb.facts.add(fact)
+                full.add(fact)
+
+        derived: Dict[RelationKey, List[EncodedFact]] = {}
+        seen = set()
+        for rule_idx, rule in enumerate(rules):
+            for premise_idx, premise in enumerate(rule.premises):
+                positions = partitions[(rule_idx, premise_idx)]
+                part = FactStore(
+                    fact
+                    for row, fact in decoded.get(relation_key(premise), ())
+                    if hash(tuple(row[pos - 1] for pos in positions)) % workers == worker_id
+                )
+                if not part:
+                    continue
+                delta = _PartitionDelta(part, full)
+                order = plan_join(rule.premises, kb.facts, delta, premise_idx).order
+                for fact in kb._fire(rule, order, delta, premise_idx):
+                    if fact in kb.facts or fact in seen:
+                        continue
+                    seen.add(fact)
+                    derived.setdefault(relation_key(fact), []).append(tuple(ids[arg] for arg in fact[1:]))
+        block, out_manifest = write_block(derived)
+        conn.send((block.name if block is not None else None, out_manifest))
+        if block is not None:
+            # 코디네이터가 읽은 뒤 unlink하므로 여기서는 매핑만 닫음
+            block.close()
+    conn.close()
+
+
+class ParallelEngine:
+    """Semi-naive evaluation with the delta hash-partitioned across worker processes.
+
+    Each iteration the coordinator writes the delta as int32 rows into one
+    shared-memory block. Every worker adds the whole delta to its replica of
+    the KB, then evaluates every rule with the delta premise restricted to
+    the rows whose join-key hash falls in its partition. Workers return their
+    conclusions the same way; the coordinator deduplicates them through
+    ``KB._derive`` and they become the next delta. Because the partitions
+    cover the delta exactly, the fixpoint is the same as the serial one.
+    """
+
+    def __init__(self, kb: KB, workers: Optional[int] = None) -> None:
+        self.kb = kb
+        self.workers = workers or os.cpu_count() or 1
+        self.iterations = 0
+
+    def run(self, max_iterations: int) -> None:
+        kb = self.kb
+        if not supports_parallel(kb):
+            kb._forward_chain_semi_naive(max_iterations)
+            return
+        for rule in kb.rules:
+            if not rule.premises:
+                for fact in kb._fire(rule, ()):
+                    kb._derive(fact)
+
+        symbols = SymbolTable()
+        for rule in kb.rules:
+            for pattern in tuple(rule.premises) + (rule.conclusion,):
+                for arg in pattern[1:]:
+                    if not is_variable(arg):
+                        symbols.intern(arg)
+        delta = list(kb.facts)
+        for fact in delta:
+            for arg in fact[1:]:
+                symbols.intern(arg)
+        table = symbols.symbols()
+
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+        if hasattr(resource_tracker, "ensure_running"):
+            # 워커마다 따로 tracker를 띄우면 서로 unlink한 블록을 누수로 보고하므로 하나를 공유시킴
+            resource_tracker.ensure_running()
+        connections = []
+        processes = []
+        for worker_id in range(self.workers):
+            parent, child = context.Pipe()
+            process = context.Process(
+                target=_worker,
+                args=(worker_id, self.workers, list(kb.rules), table, kb.compile_rules, child),
+                daemon=True,
+            )
+            process.start()
+            child.close()
+            connections.append(parent)
+            processes.append(process)
+        try:
+            for iteration in range(max_iterations):
+                if not delta:
+                    kb._reached_fixpoint()
+                    break
+                self.iterations = iteration + 1
+                rows: Dict[RelationKey, List[EncodedFact]] = {}
+                for fact in delta:
+                    rows.setdefault(relation_key(fact), []).append(tuple(symbols.lookup(arg) for arg in fact[1:]))
+                block, manifest = write_block(rows)
+                try:
+                    for conn in connections:
+                        conn.send((block.name, manifest))
+                    replies = [conn.recv() for conn in connections]
+                finally:
+                    block.close()
+                    block.unlink()
+                delta = []
+                for name, out_manifest in replies:
+                    if name is None:
+                        continue
+                    block = SharedMemory(name=name)
+                    try:
+                        out_rows = read_block(name, out_manifest)
+                    finally:
+                        block.close()
+                        block.unlink()
+                    for key, encoded in out_rows.items():
+                        for row in encoded:
+                            fact = (key[0],) + tuple(table[i] for i in row)
+                            if kb._derive(fact):
+                                delta.append(fact)
+                kb._publish()
+        finally:
+            for conn in connections:
+                conn.send(None)
+                conn.close()
+            for process in processes:
+                process.join()
+
+
+__all__ = ["ParallelEngine", "supports_parallel", "join_key_positions"]
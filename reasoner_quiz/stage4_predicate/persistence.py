@@ -0,0 +1,343 @@
+﻿from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import Dict, Iterator, List, Optional, TextIO
+
+from compact import SymbolTable
+from reasoner import (
+    KB,
+    FactStore,
+    Predicate,
+    RelationKey,
+    Rule,
+    SkolemTable,
+    Term,
+    _json_term,
+    _skolem_key,
+    _term_from_json,
+    relation_key,
+)
+
+MAGIC = b"KBSNAP1\n"
+_HEADER = struct.Struct("<Q")
+
+
+def _rule_to_json(rule: Rule) -> dict:
+    return {
+        "variables": list(rule.variables),
+        "premises": [_json_term(premise) for premise in rule.premises],
+        "conclusion": _json_term(rule.conclusion),
+    }
+
+
+def _rule_from_json(data: dict) -> Rule:
+    return Rule(
+        variables=tuple(data["variables"]),
+        premises=tuple(_term_from_json(premise) for premise in data["premises"]),
+        conclusion=_term_from_json(data["conclusion"]),
+    )
+
+
+def wal_path(path: str) -> str:
+    return path + ".wal"
+
+
+class WriteAheadLog:
+    """Append-only JSON-lines log of KB mutations made since the last snapshot.
+
+    Each line is one ``add_fact``, ``add_rule`` or ``retract_fact`` call, or
+    a chaining run (its iteration cap and magic goal); ``KB.load`` replays
+    them in order on top of the snapshot.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file: Optional[TextIO] = open(path, "a", encoding="utf-8")
+
+    def fact(self, fact: Predicate) -> None:
+        self._record("fact", _json_term(fact))
+
+    def rule(self, rule: Rule) -> None:
+        self._record("rule", _rule_to_json(rule))
+
+    def retract(self, fact: Predicate) -> None:
+        self._record("retract", _json_term(fact))
+
+    def chain(self, max_iterations: Optional[int], goal: Optional[Predicate] = None) -> None:
+        # 유도된 사실은 기록하지 않고 실행만 남김; 재생할 때 같은 상한으로 다시 추론함
+        self._record("chain", [max_iterations, None if goal is None else _json_term(goal)])
+
+    def _record(self, op: str, payload) -> None:
+        self._file.write(json.dumps([op, payload]) + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def read_log(path: str) -> Iterator[list]:
+    if not os.path.exists(path):
+        return
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            # 쓰다가 중단된 마지막 줄은 무시함
+            if line.endswith("\n"):
+                yield json.loads(line)
+
+
+class SnapshotFactStore(FactStore):
+    """FactStore whose relations stay in the memory-mapped snapshot until used.
+
+    A relation is decoded into the usual buckets the first time it is looked
+    up, added to, or iterated. Cardinalities and per-column distinct counts
+    come from the section table, so planning a join does not load anything.
+    """
+
+    def __init__(self, snapshot: "Snapshot") -> None:
+        super().__init__()
+        self._snapshot = snapshot
+        self._pending: Dict[RelationKey, dict] = {
+            (section["name"], section["arity"]): section for section in snapshot.sections
+        }
+
+    def __contains__(self, fact: object) -> bool:
+        self._load(relation_key(fact))
+        return super().__contains__(fact)
+
+    def __iter__(self) -> Iterator[Predicate]:
+        self._load_all()
+        return super().__iter__()
+
+    def __len__(self) -> int:
+        return super().__len__() + sum(section["count"] for section in self._pending.values())
+
+    def add(self, fact: Predicate) -> bool:
+        self._load(relation_key(fact))
+        return super().add(fact)
+
+    def discard(self, fact: Predicate) -> bool:
+        self._load(relation_key(fact))
+        return super().discard(fact)
+
+    def relation(self, key: RelationKey) -> Iterator[Predicate]:
+        self._load(key)
+        return super().relation(key)
+
+    def relations(self) -> List[RelationKey]:
+        return super().relations() + [key for key in self._pending if key not in self._relations]
+
+    def cardinality(self, key: Optional[RelationKey]) -> int:
+        if key in self._pending:
+            return self._pending[key]["count"]
+        return super().cardinality(key)
+
+    def selectivity(self, key: RelationKey, pos: int, arg: Optional[Term] = None) -> int:
+        if key in self._pending and arg is None:
+            return self._pending[key]["distinct"][pos - 1]
+        self._load(key)
+        return super().selectivity(key, pos, arg)
+
+    def candidates(self, pattern: Term) -> Iterator[Predicate]:
+        key = relation_key(pattern)
+        if key is None:
+            self._load_all()
+        else:
+            self._load(key)
+        return super().candidates(pattern)
+
+    @property
+    def loaded(self) -> List[RelationKey]:
+        return [key for key in super().relations() if key not in self._pending]
+
+    def _load(self, key: Optional[RelationKey]) -> None:
+        section = self._pending.pop(key, None) if key is not None else None
+        if section is None:
+            return
+        # 이 관계에는 아직 아무 사실도 없으므로 중복 검사 없이 버킷을 한 번에 채움
+        facts = list(self._snapshot.facts(section))
+        self._facts.update(facts)
+        self._relations[key] = facts
+        for pos in range(1, key[1]):
+            buckets: Dict[Term, List[Predicate]] = {}
+            for fact in facts:
+                bucket = buckets.get(fact[pos])
+                if bucket is None:
+                    bucket = buckets[fact[pos]] = []
+                bucket.append(fact)
+            self._arguments[(key, pos)] = buckets
+        if not self._pending:
+            self._snapshot.close()
+
+    def _load_all(self) -> None:
+        for key in list(self._pending):
+            self._load(key)
+
+
+class Snapshot:
+    """Read side of the snapshot file: header, symbol table and int32 sections."""
+
+    def __init__(self, path: str) -> None:
+        self._file = open(path, "rb")
+        self._map: Optional[mmap.mmap] = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[: len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"Not a KB snapshot: {path}")
+        (header_size,) = _HEADER.unpack_from(self._map, len(MAGIC))
+        start = len(MAGIC) + _HEADER.size
+        self.header = json.loads(self._map[start : start + header_size].decode("utf-8"))
+        self.base = start + header_size
+        self.sections: List[dict] = self.header["sections"]
+        self.symbols: List[Term] = [_term_from_json(symbol) for symbol in self.header["symbols"]]
+
+    def _ints(self, offset: int, count: int) -> array:
+        values = array("i")
+        values.frombytes(self._map[self.base + offset : self.base + offset + 4 * count])
+        if self.header["byteorder"] != sys.byteorder:
+            values.byteswap()
+        return values
+
+    def facts(self, section: dict) -> Iterator[Predicate]:
+        symbols = self.symbols
+        count = section["count"]
+        columns = [
+            [symbols[symbol_id] for symbol_id in self._ints(offset, count)]
+            for offset in section["columns"]
+        ]
+        name = section["name"]
+        return ((name,) + args for args in zip(*columns))
+
+    def asserted(self, section: dict) -> Iterator[Predicate]:
+        # 사용자가 직접 넣은 사실만 바로 복원함 (DRed에 필요), 나머지는 지연 로딩
+        start = self.base + section["asserted"]
+        flags = self._map[start : start + section["count"]]
+        if not any(flags):
+            return iter(())
+        return (fact for fact, flag in zip(self.facts(section), flags) if flag)
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+            self._map = None
+
+
+def save_snapshot(kb: KB, path: str) -> None:
+    """Write ``kb`` as a binary snapshot: JSON header, then one int32 section per relation."""
+    symbols = SymbolTable()
+    sections = []
+    blobs: List[bytes] = []
+    offset = 0
+    unkeyed = []
+    keys = kb.facts.relations()
+    for key in keys:
+        rows = list(kb.facts.relation(key))
+        columns = [array("i") for _ in range(key[1] - 1)]
+        for fact in rows:
+            for column, arg in zip(columns, fact[1:]):
+                column.append(symbols.intern(arg))
+        flags = bytes(1 if fact in kb._asserted else 0 for fact in rows)
+        section = {"name": key[0], "arity": key[1], "count": len(rows), "columns": [], "distinct": []}
+        for column in columns:
+            section["columns"].append(offset)
+            section["distinct"].append(len(set(column)))
+            data = column.tobytes()
+            blobs.append(data)
+            offset += len(data)
+        section["asserted"] = offset
+        blobs.append(flags)
+        offset += len(flags)
+        sections.append(section)
+    for fact in kb.facts:
+        if relation_key(fact) is None:
+            unkeyed.append([_json_term(fact), fact in kb._asserted])
+
+    rule_index = {id(rule): idx for idx, rule in enumerate(kb.rules)}
+    origins = [
+        [_json_term(fact), rule_index[id(rule)], [[var, _json_term(value)] for var, value in bound.items()]]
+        for fact, (rule, bound) in kb._skolem_origins.items()
+        if id(rule) in rule_index
+    ]
+    header = json.dumps({
+        "byteorder": sys.byteorder,
+        "symbols": [_json_term(symbol) for symbol in symbols.symbols()],
+        "sections": sections,
+        "unkeyed": unkeyed,
+        "rules": [_rule_to_json(rule) for rule in kb.rules],
+        "skolems": kb.skolems.to_json(),
+        "origins": origins,
+    }).encode("utf-8")
+
+    # 임시 파일에 다 쓴 뒤 교체하므로 저장 도중 중단되어도 이전 스냅숏이 남음
+    temp = path + ".tmp"
+    with open(temp, "wb") as f:
+        f.write(MAGIC)
+        f.write(_HEADER.pack(len(header)))
+        f.write(header)
+        for blob in blobs:
+            f.write(blob)
+    os.replace(temp, path)
+
+
+def save_kb(kb: KB, path: str) -> None:
+    if kb._wal is not None:
+        kb._wal.close()
+    save_snapshot(kb, path)
+    # 스냅숏에 반영된 로그는 비움 (compaction)
+    open(wal_path(path), "w", encoding="utf-8").close()
+    kb._wal = WriteAheadLog(wal_path(path))
+    kb._snapshot_path = path
+
+
+def load_kb(path: str, compile_rules: bool = True) -> KB:
+    snapshot = Snapshot(path)
+    kb = KB(compile_rules=compile_rules)
+    store = SnapshotFactStore(snapshot)
+    kb.facts = store
+    for section in snapshot.sections:
+        kb._asserted.update(snapshot.asserted(section))
+    for fact, asserted in snapshot.header["unkeyed"]:
+        fact = _term_from_json(fact)
+        store.add(fact)
+        if asserted:
+            kb._asserted.add(fact)
+    for data in snapshot.header["rules"]:
+        kb.add_rule(_rule_from_json(data))
+    kb.skolems = SkolemTable.from_json(snapshot.header["skolems"])
+    for fact, rule_idx, bound in snapshot.header["origins"]:
+        rule = kb.rules[rule_idx]
+        subs = {var: _term_from_json(value) for var, value in bound}
+        kb._skolem_origins[_term_from_json(fact)] = (rule, subs)
+    kb._skolem_facts = {
+        _skolem_key(rule, subs): fact for fact, (rule, subs) in kb._skolem_origins.items()
+    }
+    if not store._pending:
+        snapshot.close()
+
+    for op, payload in read_log(wal_path(path)):
+        if op == "fact":
+            kb.add_fact(_term_from_json(payload))
+        elif op == "rule":
+            kb.add_rule(_rule_from_json(payload))
+        elif op == "retract":
+            kb.retract_fact(_term_from_json(payload))
+        elif op == "chain":
+            max_iterations, goal = payload
+            kb.forward_chain(
+                sys.maxsize if max_iterations is None else max_iterations,
+                goal=None if goal is None else _term_from_json(goal),
+            )
+        else:
+            raise ValueError(f"Unknown log entry: {op}")
+    kb._wal = WriteAheadLog(wal_path(path))
+    kb._snapshot_path = path
+    return kb
+
+
+__all__ = ["Snapshot", "SnapshotFactStore", "WriteAheadLog", "save_snapshot", "save_kb", "load_kb", "read_log"]
@@ -1,8 +1,19 @@
 ﻿from __future__ import annotations
 
-from dataclasses import dataclass
+import heapq
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from collections.abc import Mapping, MutableSet
+from itertools import islice
+from dataclasses import dataclass, field
 from typing import (
+    Callable,
+    Deque,
     Dict,
+    Generator,
     Iterable,
     Iterator,
     List,
@@ -16,6 +27,7 @@ from typing import (
 Term = object
 Predicate = Tuple[str, ...]
 Substitution = Dict[str, Term]
+RelationKey = Tuple[str, int]
 
 
 def is_variable(term: Term) -> bool:
@@ -30,48 +42,115 @@ def substitute(expr: Term, subs: Substitution) -> Term:
     return expr
 
 
-def occurs_check(var: str, value: Term, subs: Substitution) -> bool:
+def resolve(expr: Term, subs: Substitution) -> Term:
+    # substitute는 한 단계만 치환하므로 변수끼리 연결된 바인딩(?x -> ?y -> a)을 끝까지 따라감
+    if isinstance(expr, str):
+        seen = 0
+        while is_variable(expr) and expr in subs and seen <= len(subs):
+            expr = subs[expr]
+            seen += 1
+        if isinstance(expr, tuple):
+            return resolve(expr, subs)
+        return expr
+    if isinstance(expr, tuple):
+        return tuple(resolve(part, subs) for part in expr)
+    return expr
+
+
+class Bindings:
+    """Mutable substitution with a trail, for backtracking search.
+
+    ``bind`` records each variable on the trail and ``undo(mark)`` pops the
+    bindings made since ``mark``, so a join binds into one store instead of
+    copying a dict per candidate. Chains such as ?x -> ?y are only followed
+    when ``deref``/``resolve`` is asked for them.
+    """
+
+    __slots__ = ("values", "trail")
+
+    def __init__(self, subs: Optional[Substitution] = None) -> None:
+        self.values: Substitution = dict(subs) if subs else {}
+        self.trail: List[str] = []
+
+    def deref(self, term: Term) -> Term:
+        values = self.values
+        while isinstance(term, str) and term in values:
+            term = values[term]
+        return term
+
+    def bind(self, var: str, value: Term) -> None:
+        self.values[var] = value
+        self.trail.append(var)
+
+    def mark(self) -> int:
+        return len(self.trail)
+
+    def undo(self, mark: int) -> None:
+        values, trail = self.values, self.trail
+        while len(trail) > mark:
+            del values[trail.pop()]
+
+    def resolve(self, expr: Term) -> Term:
+        return resolve(expr, self.values) if self.values else expr
+
+
+def occurs_in(var: str, value: Term, bindings: Bindings) -> bool:
+    value = bindings.deref(value)
     if var == value:
         return True
-    if isinstance(value, str) and is_variable(value) and value in subs:
-        return occurs_check(var, subs[value], subs)
     if isinstance(value, tuple):
-        return any(occurs_check(var, part, subs) for part in value)
+        return any(occurs_in(var, part, bindings) for part in value)
     return False
 
 
-def unify(x: Term, y: Term, subs: Optional[Substitution] = None) -> Optional[Substitution]:
-    if subs is None:
-        subs = {}
-    x = substitute(x, subs)
-    y = substitute(y, subs)
+def unify_into(x: Term, y: Term, bindings: Bindings) -> bool:
+    """Unify in place; on failure every binding made by this call is undone."""
+    mark = len(bindings.trail)
+    if _unify_step(x, y, bindings):
+        return True
+    bindings.undo(mark)
+    return False
+
+
+def _unify_step(x: Term, y: Term, bindings: Bindings) -> bool:
+    x = bindings.deref(x)
+    y = bindings.deref(y)
     if x == y:
-        return subs
-    if is_variable(x):
-        return unify_var(x, y, subs)
-    if is_variable(y):
-        return unify_var(y, x, subs)
+        return True
+    if isinstance(x, str) and x[:1] == "?":
+        if occurs_in(x, y, bindings):
+            return False
+        bindings.bind(x, y)
+        return True
+    if isinstance(y, str) and y[:1] == "?":
+        if occurs_in(y, x, bindings):
+            return False
+        bindings.bind(y, x)
+        return True
     if isinstance(x, tuple) and isinstance(y, tuple):
         if len(x) != len(y):
-            return None
+            return False
         for x_part, y_part in zip(x, y):
-            subs = unify(x_part, y_part, subs)
-            if subs is None:
-                return None
-        return subs
+            if not _unify_step(x_part, y_part, bindings):
+                return False
+        return True
+    return False
+
+
+def occurs_check(var: str, value: Term, subs: Substitution) -> bool:
+    return occurs_in(var, value, Bindings(subs))
+
+
+def unify(x: Term, y: Term, subs: Optional[Substitution] = None) -> Optional[Substitution]:
+    # subs는 변경하지 않고, 성공하면 subs를 복사한 새 바인딩을 돌려줌
+    bindings = Bindings(subs)
+    if unify_into(x, y, bindings):
+        return bindings.values
     return None
 
 
 def unify_var(var: str, value: Term, subs: Substitution) -> Optional[Substitution]:
-    if var in subs:
-        return unify(subs[var], value, subs)
-    if is_variable(value) and value in subs:
-        return unify(var, subs[value], subs)
-    if occurs_check(var, value, subs):
-        return None
-    new_subs = subs.copy()
-    new_subs[var] = value
-    return new_subs
+    return unify(var, value, subs)
 
 
 def is_ground(fact: Predicate) -> bool:
@@ -82,11 +161,1228 @@ def is_exists(expr: Term) -> bool:
     return isinstance(expr, tuple) and len(expr) == 3 and expr[0] == "EXISTS"
 
 
+def is_ground_term(term: Term) -> bool:
+    if isinstance(term, str):
+        return not is_variable(term)
+    if isinstance(term, tuple):
+        return all(is_ground_term(part) for part in term)
+    return True
+
+
+def relation_key(expr: Term) -> Optional[RelationKey]:
+    # 술어 이름과 인자 수로 관계를 식별함: ("parent", "alice", "bob") -> ("parent", 3)
+    if isinstance(expr, tuple) and expr and isinstance(expr[0], str) and not is_variable(expr[0]):
+        return (expr[0], len(expr))
+    return None
+
+
+class FactStore(MutableSet):
+    """Fact set indexed by (predicate, arity) and by every argument position.
+
+    Buckets are append-only lists, so a lookup scans the bucket length it saw
+    when it started and facts added mid-scan never disturb it. Removed facts
+    are skipped via tombstones until their buckets are rebuilt.
+    """
+
+    def __init__(self, facts: Optional[Iterable[Predicate]] = None) -> None:
+        self._facts: Set[Predicate] = set()
+        self._relations: Dict[RelationKey, List[Predicate]] = {}
+        # (관계, 위치)마다 값 -> 버킷 사전을 둠; 서로 다른 값마다 (관계, 위치, 값) 키 튜플을 만들지 않음
+        self._arguments: Dict[Tuple[RelationKey, int], Dict[Term, List[Predicate]]] = {}
+        self._unkeyed: List[Predicate] = []
+        self._tombstones: Set[Predicate] = set()
+        # 묘비가 이 수와 살아 있는 사실 수를 모두 넘으면 버킷을 다시 만듦
+        self._compact_at = 64
+        if facts:
+            for fact in facts:
+                self.add(fact)
+
+    def __contains__(self, fact: object) -> bool:
+        return fact in self._facts
+
+    def __iter__(self) -> Iterator[Predicate]:
+        return iter(self._facts)
+
+    def __len__(self) -> int:
+        return len(self._facts)
+
+    def __repr__(self) -> str:
+        return f"FactStore({self._facts!r})"
+
+    def add(self, fact: Predicate) -> bool:
+        if fact in self._facts:
+            return False
+        if fact in self._tombstones:
+            self._purge(fact)
+        self._facts.add(fact)
+        for bucket in self._buckets_for(fact):
+            bucket.append(fact)
+        return True
+
+    def discard(self, fact: Predicate) -> bool:
+        if fact not in self._facts:
+            return False
+        self._facts.remove(fact)
+        self._tombstones.add(fact)
+        if len(self._tombstones) > max(self._compact_at, len(self._facts)):
+            self._compact()
+        return True
+
+    def relation(self, key: RelationKey) -> Iterator[Predicate]:
+        return self._scan(self._relations.get(key, []))
+
+    def relations(self) -> List[RelationKey]:
+        return list(self._relations)
+
+    def cardinality(self, key: Optional[RelationKey]) -> int:
+        if key is None:
+            return len(self._facts)
+        return len(self._relations.get(key, ()))
+
+    def selectivity(self, key: RelationKey, pos: int, arg: Optional[Term] = None) -> int:
+        # arg가 주어지면 그 값을 가진 사실 수, 아니면 해당 위치의 서로 다른 값의 수
+        values = self._arguments.get((key, pos))
+        if values is None:
+            return 0
+        return len(values.get(arg, ())) if arg is not None else len(values)
+
+    def candidates(self, pattern: Term) -> Iterator[Predicate]:
+        """Facts that may unify with ``pattern``, using the smallest matching bucket."""
+        if relation_key(pattern) is None:
+            return self._scan_all()
+        return self._scan(self._smallest_bucket(pattern))
+
+    def _smallest_bucket(self, pattern: Term) -> List[Predicate]:
+        key = relation_key(pattern)
+        bucket = self._relations.get(key)
+        if not bucket:
+            return []
+        for pos in range(1, len(pattern)):
+            arg = pattern[pos]
+            if not is_ground_term(arg):
+                continue
+            values = self._arguments.get((key, pos))
+            arg_bucket = values.get(arg) if values is not None else None
+            if not arg_bucket:
+                return []
+            if len(arg_bucket) < len(bucket):
+                bucket = arg_bucket
+        return bucket
+
+    def _scan(self, bucket: List[Predicate]) -> Iterator[Predicate]:
+        size = len(bucket)
+        tombstones = self._tombstones
+        for i in range(size):
+            fact = bucket[i]
+            if tombstones and fact in tombstones:
+                continue
+            yield fact
+
+    def _scan_all(self) -> Iterator[Predicate]:
+        for bucket in list(self._relations.values()) + [self._unkeyed]:
+            yield from self._scan(bucket)
+
+    def _buckets_for(self, fact: Predicate) -> List[List[Predicate]]:
+        key = relation_key(fact)
+        if key is None:
+            return [self._unkeyed]
+        buckets = [self._relations.setdefault(key, [])]
+        for pos in range(1, len(fact)):
+            values = self._arguments.get((key, pos))
+            if values is None:
+                values = self._arguments[(key, pos)] = {}
+            bucket = values.get(fact[pos])
+            if bucket is None:
+                bucket = values[fact[pos]] = []
+            buckets.append(bucket)
+        return buckets
+
+    def _purge(self, fact: Predicate) -> None:
+        # 재추가되는 사실이 옛 버킷에 중복으로 남지 않도록 해당 버킷만 새 리스트로 교체함
+        key = relation_key(fact)
+        if key is None:
+            self._unkeyed = [f for f in self._unkeyed if f != fact]
+        else:
+            self._relations[key] = [f for f in self._relations[key] if f != fact]
+            for pos in range(1, len(fact)):
+                values = self._arguments[(key, pos)]
+                values[fact[pos]] = [f for f in values[fact[pos]] if f != fact]
+        self._tombstones.discard(fact)
+
+    def _compact(self) -> None:
+        # 진행 중인 스캔은 옛 리스트를 그대로 들고 있으므로 새 리스트로 교체해도 안전함
+        dead = self._tombstones
+        self._unkeyed = [f for f in self._unkeyed if f not in dead]
+        for index in [self._relations] + list(self._arguments.values()):
+            for bucket_key in list(index):
+                live = [f for f in index[bucket_key] if f not in dead]
+                if live:
+                    index[bucket_key] = live
+                else:
+                    del index[bucket_key]
+        self._tombstones = set()
+
+
+def term_variables(term: Term) -> Set[str]:
+    if isinstance(term, str):
+        return {term} if is_variable(term) else set()
+    if isinstance(term, tuple):
+        found: Set[str] = set()
+        for part in term:
+            found |= term_variables(part)
+        return found
+    return set()
+
+
+def format_predicate(expr: Term) -> str:
+    if isinstance(expr, tuple) and expr and isinstance(expr[0], str):
+        return f"{expr[0]}({', '.join(format_predicate(arg) for arg in expr[1:])})"
+    return str(expr)
+
+
 @dataclass
+class JoinPlan:
+    premises: Tuple[Predicate, ...]
+    order: Tuple[int, ...]
+    estimates: Tuple[float, ...]
+    cost: float
+
+    def __str__(self) -> str:
+        lines = []
+        for step, (idx, rows) in enumerate(zip(self.order, self.estimates), start=1):
+            lines.append(f"{step}. {format_predicate(self.premises[idx])}  [premise {idx}, est. rows {rows:.1f}]")
+        lines.append(f"estimated cost: {self.cost:.1f}")
+        return "\n".join(lines)
+
+
+@dataclass
+class RuleStats:
+    """Work done by one rule in one iteration (``iteration`` is -1 for totals).
+
+    ``candidates`` are facts returned by the index, ``unifications`` the ones
+    actually matched against a premise (candidates minus delta exclusions),
+    and ``failures`` the matches that did not bind.
+    """
+
+    rule_index: int
+    iteration: int
+    candidates: int = 0
+    unifications: int = 0
+    failures: int = 0
+    substitutions: int = 0
+    added: int = 0
+    duplicates: int = 0
+    seconds: float = 0.0
+
+    def merge(self, other: "RuleStats") -> None:
+        self.candidates += other.candidates
+        self.unifications += other.unifications
+        self.failures += other.failures
+        self.substitutions += other.substitutions
+        self.added += other.added
+        self.duplicates += other.duplicates
+        self.seconds += other.seconds
+
+
+@dataclass
+class ChainStats:
+    engine: str
+    max_iterations: int
+    iterations: int = 0
+    reached_fixpoint: bool = False
+    seconds: float = 0.0
+    rules: List[RuleStats] = field(default_factory=list)
+
+    @property
+    def hit_iteration_cap(self) -> bool:
+        return not self.reached_fixpoint and self.iterations >= self.max_iterations
+
+    def per_rule(self) -> Dict[int, RuleStats]:
+        totals: Dict[int, RuleStats] = {}
+        for entry in self.rules:
+            if entry.rule_index not in totals:
+                totals[entry.rule_index] = RuleStats(entry.rule_index, -1)
+            totals[entry.rule_index].merge(entry)
+        return totals
+
+    def __str__(self) -> str:
+        status = "fixpoint" if self.reached_fixpoint else "iteration cap hit" if self.hit_iteration_cap else "stopped"
+        lines = [f"{self.engine}: {self.iterations} iterations, {status}, {self.seconds * 1000:.1f} ms"]
+        for total in sorted(self.per_rule().values(), key=lambda entry: -entry.seconds):
+            lines.append(
+                f"  rule {total.rule_index}: {total.seconds * 1000:.1f} ms, {total.candidates} candidates, "
+                f"{total.unifications} unifications ({total.failures} failed), {total.substitutions} matches, "
+                f"{total.added} added, {total.duplicates} duplicates"
+            )
+        return "\n".join(lines)
+
+
+def estimate_rows(premise: Predicate, bound: Set[str], store: FactStore) -> float:
+    key = relation_key(premise)
+    rows = float(store.cardinality(key))
+    if key is None or rows == 0:
+        return rows
+    for pos in range(1, len(premise)):
+        arg = premise[pos]
+        if is_ground_term(arg):
+            rows = min(rows, float(store.selectivity(key, pos, arg)))
+    for pos in range(1, len(premise)):
+        arg = premise[pos]
+        if is_variable(arg) and arg in bound:
+            rows /= max(1, store.selectivity(key, pos))
+    return rows
+
+
+def plan_join(
+    premises: Sequence[Predicate],
+    store: FactStore,
+    delta: Optional[FactStore] = None,
+    delta_idx: Optional[int] = None,
+) -> JoinPlan:
+    """Greedy join order: repeatedly pick the premise with the fewest estimated rows.
+
+    When ``delta_idx`` is given that premise is matched first against ``delta``.
+    """
+    remaining = list(range(len(premises)))
+    bound: Set[str] = set()
+    order: List[int] = []
+    estimates: List[float] = []
+    running = 1.0
+    cost = 0.0
+    while remaining:
+        if delta_idx is not None and not order:
+            best = delta_idx
+            rows = estimate_rows(premises[best], bound, delta if delta is not None else store)
+        else:
+            scored = [(estimate_rows(premises[idx], bound, store), idx) for idx in remaining]
+            rows, best = min(scored)
+        remaining.remove(best)
+        order.append(best)
+        estimates.append(rows)
+        running *= rows
+        cost += running
+        bound |= term_variables(premises[best])
+    return JoinPlan(premises=tuple(premises), order=tuple(order), estimates=tuple(estimates), cost=cost)
+
+
+@dataclass(frozen=True, slots=True)
 class Rule:
+    # 규칙은 만들어진 뒤 바뀌지 않고 수천 개까지 늘 수 있으므로 인스턴스 __dict__를 두지 않음
     variables: Tuple[str, ...]
     premises: Tuple[Predicate, ...]
     conclusion: Term
+    # rule_signature()가 처음 계산할 때 채우는 캐시; 같음/해시 비교에는 쓰지 않음
+    signature: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+    # magic 재작성처럼 다른 규칙에서 만들어진 규칙이면 그 원래 규칙; 스콜렘 키와 근거는 원래 규칙 기준
+    source: Optional["Rule"] = field(default=None, repr=False, compare=False)
+
+
+def _hashable(term: Term) -> Term:
+    if isinstance(term, (list, tuple)):
+        return tuple(_hashable(part) for part in term)
+    return term
+
+
+def intern_term(term: Term) -> Term:
+    """``term`` with every string replaced by its ``sys.intern`` copy.
+
+    Facts parsed or built one by one carry their own copy of each name;
+    interning them on the way in lets every fact and index share one object.
+    """
+    if type(term) is str:
+        return sys.intern(term)
+    if isinstance(term, tuple):
+        return tuple(intern_term(part) for part in term)
+    return term
+
+
+class SubstitutionRecord(Mapping):
+    """Read-only substitution stored as a values tuple plus a shared variable -> position table."""
+
+    __slots__ = ("positions", "values")
+
+    def __init__(self, positions: Dict[str, int], values: Tuple[Term, ...]) -> None:
+        self.positions = positions
+        self.values = values
+
+    def __getitem__(self, var: str) -> Term:
+        return self.values[self.positions[var]]
+
+    def get(self, var: str, default: Term = None) -> Term:
+        pos = self.positions.get(var)
+        return default if pos is None else self.values[pos]
+
+    def __contains__(self, var: object) -> bool:
+        return var in self.positions
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.positions)
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+class _BoundedCache:
+    # 가장 오래 안 쓴 항목부터 버리는 작은 LRU; 읽기 스레드들이 같이 쓰므로 갱신은 잠금
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Term, object]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Term) -> Optional[object]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Term, value: object) -> object:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def pop(self, key: Term) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+# 질의마다 magic 재작성 규칙 같은 일회성 규칙이 생기므로 생성된 매처 수에 상한을 둠
+_MATCHER_CACHE = _BoundedCache(4096)
+# 상수만 다른 규칙들은 생성된 코드(팩토리)를 공유하고, 상수는 클로저 변수로만 따로 가짐
+_FACTORY_CACHE = _BoundedCache(1024)
+
+
+@dataclass(frozen=True)
+class _Const:
+    index: int
+
+
+def _abstract_constants(structure: Term, existential: bool) -> Tuple[Term, Tuple[Term, ...]]:
+    # 전제/결론의 상수 자리를 _Const(i)로 바꾼 모양과, 그 자리에 들어갈 상수 값들
+    constants: List[Term] = []
+
+    def abstract(pattern: Tuple[Term, ...]) -> Tuple[Term, ...]:
+        parts = []
+        for arg in pattern:
+            if is_variable(arg):
+                parts.append(arg)
+            else:
+                parts.append(_Const(len(constants)))
+                constants.append(arg)
+        return tuple(parts)
+
+    premises, conclusion = structure
+    shape_premises = tuple(abstract(premise) for premise in premises)
+    # 존재 규칙의 결론은 생성 코드에 쓰이지 않으므로 모양에서 뺌
+    shape_conclusion = None if existential else abstract(conclusion)
+    return (shape_premises, shape_conclusion), tuple(constants)
+
+
+class CompiledRule:
+    """A rule turned into generated Python loops for a given join order.
+
+    Premise constants, join-variable equality checks and the conclusion tuple
+    are written straight into the source, so firing the rule does no generic
+    ``unify``/``substitute`` work. Matchers are cached by rule structure
+    (variables renamed), join order and delta position, and are shared by
+    every rule with the same shape. Rules that differ only in their constants
+    share the generated code and get their own closure over the constants.
+    Existential rules yield SubstitutionRecords that still go through
+    ``KB._conclude``.
+    """
+
+    def __init__(self, rule: Rule) -> None:
+        self.rule = rule
+        self.existential = is_exists(rule.conclusion)
+        names: Dict[str, str] = {}
+        for var in _variables_in_order((rule.premises, rule.conclusion)):
+            names.setdefault(var, f"?{len(names)}")
+        # 전제 변수가 먼저 등장하므로 정규화 번호 ?0..?k-1이 곧 전제 변수들임
+        self.premise_variables = _variables_in_order(rule.premises)
+        self.structure = _hashable(substitute(_hashable((rule.premises, rule.conclusion)), names))
+
+    @property
+    def positions(self) -> Dict[str, int]:
+        # 존재 규칙만 쓰므로 필요할 때 한 번 만듦
+        positions = self.__dict__.get("_positions")
+        if positions is None:
+            positions = self.__dict__["_positions"] = {var: pos for pos, var in enumerate(self.premise_variables)}
+        return positions
+
+    @staticmethod
+    def supports(rule: Rule) -> bool:
+        # 인자가 변수이거나 완전히 상수인 평평한 전제만 컴파일함 (중첩 안에 변수가 있으면 일반 해석)
+        if not rule.premises or len(rule.premises) > 15:
+            return False
+        head = rule.conclusion[2] if is_exists(rule.conclusion) else rule.conclusion
+        for pattern in tuple(rule.premises) + (head,):
+            if relation_key(pattern) is None:
+                return False
+            if any(not is_ground_term(arg) and not is_variable(arg) for arg in pattern[1:]):
+                return False
+        return not (term_variables(head) - _exists_variables(rule.conclusion)) - term_variables(rule.premises)
+
+    def matcher(self, order: Sequence[int], delta_idx: int = -1, seeded: bool = False, profiled: bool = False) -> Callable:
+        key = (self.structure, tuple(order), delta_idx, seeded, profiled)
+        matcher = _MATCHER_CACHE.get(key)
+        if matcher is None:
+            shape, constants = _abstract_constants(self.structure, self.existential)
+            shape_key = (shape, tuple(order), delta_idx, seeded, profiled)
+            factory = _FACTORY_CACHE.get(shape_key)
+            if factory is None:
+                factory = _FACTORY_CACHE.put(shape_key, self._generate(shape, len(constants), tuple(order), delta_idx, seeded, profiled))
+            matcher = _MATCHER_CACHE.put(key, factory(*constants))
+        return matcher
+
+    def _generate(
+        self,
+        shape: Term,
+        constant_count: int,
+        order: Tuple[int, ...],
+        delta_idx: int,
+        seeded: bool,
+        profiled: bool = False,
+    ) -> Callable:
+        premises, conclusion = shape
+        slots: Dict[str, str] = {}
+
+        def expr(term: Term) -> str:
+            if isinstance(term, _Const):
+                return f"c{term.index}"
+            # 아직 묶이지 않은 변수는 candidates()가 와일드카드로 보도록 이름 그대로 넘김
+            return slots.get(term) or repr(term)
+
+        # profiled이면 counts = [후보, 단일화 시도, 전제 매칭, 완성된 치환]을 세는 별도 함수를 만듦
+        # 상수는 팩토리 인자(c0, c1, ...)로 받아 클로저로 묶음
+        params = ", ".join(f"c{i}" for i in range(constant_count))
+        lines = [f"def make({params}):", "    def match(facts, delta, seed, counts):"]
+        indent = "        "
+        for step, idx in enumerate(order):
+            premise = premises[idx]
+            fact = f"f{step}"
+            lookup = f"({', '.join(expr(arg) for arg in premise)},)"
+            if idx == delta_idx and seeded:
+                source = "(seed,)"
+            elif idx == delta_idx:
+                source = f"delta.candidates({lookup})"
+            else:
+                source = f"facts.candidates({lookup})"
+            lines.append(f"{indent}for {fact} in {source}:")
+            indent += "    "
+            if profiled:
+                lines.append(f"{indent}counts[0] += 1")
+            if idx == delta_idx and seeded:
+                lines.append(f"{indent}if len({fact}) != {len(premise)} or {fact}[0] != {expr(premise[0])}:")
+                lines.append(f"{indent}    continue")
+            if idx < delta_idx:
+                lines.append(f"{indent}if {fact} in delta:")
+                lines.append(f"{indent}    continue")
+            if profiled:
+                lines.append(f"{indent}counts[1] += 1")
+            checks = []
+            for pos in range(1, len(premise)):
+                arg = premise[pos]
+                if is_variable(arg) and arg not in slots:
+                    slots[arg] = f"v{len(slots)}"
+                    lines.append(f"{indent}{slots[arg]} = {fact}[{pos}]")
+                else:
+                    checks.append(f"{fact}[{pos}] != {expr(arg)}")
+            if checks:
+                lines.append(f"{indent}if {' or '.join(checks)}:")
+                lines.append(f"{indent}    continue")
+            if profiled:
+                lines.append(f"{indent}counts[2] += 1")
+        if profiled:
+            lines.append(f"{indent}counts[3] += 1")
+        if self.existential:
+            lines.append(f"{indent}yield ({', '.join(slots[f'?{i}'] for i in range(len(slots)))},)")
+        else:
+            lines.append(f"{indent}yield ({', '.join(expr(arg) for arg in conclusion)},)")
+        lines.append("    return match")
+        namespace: Dict[str, object] = {}
+        exec("\n".join(lines), namespace)
+        return namespace["make"]
+
+    def run(
+        self,
+        facts: FactStore,
+        order: Sequence[int],
+        delta: Optional[FactStore] = None,
+        delta_idx: int = -1,
+        seed: Optional[Predicate] = None,
+        counts: Optional[List[int]] = None,
+    ) -> Iterator[object]:
+        matcher = self.matcher(order, delta_idx, seed is not None, counts is not None)
+        results = matcher(facts, delta if delta is not None else (), seed, counts)
+        if not self.existential:
+            return results
+        positions = self.positions
+        return (SubstitutionRecord(positions, values) for values in results)
+
+
+def _variables_in_order(term: Term) -> List[str]:
+    found: List[str] = []
+
+    def walk(part: Term) -> None:
+        if isinstance(part, str):
+            if is_variable(part) and part not in found:
+                found.append(part)
+        elif isinstance(part, (list, tuple)):
+            for item in part:
+                walk(item)
+
+    walk(term)
+    return found
+
+
+@dataclass
+class ClosureSpec:
+    """A linear recursive rule that only extends ``target`` along ``step`` edges.
+
+    ``direction`` is "left" for step(x,y) & target(y,z) -> target(x,z), "right"
+    for target(x,y) & step(y,z) -> target(x,z), and "transitive" when step and
+    target are the same binary relation.
+    """
+
+    rule_index: int
+    step: str
+    target: str
+    direction: str
+
+
+def find_closures(rules: Sequence[Rule]) -> List[ClosureSpec]:
+    specs = []
+    for rule_index, rule in enumerate(rules):
+        conclusion = rule.conclusion
+        if is_exists(conclusion) or len(rule.premises) != 2 or relation_key(conclusion) is None:
+            continue
+        if len(conclusion) != 3 or not all(is_variable(arg) for arg in conclusion[1:]):
+            continue
+        target, x, z = conclusion
+        if x == z:
+            continue
+        for first, second in (rule.premises, tuple(reversed(rule.premises))):
+            if len(first) != 3 or len(second) != 3 or relation_key(first) is None or relation_key(second) is None:
+                continue
+            y = first[2]
+            if not is_variable(y) or y in (x, z) or first[1] != x or second[1] != y or second[2] != z:
+                continue
+            if first[0] == target and second[0] == target:
+                specs.append(ClosureSpec(rule_index, target, target, "transitive"))
+            elif second[0] == target:
+                specs.append(ClosureSpec(rule_index, first[0], target, "left"))
+            elif first[0] == target:
+                specs.append(ClosureSpec(rule_index, second[0], target, "right"))
+            else:
+                continue
+            break
+    return specs
+
+
+def closure_pairs(step: Iterable[Tuple[Term, Term]], target: Iterable[Tuple[Term, Term]], direction: str) -> Set[Tuple[Term, Term]]:
+    """Least fixpoint of the closure rule as (x, z) pairs, by BFS per source."""
+    pairs: Set[Tuple[Term, Term]] = set()
+    for found in _closure_by_source(step, target, direction):
+        pairs.update(found)
+    return pairs
+
+
+def _closure_by_source(
+    step: Iterable[Tuple[Term, Term]], target: Iterable[Tuple[Term, Term]], direction: str
+) -> Iterator[List[Tuple[Term, Term]]]:
+    # 출발점 하나의 BFS가 끝날 때마다 그 쌍들을 내보냄; 출발점이 다르면 쌍도 겹치지 않음
+    edges: Dict[Term, List[Term]] = {}
+    seeds: Dict[Term, Set[Term]] = {}
+    if direction == "left":
+        # target(x,z) <- step(x,y), target(y,z): z마다 step을 거꾸로 따라가며 x를 찾음
+        for x, y in step:
+            edges.setdefault(y, []).append(x)
+        for y, z in target:
+            seeds.setdefault(z, set()).add(y)
+    else:
+        for y, z in step:
+            edges.setdefault(y, []).append(z)
+        for x, y in target:
+            seeds.setdefault(x, set()).add(y)
+
+    for source, start in seeds.items():
+        seen = set(start)
+        frontier = list(start)
+        while frontier:
+            node = frontier.pop()
+            for nxt in edges.get(node, ()):
+                if nxt not in seen:
+                    seen.add(nxt)
+                    frontier.append(nxt)
+        yield [(node, source) if direction == "left" else (source, node) for node in seen]
+
+
+class MatchNetwork:
+    """TREAT-style alpha network compiled from ``KB.rules``.
+
+    Each premise registers under its (predicate, arity) key. A fact pushed into
+    the network is queued only if some premise can match it; rules added after
+    compilation are marked unprimed and joined once against the whole store.
+    """
+
+    def __init__(self) -> None:
+        self.alpha: Dict[RelationKey, List[Tuple[int, int]]] = {}
+        self.wildcard: List[Tuple[int, int]] = []
+        self.agenda: List[Predicate] = []
+        self.unprimed: List[int] = []
+        self.rule_count = 0
+
+    def sync(self, rules: Sequence[Rule]) -> None:
+        for rule_idx in range(self.rule_count, len(rules)):
+            for premise_idx, premise in enumerate(rules[rule_idx].premises):
+                key = relation_key(premise)
+                entries = self.wildcard if key is None else self.alpha.setdefault(key, [])
+                entries.append((rule_idx, premise_idx))
+            self.unprimed.append(rule_idx)
+        self.rule_count = len(rules)
+
+    def activations(self, fact: Predicate) -> List[Tuple[int, int]]:
+        key = relation_key(fact)
+        entries = self.alpha.get(key, []) if key is not None else []
+        return entries + self.wildcard if self.wildcard else entries
+
+    def push(self, fact: Predicate) -> None:
+        if self.wildcard or relation_key(fact) in self.alpha:
+            self.agenda.append(fact)
+
+    def clear(self) -> None:
+        self.agenda.clear()
+        self.unprimed.clear()
+
+
+def canonical_variant(expr: Term) -> Term:
+    # 변수 이름만 다른 목표(variant)가 같은 테이블을 쓰도록 등장 순서대로 ?0, ?1, ...로 바꿈
+    names: Dict[str, str] = {}
+
+    def rename(term: Term) -> Term:
+        if isinstance(term, str) and is_variable(term):
+            if term not in names:
+                names[term] = f"?{len(names)}"
+            return names[term]
+        if isinstance(term, tuple):
+            return tuple(rename(part) for part in term)
+        return term
+
+    return rename(expr)
+
+
+@dataclass(frozen=True, slots=True)
+class _Clause:
+    # 이름을 바꾼 규칙과 원래 규칙; 스콜렘 키는 원래 변수 이름으로 만들어야 전방 추론과 같은 상수가 나옴
+    rule: Rule
+    source: Rule
+    names: Dict[str, str]  # 바뀐 이름 -> 원래 이름
+
+
+@dataclass(slots=True)
+class _Subscriber:
+    # 하위 목표 테이블을 기다리는 규칙 본문의 나머지; seen은 이미 받은 답의 수
+    clause: _Clause
+    goal: Term
+    subgoal: Predicate
+    rest: Tuple[Predicate, ...]
+    subs: Substitution
+    seen: int = 0
+
+
+class TabledProver:
+    """Goal-directed backward chaining with answer tables.
+
+    Every subgoal variant gets a table of ground answers. A call to a subgoal
+    that already has a table subscribes to it instead of recursing, and each
+    new answer is pushed once to the subscribers waiting on that table, so
+    left- or right-recursive rules such as ancestor transitivity terminate
+    and no rule body is re-joined against answers it has already seen.
+    """
+
+    def __init__(self, kb: "KB") -> None:
+        self.kb = kb
+        self.tables: Dict[Term, Set[Predicate]] = {}
+        self._goals: List[Term] = []
+        self._rename_counter = 0
+        # 테이블마다 답을 들어온 순서대로 보관함; 구독자는 어디까지 읽었는지만 기억함
+        self._answers: Dict[Term, List[Predicate]] = {}
+        self._subscribers: Dict[Term, List[_Subscriber]] = {}
+        self._agenda: Deque[Tuple[bool, Term]] = deque()
+        self._grown: Set[Term] = set()
+        self.evaluations = 0
+
+    def prove(self, goal: Predicate) -> List[Substitution]:
+        key = self._call(goal)
+        while self._agenda:
+            fresh, table_goal = self._agenda.popleft()
+            if fresh:
+                self._evaluate(table_goal)
+                continue
+            self._grown.discard(table_goal)
+            for subscriber in list(self._subscribers.get(table_goal, ())):
+                self._feed(subscriber, table_goal)
+        results = []
+        for answer in self.tables[key]:
+            subs = unify(goal, answer)
+            if subs is not None:
+                results.append(subs)
+        return results
+
+    def _call(self, goal: Term) -> Term:
+        key = canonical_variant(goal)
+        if key not in self.tables:
+            self.tables[key] = set()
+            self._answers[key] = []
+            self._goals.append(key)
+            # 바로 재귀하지 않고 agenda에 넣어, 깊은 재귀 규칙에서도 스택이 규칙 길이만큼만 쌓임
+            self._agenda.append((True, key))
+        return key
+
+    def _evaluate(self, goal: Term) -> None:
+        # 테이블마다 한 번만 실행됨; 이후의 답은 _feed가 구독자에게 밀어 넣음
+        self.evaluations += 1
+        for fact in self.kb.facts.candidates(goal):
+            if unify(goal, fact) is not None:
+                self._answer(goal, fact)
+        for rule in self.kb.rules:
+            clause = self._rename_apart(rule)
+            conclusion = clause.rule.conclusion
+            head = conclusion[2] if is_exists(conclusion) else conclusion
+            head_subs = unify(head, goal)
+            if head_subs is not None:
+                self._solve_body(clause, goal, clause.rule.premises, head_subs)
+
+    def _answer(self, goal: Term, fact: Predicate) -> None:
+        answers = self.tables[goal]
+        if fact in answers:
+            return
+        answers.add(fact)
+        self._answers[goal].append(fact)
+        if goal not in self._grown:
+            self._grown.add(goal)
+            self._agenda.append((False, goal))
+
+    def _conclude(self, clause: _Clause, goal: Term, subs: Substitution) -> None:
+        conclusion = clause.rule.conclusion
+        if is_exists(conclusion):
+            # 존재 결론은 전방 추론과 같은 경로(원래 규칙, 원래 변수 이름)로 스콜렘화하고,
+            # 기존 증인은 사실 스캔에서 이미 얻음
+            existential = _exists_variables(conclusion)
+            bound = {
+                clause.names[var]: resolve(var, subs)
+                for var in subs
+                if var in clause.names and var not in existential
+            }
+            new_fact = self.kb._conclude(clause.source, bound)
+            if new_fact is not None:
+                self.kb._derive(new_fact)
+        else:
+            new_fact = resolve(conclusion, subs)
+        if new_fact is not None and is_ground_term(new_fact) and unify(goal, new_fact) is not None:
+            self._answer(goal, new_fact)
+
+    def _solve_body(self, clause: _Clause, goal: Term, premises: Sequence[Predicate], subs: Substitution) -> None:
+        if not premises:
+            self._conclude(clause, goal, subs)
+            return
+        # 이미 묶인 인자가 가장 많은 전제부터 풀어 하위 목표를 좁힘 (sideways information passing)
+        bound = [resolve(premise, subs) for premise in premises]
+        idx = max(range(len(bound)), key=lambda i: (_bound_arguments(bound[i]), -i))
+        subgoal = bound[idx]
+        rest = tuple(premises[:idx]) + tuple(premises[idx + 1:])
+        key = self._call(subgoal)
+        subscriber = _Subscriber(clause, goal, subgoal, rest, subs)
+        self._subscribers.setdefault(key, []).append(subscriber)
+        self._feed(subscriber, key)
+
+    def _feed(self, subscriber: "_Subscriber", key: Term) -> None:
+        # 목록이 읽는 도중 자라도(자기 자신을 부르는 규칙) while이 새 답까지 이어서 읽음
+        answers = self._answers[key]
+        while subscriber.seen < len(answers):
+            answer = answers[subscriber.seen]
+            subscriber.seen += 1
+            new_subs = unify(subscriber.subgoal, answer, subscriber.subs)
+            if new_subs is not None:
+                self._solve_body(subscriber.clause, subscriber.goal, subscriber.rest, new_subs)
+
+    def _rename_apart(self, rule: Rule) -> _Clause:
+        self._rename_counter += 1
+        suffix = f"#{self._rename_counter}"
+        mapping: Substitution = {}
+        for var in term_variables((rule.premises, rule.conclusion)) | _exists_variables(rule.conclusion):
+            mapping[var] = var + suffix
+        conclusion = rule.conclusion
+        if is_exists(conclusion):
+            renamed_vars = [mapping[var] for var in _exists_variables(conclusion)]
+            conclusion = ("EXISTS", renamed_vars, substitute(conclusion[2], mapping))
+        else:
+            conclusion = substitute(conclusion, mapping)
+        renamed = Rule(
+            variables=tuple(mapping.get(var, var) for var in rule.variables),
+            premises=tuple(substitute(premise, mapping) for premise in rule.premises),
+            conclusion=conclusion,
+        )
+        return _Clause(renamed, rule, {new: old for old, new in mapping.items()})
+
+
+def _exists_variables(expr: Term) -> Set[str]:
+    if not is_exists(expr):
+        return set()
+    return {expr[1]} if isinstance(expr[1], str) else set(expr[1])
+
+
+SkolemKey = Tuple[str, Tuple[Tuple[str, Term], ...]]
+
+
+def rule_signature(rule: Rule) -> str:
+    # id(rule)와 달리 같은 규칙이면 실행/프로세스가 달라도 같은 값이 나옴
+    # 스콜렘 키마다 repr 문자열을 새로 만들지 않도록 규칙 자신에 한 번만 계산해 둠
+    signature = rule.signature
+    if signature is None:
+        signature = repr((_hashable(rule.premises), _hashable(rule.conclusion)))
+        object.__setattr__(rule, "signature", signature)
+    return signature
+
+
+def _skolem_key(rule: Rule, subs: Substitution) -> SkolemKey:
+    # 존재 결론의 한 인스턴스 = (규칙, 존재 변수가 아닌 결론 변수들의 값)
+    conclusion = rule.conclusion
+    free = term_variables(conclusion[2]) - _exists_variables(conclusion)
+    return (rule_signature(rule), tuple(sorted((var, subs[var]) for var in free if var in subs)))
+
+
+def _json_term(term: Term):
+    return [_json_term(arg) for arg in term] if isinstance(term, tuple) else term
+
+
+def _term_from_json(value) -> Term:
+    return tuple(_term_from_json(arg) for arg in value) if isinstance(value, list) else value
+
+
+class SkolemTable:
+    """Skolem constants memoized per (rule signature, bound variable values).
+
+    A rule instance gets its ``_sk{n}`` constants the first time it fires and
+    keeps them for the life of the table, so re-deriving it after a retraction,
+    with another engine, or in a later run never mints a second constant.
+    """
+
+    def __init__(self) -> None:
+        self._constants: Dict[SkolemKey, Dict[str, str]] = {}
+        self.counter = 0
+
+    def __len__(self) -> int:
+        return len(self._constants)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._constants
+
+    def constants(self, key: SkolemKey, variables: Sequence[str]) -> Dict[str, str]:
+        entry = self._constants.get(key)
+        if entry is None:
+            entry = self._constants[key] = {}
+        for var in variables:
+            if var not in entry:
+                entry[var] = f"_sk{self.counter}"
+                self.counter += 1
+        return entry
+
+    def entries(self) -> List[Tuple[SkolemKey, Dict[str, str]]]:
+        return [(key, dict(entry)) for key, entry in self._constants.items()]
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "counter": self.counter,
+            "entries": [[signature, _json_term(bound), entry] for (signature, bound), entry in self._constants.items()],
+        })
+
+    @classmethod
+    def from_json(cls, text: str) -> "SkolemTable":
+        data = json.loads(text)
+        table = cls()
+        table.counter = data["counter"]
+        for signature, bound, entry in data["entries"]:
+            table._constants[(signature, _term_from_json(bound))] = dict(entry)
+        return table
+
+    def save(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.to_json())
+
+    @classmethod
+    def load(cls, path: str) -> "SkolemTable":
+        with open(path, encoding="utf-8") as f:
+            return cls.from_json(f.read())
+
+
+def _bound_arguments(premise: Term, bound: Set[str] = frozenset()) -> int:
+    if not isinstance(premise, tuple):
+        return 0
+    return sum(1 for arg in premise[1:] if is_ground_term(arg) or term_variables(arg) <= bound)
+
+
+def adornment(pattern: Predicate, bound: Set[str] = frozenset()) -> str:
+    # 각 인자가 묶였으면 b, 자유면 f: ancestor(?who, dana) -> "fb"
+    return "".join("b" if term_variables(arg) <= bound else "f" for arg in pattern[1:])
+
+
+def magic_predicate(pattern: Predicate, adorn: str) -> Predicate:
+    bound_args = tuple(arg for arg, mode in zip(pattern[1:], adorn) if mode == "b")
+    return (f"magic_{pattern[0]}_{adorn}",) + bound_args
+
+
+def magic_rewrite(rules: Sequence[Rule], goal: Predicate) -> Tuple[List[Rule], Predicate]:
+    """Magic-set rewriting of ``rules`` for the binding pattern of ``goal``.
+
+    Returns the rewritten rules and the seed magic fact. Each rule deriving an
+    adorned predicate gets an extra magic premise, and every derived premise
+    gets a magic rule that passes bindings sideways (most-bound premise first).
+    Rules whose bound head positions hold existential variables stay unguarded.
+    """
+    derived = set()
+    for rule in rules:
+        head = rule.conclusion[2] if is_exists(rule.conclusion) else rule.conclusion
+        derived.add(relation_key(head))
+
+    goal_adorn = adornment(goal)
+    rewritten: List[Rule] = []
+    seen = {(relation_key(goal), goal_adorn)}
+    worklist = [(relation_key(goal), goal_adorn)]
+    while worklist:
+        key, adorn = worklist.pop()
+        for rule in rules:
+            conclusion = rule.conclusion
+            head = conclusion[2] if is_exists(conclusion) else conclusion
+            if relation_key(head) != key:
+                continue
+            existential = _exists_variables(conclusion)
+            head_bound = set()
+            for arg, mode in zip(head[1:], adorn):
+                if mode == "b":
+                    head_bound |= term_variables(arg)
+            if head_bound & existential:
+                rewritten.append(rule)
+                continue
+            guard = magic_predicate(head, adorn)
+            bound = set(head_bound)
+            body: List[Predicate] = [guard]
+            remaining = list(rule.premises)
+            while remaining:
+                premise = max(remaining, key=lambda p: (_bound_arguments(p, bound), -remaining.index(p)))
+                remaining.remove(premise)
+                premise_key = relation_key(premise)
+                if premise_key in derived:
+                    premise_adorn = adornment(premise, bound)
+                    rewritten.append(
+                        Rule(
+                            variables=rule.variables,
+                            premises=tuple(body),
+                            conclusion=magic_predicate(premise, premise_adorn),
+                        )
+                    )
+                    if (premise_key, premise_adorn) not in seen:
+                        seen.add((premise_key, premise_adorn))
+                        worklist.append((premise_key, premise_adorn))
+                body.append(premise)
+                bound |= term_variables(premise)
+            rewritten.append(Rule(variables=rule.variables, premises=tuple(body), conclusion=conclusion, source=rule))
+    return rewritten, magic_predicate(goal, goal_adorn)
+
+
+def _drain(steps: Generator[object, None, bool]) -> bool:
+    # yield 없이 끝까지 돌려 제너레이터의 반환값을 얻음
+    while True:
+        try:
+            next(steps)
+        except StopIteration as stop:
+            return stop.value
+
+
+def _distinct_substitutions(answers: Iterable[Substitution]) -> Iterator[Substitution]:
+    seen: Set[Tuple[Tuple[str, Term], ...]] = set()
+    for subs in answers:
+        key = tuple(sorted(subs.items()))
+        if key not in seen:
+            seen.add(key)
+            yield subs
+
+
+def rule_dependencies(rules: Sequence[Rule]) -> Dict[str, Set[str]]:
+    """Predicate -> predicates its rules read directly (conclusion head -> premise heads)."""
+    graph: Dict[str, Set[str]] = {}
+    for rule in rules:
+        head = rule.conclusion[2] if is_exists(rule.conclusion) else rule.conclusion
+        if relation_key(head) is None:
+            continue
+        graph.setdefault(head[0], set()).update(
+            premise[0] for premise in rule.premises if relation_key(premise) is not None
+        )
+    return graph
+
+
+@dataclass(frozen=True)
+class Stratum:
+    """Rules whose conclusions fall in one strongly connected component of the predicate graph.
+
+    ``recursive`` strata read their own predicates and loop to a local
+    fixpoint; the others fire once.
+    """
+
+    predicates: Tuple[str, ...]
+    rules: Tuple[int, ...]
+    recursive: bool
+
+    def __str__(self) -> str:
+        kind = "recursive" if self.recursive else "once"
+        return f"{kind} {{{', '.join(self.predicates)}}}: rules {', '.join(map(str, self.rules))}"
+
+
+def stratify(rules: Sequence[Rule]) -> List[Stratum]:
+    """Rule indices grouped by SCC of premise -> conclusion edges, in topological order."""
+    heads: List[Optional[str]] = []
+    edges: Dict[str, List[str]] = {}
+    for rule in rules:
+        head = rule.conclusion[2] if is_exists(rule.conclusion) else rule.conclusion
+        if relation_key(head) is None or any(relation_key(premise) is None for premise in rule.premises):
+            # 술어 이름을 알 수 없는 패턴은 어떤 사실과도 맞을 수 있으므로 전체를 한 층으로 돌림
+            return [Stratum(tuple(sorted({r.conclusion[0] for r in rules if isinstance(r.conclusion, tuple)})),
+                            tuple(range(len(rules))), True)] if rules else []
+        heads.append(head[0])
+        edges.setdefault(head[0], [])
+        for premise in rule.premises:
+            edges.setdefault(premise[0], []).append(head[0])
+
+    # Tarjan (반복형)으로 SCC를 구한 뒤, 축약 그래프를 위상 정렬함
+    index: Dict[str, int] = {}
+    low: Dict[str, int] = {}
+    stack: List[str] = []
+    on_stack: Set[str] = set()
+    components: List[List[str]] = []
+    for root in edges:
+        if root in index:
+            continue
+        work = [(root, 0)]
+        while work:
+            node, child = work.pop()
+            if child == 0:
+                index[node] = low[node] = len(index)
+                stack.append(node)
+                on_stack.add(node)
+            successors = edges[node]
+            if child < len(successors):
+                work.append((node, child + 1))
+                succ = successors[child]
+                if succ not in index:
+                    work.append((succ, 0))
+                elif succ in on_stack:
+                    low[node] = min(low[node], index[succ])
+                continue
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[node])
+            if low[node] == index[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.append(member)
+                    if member == node:
+                        break
+                components.append(component)
+
+    # 서로 독립인 층은 규칙이 먼저 나온 순서대로 두어 일정이 규칙 목록을 따르게 함
+    component_of = {node: number for number, component in enumerate(components) for node in component}
+    first_rule = [len(rules)] * len(components)
+    for idx, head in enumerate(heads):
+        first_rule[component_of[head]] = min(first_rule[component_of[head]], idx)
+    successors: List[Set[int]] = [set() for _ in components]
+    indegree = [0] * len(components)
+    for node, targets in edges.items():
+        for target in targets:
+            a, b = component_of[node], component_of[target]
+            if a != b and b not in successors[a]:
+                successors[a].add(b)
+                indegree[b] += 1
+    # Tarjan은 후속 성분을 먼저 내놓으므로 한 번 훑어 "도달 가능한 가장 앞 규칙"을 구할 수 있음
+    for number in range(len(components)):
+        for succ in successors[number]:
+            first_rule[number] = min(first_rule[number], first_rule[succ])
+    ready = [(first_rule[number], number) for number in range(len(components)) if indegree[number] == 0]
+    heapq.heapify(ready)
+    strata = []
+    while ready:
+        _, number = heapq.heappop(ready)
+        for succ in successors[number]:
+            indegree[succ] -= 1
+            if indegree[succ] == 0:
+                heapq.heappush(ready, (first_rule[succ], succ))
+        members = set(components[number])
+        rule_indices = tuple(idx for idx, head in enumerate(heads) if head in members)
+        if not rule_indices:
+            continue
+        recursive = any(premise[0] in members for idx in rule_indices for premise in rules[idx].premises)
+        strata.append(Stratum(tuple(sorted(members)), rule_indices, recursive))
+    return strata
+
+
+class QueryCache:
+    """Size-bounded LRU of query answers, validated by predicate version stamps.
+
+    An entry records the versions of every predicate its answer can depend
+    on; a lookup whose current stamp differs is a miss and drops the entry.
+    """
+
+    def __init__(self, maxsize: int = 256) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Term, Tuple[Term, List[Substitution]]]" = OrderedDict()
+        # snapshot()을 쓰는 여러 읽기 스레드가 동시에 query할 수 있으므로 항목 갱신만 잠금
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get(self, key: Term, stamp: Term) -> Optional[List[Substitution]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == stamp:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Term, stamp: Term, answers: List[Substitution]) -> None:
+        with self._lock:
+            self._entries[key] = (stamp, answers)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def info(self) -> Dict[str, float]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self), "maxsize": self.maxsize, "hit_rate": self.hit_rate}
 
 
 class KB:
@@ -94,10 +1390,47 @@ class KB:
         self,
         facts: Optional[Iterable[Predicate]] = None,
         rules: Optional[Iterable[Term]] = None,
+        storage: str = "indexed",
+        compile_rules: bool = True,
+        query_cache_size: int = 256,
     ) -> None:
-        self.facts: Set[Predicate] = set()
+        if storage == "indexed":
+            self.facts: MutableSet = FactStore()
+        elif storage == "compact":
+            # 정수로 인코딩한 열 저장소; 공개 API는 그대로 튜플을 주고받음
+            from compact import CompactFactStore
+
+            self.facts = CompactFactStore()
+        elif storage == "versioned":
+            # 읽기 스레드가 snapshot()으로 발행된 epoch를 잠금 없이 읽을 수 있는 저장소
+            from versioned import VersionedFactStore
+
+            self.facts = VersionedFactStore()
+        else:
+            raise ValueError(f"Unknown fact storage: {storage}")
+        self._versioned = storage == "versioned"
         self.rules: List[Rule] = []
-        self._exist_counter = 0
+        # False이면 컴파일된 매처 대신 unify/substitute 기반 일반 해석으로 규칙을 적용함 (디버깅용)
+        self.compile_rules = compile_rules
+        # id(rule) -> (rule, CompiledRule); 상한이 있어 질의마다 생기는 일회성 규칙이 쌓이지 않음
+        self._compiled = _BoundedCache(4096)
+        self._network: Optional[MatchNetwork] = None
+        self._asserted: Set[Predicate] = set()
+        self._skolem_origins: Dict[Predicate, Tuple[Rule, Substitution]] = {}
+        self._skolem_facts: Dict[SkolemKey, Predicate] = {}
+        self.skolems = SkolemTable()
+        # save/load 이후 add_fact/add_rule/retract_fact와 추론 실행을 기록하는 로그 (persistence.WriteAheadLog)
+        self._wal = None
+        self._snapshot_path: Optional[str] = None
+        # forward_chain(profile=True) 또는 stats_hook이 있을 때만 규칙별 통계를 모음
+        self.stats: Optional[ChainStats] = None
+        self.stats_hook: Optional[Callable[[ChainStats], None]] = None
+        self._stats: Optional[ChainStats] = None
+        # 술어별 버전: 그 술어의 사실이 추가/삭제될 때마다 증가하며 질의 캐시 무효화에 쓰임
+        self.query_cache: Optional[QueryCache] = QueryCache(query_cache_size) if query_cache_size > 0 else None
+        self._versions: Dict[str, int] = {}
+        self._rules_version = 0
+        self._dependency_closure: Dict[str, Tuple[str, ...]] = {}
         # === 수정: 초기 인자로 들어온 사실과 규칙을 등록함 ===
         if facts:
             for f in facts:
@@ -107,74 +1440,745 @@ class KB:
                 self.add_rule(r)
 
     def add_fact(self, fact: Predicate) -> bool:
+        fact = intern_term(fact)
+        if self._wal is not None:
+            self._wal.fact(fact)
+        self._asserted.add(fact)
+        added = self._derive(fact)
+        self._publish()
+        return added
+
+    def _log_chain(self, max_iterations: Optional[int], goal: Optional[Predicate] = None) -> None:
+        # 스냅숏 뒤에 유도된 사실은 로그에 없으므로 추론 실행 자체를 남겨 load가 다시 돌리게 함
+        if self._wal is not None:
+            self._wal.chain(max_iterations, goal)
+
+    def _publish(self) -> None:
+        if self._versioned:
+            self.facts.publish()
+
+    def snapshot(self):
+        """A KBSnapshot pinned to the last published epoch (needs storage="versioned")."""
+        from versioned import KBSnapshot
+
+        return KBSnapshot(self)
+
+    def _derive(self, fact: Predicate) -> bool:
+        # 추론으로 얻은 사실은 _asserted에 넣지 않으므로 retract_fact 때 근거를 다시 확인함
         if fact in self.facts:
             return False
         self.facts.add(fact)
+        self._bump(fact)
+        if self._network is not None:
+            self._network.push(fact)
         return True
 
+    def _bump(self, fact: Predicate) -> None:
+        name = fact[0] if isinstance(fact, tuple) and fact else None
+        self._versions[name] = self._versions.get(name, 0) + 1
+
     def add_rule(self, rule: Term) -> None:
         parsed = rule if isinstance(rule, Rule) else self._parse_rule(rule)
+        if self._wal is not None:
+            self._wal.rule(parsed)
         self.rules.append(parsed)
+        self._rules_version += 1
+        self._dependency_closure = {}
+        plan = plan_join(parsed.premises, self.facts)
+        compiled = self._compiled_rule(parsed)
+        if compiled is not None:
+            compiled.matcher(plan.order)
 
-    def forward_chain(self, max_iterations: int = 50) -> None:
-        for _ in range(max_iterations):
-            added_any = False
-            for rule in self.rules:
-                for subs in self._satisfying_substitutions(rule.premises):
-                    conclusion = rule.conclusion
-                    
-                    # === 수정 포인트: EXISTS 처리 로직 ===
-                    if is_exists(conclusion):
-                        # 이미 이 결론을 만족하는 사실이 하나라도 있는지 확인 (매우 중요)
-                        # 예: (?x: mia)일 때 ("loves", "mia", ?y) 형태의 사실이 이미 있는지 query
-                        pattern = substitute(conclusion[2], subs)
-                        if self.query(pattern):
-                            continue # 이미 있으면 새로운 스콜렘 상수를 만들지 않고 건너뜀
-                        
-                        new_fact = self._instantiate_exists(substitute(conclusion, subs))
+    def ingest(self, source, batch_size: int = 10000, chain: bool = True, max_iterations: Optional[int] = None, on_batch=None):
+        """Stream facts (tuples, ``parent(alice,bob)`` lines or a file path) in batches; see ingest.ingest."""
+        from ingest import ingest
+
+        return ingest(self, source, batch_size=batch_size, chain=chain, max_iterations=max_iterations, on_batch=on_batch)
+
+    def save(self, path: str) -> None:
+        """Write a binary snapshot to ``path`` and start a fresh write-ahead log next to it."""
+        from persistence import save_kb
+
+        save_kb(self, path)
+
+    @classmethod
+    def load(cls, path: str, compile_rules: bool = True) -> "KB":
+        """Open a snapshot (relations are decoded on first use) and replay its log."""
+        from persistence import load_kb
+
+        return load_kb(path, compile_rules=compile_rules)
+
+    def checkpoint(self) -> None:
+        # 로그를 스냅숏에 합치고 비움
+        if self._snapshot_path is None:
+            raise ValueError("checkpoint() needs a KB that was saved or loaded")
+        self.save(self._snapshot_path)
+
+    def _compiled_rule(self, rule: Rule) -> Optional[CompiledRule]:
+        entry = self._compiled.get(id(rule))
+        if entry is None or entry[0] is not rule:
+            compiled = CompiledRule(rule) if CompiledRule.supports(rule) else None
+            entry = self._compiled.put(id(rule), (rule, compiled))
+        return entry[1]
+
+    def _fire(
+        self,
+        rule: Rule,
+        order: Sequence[int],
+        delta: Optional[FactStore] = None,
+        delta_idx: int = -1,
+        seed: Optional[Predicate] = None,
+        counts: Optional[List[int]] = None,
+    ) -> Iterator[Predicate]:
+        """Conclusions of ``rule`` for one join order; ``seed`` pins premise ``delta_idx`` to one fact.
+
+        ``counts``, when given, accumulates [candidates, unifications, premise
+        matches, complete matches] for profiling.
+        """
+        compiled = self._compiled_rule(rule) if self.compile_rules else None
+        if compiled is not None:
+            results = compiled.run(self.facts, order, delta, delta_idx, seed, counts)
+            if not compiled.existential:
+                yield from results
+                return
+            matches: Iterable[Substitution] = results
+        elif seed is not None:
+            subs = unify(rule.premises[delta_idx], seed)
+            matches = self._join(rule.premises, order, start=1, subs=subs, counts=counts) if subs is not None else ()
+        else:
+            matches = self._join(rule.premises, order, delta, delta_idx, counts=counts)
+        for subs in matches:
+            new_fact = self._conclude(rule, subs)
+            if new_fact is not None:
+                yield new_fact
+
+    def explain(self, rule: object) -> JoinPlan:
+        """Join order and estimated cost the planner picks for ``rule`` right now.
+
+        ``rule`` may be a Rule, an index into ``self.rules`` or an unparsed rule.
+        """
+        if isinstance(rule, int):
+            parsed = self.rules[rule]
+        else:
+            parsed = rule if isinstance(rule, Rule) else self._parse_rule(rule)
+        return plan_join(parsed.premises, self.facts)
+
+    def retract_fact(self, fact: Predicate, max_iterations: Optional[int] = None) -> bool:
+        """Withdraw an asserted fact and every conclusion that loses its last derivation.
+
+        Delete-and-Rederive: over-delete everything derived through ``fact``,
+        restore the deleted facts that still have a derivation from what is
+        left, re-fire the existential rule instances whose witness was
+        deleted, then propagate from the restored facts to a fixpoint (or
+        ``max_iterations``). The work is proportional to the derivations that
+        touched ``fact``. Returns True if ``fact`` is no longer in the KB (it
+        stays if other facts still derive it).
+        """
+        if fact not in self.facts:
+            return False
+        if self._wal is not None:
+            self._wal.retract(fact)
+        self._asserted.discard(fact)
+        doomed = {fact}
+        worklist = [fact]
+        while worklist:
+            removed = worklist.pop()
+            for consequence in self._consequences_of(removed):
+                if consequence in self.facts and consequence not in doomed and consequence not in self._asserted:
+                    doomed.add(consequence)
+                    worklist.append(consequence)
+        for removed in doomed:
+            self.facts.discard(removed)
+            self._bump(removed)
+
+        restored = FactStore()
+        for removed in doomed:
+            if self._has_derivation(removed):
+                self.facts.add(removed)
+                self._bump(removed)
+                restored.add(removed)
+        for removed in doomed:
+            if removed not in self.facts and removed in self._skolem_origins:
+                rule, bound = self._skolem_origins.pop(removed)
+                self._skolem_facts.pop(_skolem_key(rule, bound), None)
+        for witness in self._rewitness(doomed):
+            restored.add(witness)
+        if restored:
+            # 상한에서 조용히 멈추면 남은 근거로 도출되는 사실이 빠지므로 기본은 고정점까지 돌림
+            self._forward_chain_semi_naive(sys.maxsize if max_iterations is None else max_iterations, delta=restored)
+        # 과삭제와 재도출을 모두 끝낸 뒤 한 번에 발행함
+        self._publish()
+        return fact not in self.facts
+
+    def _rewitness(self, doomed: Set[Predicate]) -> Iterator[Predicate]:
+        # 지워진 사실이 다른 존재 규칙 인스턴스의 증인이었을 수 있음 (그 인스턴스는 증인이 있어 스콜렘을 만들지 않았음)
+        # 증인을 잃은 인스턴스를 다시 발화해, 다른 증인이 없으면 새 스콜렘 사실을 만듦
+        for rule in self.rules:
+            if not is_exists(rule.conclusion):
+                continue
+            existential = _exists_variables(rule.conclusion)
+            for removed in doomed:
+                if removed in self.facts:
+                    continue
+                head_subs = unify(rule.conclusion[2], removed)
+                if head_subs is None:
+                    continue
+                bound = {var: value for var, value in head_subs.items() if var not in existential}
+                order = plan_join([substitute(p, bound) for p in rule.premises], self.facts).order
+                for subs in self._join(rule.premises, order, subs=bound):
+                    new_fact = self._conclude(rule, subs)
+                    if new_fact is not None and self._derive(new_fact):
+                        yield new_fact
+
+    def _consequences_of(self, fact: Predicate) -> Iterator[Predicate]:
+        # fact를 전제 하나로 사용하는 모든 규칙 인스턴스의 결론 (삭제 전 상태 기준)
+        for rule in self.rules:
+            for premise_idx, premise in enumerate(rule.premises):
+                seed = unify(premise, fact)
+                if seed is None:
+                    continue
+                order = plan_join(rule.premises, self.facts, delta_idx=premise_idx).order
+                for subs in self._join(rule.premises, order, start=1, subs=seed):
+                    if is_exists(rule.conclusion):
+                        yield from self._skolem_facts_for(rule, subs)
                     else:
-                        new_fact = substitute(conclusion, subs)
-                    
-                    if self.add_fact(new_fact):
+                        yield substitute(rule.conclusion, subs)
+
+    def _skolem_facts_for(self, rule: Rule, subs: Substitution) -> Iterator[Predicate]:
+        fact = self._skolem_facts.get(_skolem_key(rule, subs))
+        if fact is not None:
+            yield fact
+
+    def _has_derivation(self, fact: Predicate) -> bool:
+        if fact in self._asserted:
+            return True
+        origin = self._skolem_origins.get(fact)
+        if origin is not None:
+            rule, bound = origin
+            return next(self._join(rule.premises, plan_join(rule.premises, self.facts).order, subs=bound), None) is not None
+        for rule in self.rules:
+            if is_exists(rule.conclusion):
+                continue
+            head_subs = unify(rule.conclusion, fact)
+            if head_subs is None:
+                continue
+            order = plan_join([substitute(p, head_subs) for p in rule.premises], self.facts).order
+            if next(self._join(rule.premises, order, subs=head_subs), None) is not None:
+                return True
+        return False
+
+    def forward_chain(
+        self,
+        max_iterations: int = 50,
+        engine: str = "semi_naive",
+        goal: Optional[Predicate] = None,
+        profile: bool = False,
+        workers: Optional[int] = None,
+    ) -> None:
+        """Run rules to a fixpoint (or ``max_iterations``).
+
+        ``workers`` is the process count for ``engine="parallel"`` (default:
+        one per CPU) and is ignored by the other engines.
+
+        With ``profile=True`` or a ``stats_hook`` set, per-rule, per-iteration
+        counters are collected into ``self.stats`` (a ChainStats) and passed to
+        the hook; only the semi_naive and naive engines are instrumented.
+        """
+        if not (profile or self.stats_hook is not None):
+            self._run_engine(max_iterations, engine, goal, workers)
+            return
+        if engine not in ("semi_naive", "naive"):
+            raise ValueError(f"Profiling is not supported for the {engine} engine")
+        stats = self._stats = ChainStats(engine="magic" if goal is not None else engine, max_iterations=max_iterations)
+        started = time.perf_counter()
+        try:
+            self._run_engine(max_iterations, engine, goal, workers)
+        finally:
+            self._stats = None
+            stats.seconds = time.perf_counter() - started
+            self.stats = stats
+        if self.stats_hook is not None:
+            self.stats_hook(stats)
+
+    def _run_engine(
+        self, max_iterations: int, engine: str, goal: Optional[Predicate], workers: Optional[int] = None
+    ) -> None:
+        self._log_chain(max_iterations, goal)
+        if goal is not None:
+            self._forward_chain_magic(goal, max_iterations)
+        elif engine == "semi_naive":
+            self._forward_chain_semi_naive(max_iterations)
+        elif engine == "naive":
+            self._forward_chain_naive(max_iterations)
+        elif engine == "rete":
+            self._forward_chain_incremental(max_iterations)
+        elif engine == "columnar":
+            # NumPy 기반 집합 단위 조인 (선택적 의존성이므로 필요할 때만 불러옴)
+            from columnar import ColumnarEngine
+
+            ColumnarEngine(self).run(max_iterations)
+        elif engine == "parallel":
+            # 프로세스 풀에서 delta를 조인 키 해시로 나눠 평가함
+            from parallel import ParallelEngine
+
+            ParallelEngine(self, workers).run(max_iterations)
+        else:
+            raise ValueError(f"Unknown chaining engine: {engine}")
+        self._publish()
+
+    def _forward_chain_naive(self, max_iterations: int) -> None:
+        # 매 반복마다 모든 규칙을 전체 사실 집합에 다시 적용함 (비교용)
+        stats = self._stats
+        for iteration in range(max_iterations):
+            added_any = False
+            if stats is not None:
+                stats.iterations = iteration + 1
+            for idx, rule in enumerate(self.rules):
+                plan = plan_join(rule.premises, self.facts)
+                if stats is not None:
+                    counts = [0, 0, 0, 0]
+                    added_any |= bool(self._derive_profiled(idx, iteration, self._fire(rule, plan.order, counts=counts), counts))
+                    continue
+                for new_fact in self._fire(rule, plan.order):
+                    if self._derive(new_fact):
                         added_any = True
-            
+
             if not added_any:
+                if stats is not None:
+                    stats.reached_fixpoint = True
+                self._reached_fixpoint()
                 break
+            self._publish()
 
-    def query(self, pattern: Predicate) -> List[Substitution]:
-        results = []
-        for fact in self.facts:
-            subs = unify(pattern, fact)
-            if subs is not None:
-                results.append(subs)
-        return results
+    def _forward_chain_semi_naive(
+        self,
+        max_iterations: int,
+        rules: Optional[List[Rule]] = None,
+        delta: Optional[FactStore] = None,
+    ) -> None:
+        # 각 반복에서 전제 중 최소 하나는 직전 반복에서 새로 도출된 사실(delta)과 매칭함
+        if rules is not None or delta is not None:
+            # 목표 지향 실행(DRed, magic, ingest)은 주어진 delta에서 시작하는 한 덩어리 루프로 돌림
+            rules = self.rules if rules is None else rules
+            _drain(self._semi_naive_steps(list(enumerate(rules)), max_iterations, delta, goal_directed=True))
+            return
+        # 전체 실행은 SCC 층을 위상 순서로 평가: 아래 층은 이미 완성되어 있으므로
+        # 비재귀 층은 한 번만 발화하고, 재귀 층만 자기 국소 고정점까지 반복함
+        stats = self._stats
+        complete = True
+        for stratum in self.schedule():
+            indexed = [(idx, self.rules[idx]) for idx in stratum.rules]
+            complete &= _drain(self._semi_naive_steps(indexed, max_iterations, None, recursive=stratum.recursive))
+        if stats is not None:
+            stats.reached_fixpoint = complete
+        # 상한에 걸려 멈췄으면 rete agenda에 남은 토큰을 다음 incremental 실행이 이어받아야 함
+        if complete:
+            self._reached_fixpoint()
+
+    def schedule(self) -> List[Stratum]:
+        """The strata the semi-naive engine evaluates, in order (see ``stratify``)."""
+        return stratify(self.rules)
+
+    def chain_session(self, max_iterations: int = 50, firings: Optional[int] = None, budget_ms: Optional[float] = None):
+        """A resumable session.ChainSession that chains in bounded slices."""
+        from session import ChainSession
+
+        return ChainSession(self, max_iterations, firings, budget_ms)
+
+    def _semi_naive_steps(
+        self,
+        indexed: List[Tuple[int, Rule]],
+        max_iterations: int,
+        delta: Optional[FactStore],
+        goal_directed: bool = False,
+        recursive: bool = True,
+        stepping: bool = False,
+    ) -> Generator[Optional[bool], None, bool]:
+        # 고정점에 도달했으면 True를 반환; 비재귀 층은 한 번 발화하면 끝남
+        # stepping이면 결론 하나를 처리할 때마다 (새 사실인지)를 yield해서 호출한 쪽이 중간에 멈출 수 있음
+        # 결론이 없어도 바깥 후보 하나/폐포 출발점 하나마다 None을 yield하므로 긴 조인 안에서도 멈출 수 있음
+        rules = [rule for _, rule in indexed]
+        # 전체 실행에서는 선형 재귀(추이 폐포) 규칙을 반복 대신 BFS 폐포 계산으로 처리함
+        closures = [] if goal_directed else [
+            ClosureSpec(indexed[spec.rule_index][0], spec.step, spec.target, spec.direction)
+            for spec in find_closures(rules)
+        ]
+        closure_rules = {spec.rule_index for spec in closures}
+        closure_inputs: Dict[int, Tuple[int, int]] = {}
+        stats = self._stats
+        for iteration in range(max_iterations):
+            new_delta = FactStore()
+            if stats is not None:
+                stats.iterations += 1
+            for rule_index, rule in indexed:
+                if rule_index in closure_rules:
+                    continue
+                counts = None if stats is None else [0, 0, 0, 0]
+                if stepping and counts is None and rule.premises:
+                    for new_fact in self._seeded_conclusions(rule, delta):
+                        if new_fact is None:
+                            yield None
+                        elif self._derive(new_fact):
+                            new_delta.add(new_fact)
+                            yield True
+                        else:
+                            yield False
+                    continue
+                if rule.premises and delta is None:
+                    # 첫 반복은 모든 사실이 delta이므로 이전 사실이 없어 전체 조인 한 번이면 충분함
+                    conclusions = self._fire(rule, plan_join(rule.premises, self.facts).order, counts=counts)
+                elif rule.premises:
+                    conclusions = self._delta_conclusions(rule, delta, counts)
+                elif iteration == 0 and not goal_directed:
+                    conclusions = self._fire(rule, (), counts=counts)
+                else:
+                    continue
+                if counts is not None:
+                    new_delta |= self._derive_profiled(rule_index, stats.iterations - 1, conclusions, counts)
+                    continue
+                for new_fact in conclusions:
+                    if self._derive(new_fact):
+                        new_delta.add(new_fact)
+                        if stepping:
+                            yield True
+                    elif stepping:
+                        yield False
+            for spec in closures:
+                started = time.perf_counter()
+                if stepping:
+                    added = yield from self._closure_steps(spec, closure_inputs)
+                else:
+                    added = self._apply_closure(spec, closure_inputs)
+                new_delta |= added
+                if stats is not None:
+                    stats.rules.append(RuleStats(
+                        spec.rule_index, stats.iterations - 1, added=len(added), seconds=time.perf_counter() - started
+                    ))
+
+            if not new_delta or not recursive:
+                if goal_directed:
+                    if stats is not None:
+                        stats.reached_fixpoint = True
+                else:
+                    self._publish()
+                return True
+            if not goal_directed:
+                # 반복 하나가 끝날 때마다 발행; 목표 지향 실행(DRed, magic)은 호출한 쪽이 끝에서 발행함
+                self._publish()
+            delta = new_delta
+        return False
+
+    def _derive_profiled(
+        self, rule_index: int, iteration: int, conclusions: Iterable[Predicate], counts: List[int]
+    ) -> List[Predicate]:
+        # 결론 생성기는 지연 평가되므로 소비하는 동안의 시간이 곧 규칙의 조인 시간임
+        started = time.perf_counter()
+        added = []
+        produced = 0
+        for new_fact in conclusions:
+            produced += 1
+            if self._derive(new_fact):
+                added.append(new_fact)
+        candidates, unifications, matched, substitutions = counts
+        self._stats.rules.append(RuleStats(
+            rule_index=rule_index,
+            iteration=iteration,
+            candidates=candidates,
+            unifications=unifications,
+            failures=unifications - matched,
+            substitutions=substitutions,
+            added=len(added),
+            duplicates=produced - len(added),
+            seconds=time.perf_counter() - started,
+        ))
+        return added
+
+    def _seeded_conclusions(self, rule: Rule, delta: Optional[FactStore]) -> Iterator[Optional[Predicate]]:
+        # _delta_conclusions와 같은 결론을, 바깥 전제의 후보 하나씩 seed로 조인하며 후보마다 None을 끼워 냄
+        for delta_idx in [None] if delta is None else range(len(rule.premises)):
+            if delta_idx is None:
+                order = plan_join(rule.premises, self.facts).order
+                outer, source = order[0], self.facts
+            else:
+                order = plan_join(rule.premises, self.facts, delta, delta_idx).order
+                outer, source = delta_idx, delta
+            for seed in source.candidates(rule.premises[outer]):
+                yield from self._fire(rule, order, delta, outer, seed=seed)
+                yield None
+
+    def _apply_closure(self, spec: ClosureSpec, seen_inputs: Dict[int, Tuple[int, int]]) -> List[Predicate]:
+        added = []
+        for pairs in self._closure_sources(spec, seen_inputs):
+            for x, z in pairs:
+                new_fact = (spec.target, x, z)
+                if self._derive(new_fact):
+                    added.append(new_fact)
+        return added
+
+    def _closure_steps(
+        self, spec: ClosureSpec, seen_inputs: Dict[int, Tuple[int, int]]
+    ) -> Generator[Optional[bool], None, List[Predicate]]:
+        # _apply_closure와 같지만 도출한 사실마다 (새 사실인지)를, 출발점 하나가 끝날 때마다 None을 yield함
+        added = []
+        for pairs in self._closure_sources(spec, seen_inputs):
+            for x, z in pairs:
+                new_fact = (spec.target, x, z)
+                if self._derive(new_fact):
+                    added.append(new_fact)
+                    yield True
+                else:
+                    yield False
+            yield None
+        return added
 
-    def _satisfying_substitutions(self, premises: Sequence[Predicate]) -> Iterator[Substitution]:
-        def recursive_search(idx: int, current_subs: Substitution) -> Iterator[Substitution]:
-            if idx == len(premises):
-                yield current_subs
+    def _closure_sources(self, spec: ClosureSpec, seen_inputs: Dict[int, Tuple[int, int]]) -> Iterator[List[Tuple[Term, Term]]]:
+        # 지난번 이후 step/target이 그대로면 폐포도 그대로이므로 건너뜀
+        step_key, target_key = (spec.step, 3), (spec.target, 3)
+        inputs = (self.facts.cardinality(step_key), self.facts.cardinality(target_key))
+        if seen_inputs.get(spec.rule_index) == inputs:
+            return
+        step = [(fact[1], fact[2]) for fact in self.facts.relation(step_key)]
+        target = [(fact[1], fact[2]) for fact in self.facts.relation(target_key)]
+        yield from _closure_by_source(step, target, spec.direction)
+        seen_inputs[spec.rule_index] = (self.facts.cardinality(step_key), self.facts.cardinality(target_key))
+
+    def _forward_chain_magic(self, goal: Predicate, max_iterations: int) -> None:
+        # 질의의 바인딩 패턴에 기여할 수 있는 사실만 도출하고, 보조 magic 사실은 끝나면 지움
+        rules, seed = magic_rewrite(self.rules, goal)
+        if not rules:
+            return
+        magic_keys = {relation_key(rule.conclusion) for rule in rules if rule.conclusion[0].startswith("magic_")}
+        magic_keys.add(relation_key(seed))
+        self._derive(seed)
+        try:
+            self._forward_chain_semi_naive(max_iterations, rules)
+        finally:
+            for key in magic_keys:
+                for fact in list(self.facts.relation(key)):
+                    self.facts.discard(fact)
+                    self._bump(fact)
+            # 재작성 규칙은 이 질의에서만 쓰이므로 컴파일 결과도 같이 버림
+            for rule in rules:
+                self._compiled.pop(id(rule))
+
+    def _forward_chain_incremental(self, max_iterations: int) -> None:
+        # add_fact가 쌓아 둔 토큰만 해당 술어를 전제로 가진 규칙에 흘려보냄
+        if self._network is None:
+            self._network = MatchNetwork()
+        network = self._network
+        network.sync(self.rules)
+        for _ in range(max_iterations):
+            unprimed, network.unprimed = network.unprimed, []
+            tokens, network.agenda = network.agenda, []
+            if not unprimed and not tokens:
+                break
+            for rule_idx in unprimed:
+                rule = self.rules[rule_idx]
+                for new_fact in self._fire(rule, plan_join(rule.premises, self.facts).order):
+                    self._derive(new_fact)
+            orders: Dict[Tuple[int, int], Tuple[int, ...]] = {}
+            for fact in tokens:
+                if fact not in self.facts:
+                    continue
+                for rule_idx, premise_idx in network.activations(fact):
+                    rule = self.rules[rule_idx]
+                    order = orders.get((rule_idx, premise_idx))
+                    if order is None:
+                        order = plan_join(rule.premises, self.facts, delta_idx=premise_idx).order
+                        orders[(rule_idx, premise_idx)] = order
+                    for new_fact in self._fire(rule, order, delta_idx=premise_idx, seed=fact):
+                        self._derive(new_fact)
+
+    def _reached_fixpoint(self) -> None:
+        if self._network is not None:
+            self._network.sync(self.rules)
+            self._network.clear()
+
+    def _conclude(self, rule: Rule, subs: Substitution) -> Optional[Predicate]:
+        conclusion = rule.conclusion
+        # === 수정 포인트: EXISTS 처리 로직 ===
+        if is_exists(conclusion):
+            # 재작성된 규칙도 원래 규칙으로 스콜렘화해야 전방 추론과 같은 상수가 나오고 retract가 근거를 찾음
+            rule = rule.source or rule
+            # 이미 이 결론을 만족하는 사실이 하나라도 있는지 인덱스로 확인 (매우 중요)
+            # 예: (?x: mia)일 때 ("loves", "mia", ?y) 형태의 사실이 이미 있는지 확인
+            pattern = substitute(conclusion[2], subs)
+            if self._has_witness(pattern):
+                return None  # 이미 있으면 새로운 스콜렘 상수를 만들지 않고 건너뜀
+            key = _skolem_key(rule, subs)
+            new_fact = self._instantiate_exists(substitute(conclusion, subs), key)
+            # retract_fact가 이 스콜렘 사실의 근거를 다시 찾을 수 있도록 규칙과 바인딩을 기록함
+            self._skolem_origins[new_fact] = (rule, dict(key[1]))
+            self._skolem_facts[key] = new_fact
+            return new_fact
+        return substitute(conclusion, subs)
+
+    def _has_witness(self, pattern: Predicate) -> bool:
+        # query와 달리 모든 치환을 모으지 않고 인덱스 후보에서 첫 일치만 찾음
+        return any(unify(pattern, fact) is not None for fact in self.facts.candidates(pattern))
+
+    def prove(self, pattern: Predicate) -> List[Substitution]:
+        """Answer ``pattern`` by tabled backward chaining, without materializing the KB."""
+        return TabledProver(self).prove(pattern)
+
+    def query(self, pattern: Predicate, mode: str = "forward") -> List[Substitution]:
+        cache = self.query_cache
+        if cache is None or relation_key(pattern) is None:
+            return list(self.iter_query(pattern, mode=mode))
+        # 변수 이름만 다른 질의는 같은 항목을 쓰도록 ?0, ?1, ...로 바꾼 패턴을 키로 씀
+        names = _variables_in_order(pattern)
+        canonical = {var: f"?{i}" for i, var in enumerate(names)}
+        key = (mode, canonical_variant(pattern))
+        cached = cache.get(key, self._version_stamp(pattern[0]))
+        if cached is None:
+            answers = list(self.iter_query(pattern, mode=mode))
+            # magic/backward 질의는 사실을 추가할 수 있으므로 답을 구한 뒤의 버전을 기록함
+            cache.put(key, self._version_stamp(pattern[0]), [
+                {canonical.get(var, var): value for var, value in subs.items()} for subs in answers
+            ])
+            return answers
+        original = {alias: var for var, alias in canonical.items()}
+        return [{original.get(var, var): value for var, value in subs.items()} for subs in cached]
+
+    def _version_stamp(self, predicate: str) -> Tuple[int, ...]:
+        closure = self._dependency_closure.get(predicate)
+        if closure is None:
+            graph = rule_dependencies(self.rules)
+            seen = {predicate}
+            stack = [predicate]
+            while stack:
+                for dependency in graph.get(stack.pop(), ()):
+                    if dependency not in seen:
+                        seen.add(dependency)
+                        stack.append(dependency)
+            closure = self._dependency_closure[predicate] = tuple(sorted(seen))
+        versions = self._versions
+        stamp = (self._rules_version,) + tuple(versions.get(name, 0) for name in closure)
+        if self._versioned:
+            # 읽기는 발행된 epoch 기준이므로 발행이 바뀌면 다시 계산함
+            stamp += (self.facts.epoch,)
+        return stamp
+
+    def iter_query(
+        self,
+        patterns: Term,
+        select: Optional[Sequence[str]] = None,
+        distinct: bool = False,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        mode: str = "forward",
+        facts=None,
+        max_iterations: Optional[int] = None,
+    ) -> Iterator[Substitution]:
+        """Lazily yield answers to one pattern or a conjunction (list / ("AND", a, b)).
+
+        Answers come straight out of the join, so ``limit`` stops the scan as
+        soon as enough answers are produced. ``select`` keeps only the given
+        variables and ``distinct`` drops repeated (projected) answers.
+        ``facts`` reads from another fact view, e.g. a snapshot's; with
+        versioned storage forward queries read the last published epoch.
+        ``mode="magic"`` chains each pattern to a fixpoint unless
+        ``max_iterations`` caps it, in which case answers may be missing.
+        """
+        premises = self._normalize_premises(patterns)
+        if facts is None and self._versioned and mode == "forward":
+            facts = self.facts.at()
+        if facts is not None:
+            if mode != "forward":
+                raise ValueError("Only forward queries can read from a snapshot")
+            answers = self._satisfying_substitutions(premises, facts)
+        elif mode == "backward":
+            answers = self._proved_substitutions(premises, TabledProver(self), {})
+        elif mode in ("forward", "magic"):
+            if mode == "magic":
+                # forward_chain의 기본 상한(50)을 쓰면 긴 사슬의 답이 조용히 잘리므로 고정점까지 돌림
+                cap = sys.maxsize if max_iterations is None else max_iterations
+                for premise in premises:
+                    self.forward_chain(cap, goal=premise)
+            answers = self._satisfying_substitutions(premises)
+        else:
+            raise ValueError(f"Unknown query mode: {mode}")
+        if select is not None:
+            fields = tuple(select)
+            answers = ({var: subs[var] for var in fields if var in subs} for subs in answers)
+        if distinct:
+            answers = _distinct_substitutions(answers)
+        return islice(answers, offset, None if limit is None else offset + limit)
+
+    def _proved_substitutions(
+        self, premises: Sequence[Predicate], prover: TabledProver, subs: Substitution
+    ) -> Iterator[Substitution]:
+        # 하나의 prover를 공유하므로 앞 패턴에서 만든 답 테이블을 뒤 패턴이 재사용함
+        if not premises:
+            yield subs
+            return
+        for answer in prover.prove(resolve(premises[0], subs)):
+            yield from self._proved_substitutions(premises[1:], prover, {**subs, **answer})
+
+    def _satisfying_substitutions(self, premises: Sequence[Predicate], facts=None) -> Iterator[Substitution]:
+        facts = self.facts if facts is None else facts
+        return self._join(premises, plan_join(premises, facts).order, facts=facts)
+
+    def _delta_conclusions(
+        self, rule: Rule, delta: FactStore, counts: Optional[List[int]] = None
+    ) -> Iterator[Predicate]:
+        # i번째 전제는 delta에서, 그 앞의 전제는 delta 이전의 사실에서, 뒤의 전제는 전체 사실에서 찾음
+        for delta_idx in range(len(rule.premises)):
+            plan = plan_join(rule.premises, self.facts, delta, delta_idx)
+            yield from self._fire(rule, plan.order, delta, delta_idx, counts=counts)
+
+    def _join(
+        self,
+        premises: Sequence[Predicate],
+        order: Sequence[int],
+        delta: Optional[FactStore] = None,
+        delta_idx: int = -1,
+        start: int = 0,
+        subs: Optional[Substitution] = None,
+        counts: Optional[List[int]] = None,
+        facts=None,
+    ) -> Iterator[Substitution]:
+        # order는 전제를 매칭할 순서(plan_join 결과)이며, 결과 치환은 순서와 무관함
+        # start > 0이면 order[:start]의 전제는 이미 subs로 매칭된 것으로 봄
+        bindings = Bindings(subs)
+        facts = self.facts if facts is None else facts
+
+        def recursive_search(step: int) -> Iterator[Substitution]:
+            if step == len(order):
+                if counts is not None:
+                    counts[3] += 1
+                yield dict(bindings.values)
                 return
-            current_premise = substitute(premises[idx], current_subs)
+            idx = order[step]
+            premise = premises[idx]
 
-            for fact in list(self.facts): 
-                new_subs = unify(current_premise, fact, current_subs.copy())
-                if new_subs is not None:
-                    yield from recursive_search(idx + 1, new_subs)
-        return recursive_search(0, {})
+            source = delta if idx == delta_idx else facts
+            for fact in source.candidates(bindings.resolve(premise)):
+                if counts is not None:
+                    counts[0] += 1
+                if idx < delta_idx and fact in delta:
+                    continue
+                if counts is not None:
+                    counts[1] += 1
+                mark = len(bindings.trail)
+                if unify_into(premise, fact, bindings):
+                    if counts is not None:
+                        counts[2] += 1
+                    yield from recursive_search(step + 1)
+                    bindings.undo(mark)
+        return recursive_search(start)
 
-    def _instantiate_exists(self, expr: Term) -> Predicate:
+    def _instantiate_exists(self, expr: Term, key: Optional[SkolemKey] = None) -> Predicate:
         # === 수정: 변수가 리스트 ["?y"]로 들어오는 경우를 처리함 ===
         vars_to_replace = expr[1]
         if isinstance(vars_to_replace, str):
             vars_to_replace = [vars_to_replace]
-            
+
         predicate_template = expr[2]
-        subs = {}
-        for var in vars_to_replace:
-            # 테스트 케이스가 요구하는 "_sk" 접두사 사용
-            skolem_constant = f"_sk{self._exist_counter}"
-            self._exist_counter += 1
-            subs[var] = skolem_constant
+        if key is None:
+            key = ("", (("", expr),))
+        # 테스트 케이스가 요구하는 "_sk" 접두사 사용; 같은 규칙 인스턴스는 항상 같은 상수를 받음
+        subs = self.skolems.constants(key, vars_to_replace)
         return substitute(predicate_template, subs)
 
     def _parse_rule(self, expr: Term) -> Rule:
@@ -195,4 +2199,29 @@ class KB:
         return (raw,)
 
 
-__all__ = ["KB", "Rule", "unify", "substitute", "is_variable"]
\ No newline at end of file
+__all__ = [
+    "KB",
+    "Rule",
+    "FactStore",
+    "JoinPlan",
+    "MatchNetwork",
+    "CompiledRule",
+    "ClosureSpec",
+    "ChainStats",
+    "QueryCache",
+    "RuleStats",
+    "SkolemTable",
+    "Stratum",
+    "SubstitutionRecord",
+    "find_closures",
+    "intern_term",
+    "stratify",
+    "TabledProver",
+    "magic_rewrite",
+    "plan_join",
+    "Bindings",
+    "unify",
+    "unify_into",
+    "substitute",
+    "is_variable",
+]
\ No newline at end of file
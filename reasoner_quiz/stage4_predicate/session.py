@@ -0,0 +1,161 @@
+﻿from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import Iterator, List, Optional
+
+from reasoner import KB, Stratum
+
+
+@dataclass
+class ChainProgress:
+    slices: int = 0
+    firings: int = 0
+    derived: int = 0
+    stratum: int = 0
+    strata: int = 0
+    seconds: float = 0.0
+    done: bool = False
+    cancelled: bool = False
+    reached_fixpoint: bool = False
+
+    def __str__(self) -> str:
+        status = "cancelled" if self.cancelled else "done" if self.done else f"stratum {self.stratum + 1}/{self.strata}"
+        return (
+            f"{status}: {self.firings} firings, {self.derived} derived in {self.slices} slices, "
+            f"{self.seconds * 1000:.1f} ms"
+        )
+
+
+class ChainSession:
+    """Stratified semi-naive chaining that runs in slices and can be resumed or cancelled.
+
+    Each ``step()`` processes at most ``firings`` rule conclusions or runs for
+    at most ``budget_ms`` milliseconds, whichever comes first, then returns a
+    ChainProgress. The join in progress is a suspended generator, so the next
+    step continues from the exact candidate it stopped at; the budget is also
+    checked between outer join candidates and closure sources, so a join that
+    derives nothing cannot overrun it. ``cancel()`` may be called from another
+    thread; it takes effect at the next such check and returns once the slice
+    in progress has stopped, and the facts derived so far stay in the KB.
+
+    Facts added between slices are only seen by strata that have not started
+    yet; run ``forward_chain`` afterwards to close over them. Adding rules
+    while a session is unfinished is an error.
+    """
+
+    def __init__(
+        self,
+        kb: KB,
+        max_iterations: int = 50,
+        firings: Optional[int] = None,
+        budget_ms: Optional[float] = None,
+    ) -> None:
+        if firings is not None and firings < 1:
+            raise ValueError("firings must be positive")
+        self.kb = kb
+        self.max_iterations = max_iterations
+        self.firings = firings
+        # 둘 다 없으면 대화형 호출자가 화면을 갱신할 수 있을 만큼 짧은 조각으로 나눔
+        self.budget_ms = 50.0 if firings is None and budget_ms is None else budget_ms
+        self.schedule: List[Stratum] = kb.schedule()
+        self.progress = ChainProgress(strata=len(self.schedule))
+        self._rules_version = kb._rules_version
+        self._steps = None
+        self._complete = True
+        self._cancel = threading.Event()
+        # 조각 하나를 도는 동안 잡고 있음; cancel()은 이 락을 얻은 뒤에만 _finish를 부름
+        self._lock = threading.Lock()
+
+    @property
+    def done(self) -> bool:
+        return self.progress.done
+
+    def __iter__(self) -> Iterator[ChainProgress]:
+        while not self.done:
+            yield self.step()
+
+    def step(self, firings: Optional[int] = None, budget_ms: Optional[float] = None) -> ChainProgress:
+        """Run one slice and return a copy of the progress so far."""
+        if firings is None and budget_ms is None:
+            firings, budget_ms = self.firings, self.budget_ms
+        return self._advance(firings, budget_ms)
+
+    def run(self) -> ChainProgress:
+        """Run the remaining work in one go."""
+        return self._advance(None, None)
+
+    def cancel(self) -> None:
+        # 도는 중이면 그 스레드가 다음 확인에서 멈추고 락을 놓음; 이미 끝났으면 _finish는 아무것도 안 함
+        self._cancel.set()
+        with self._lock:
+            self._finish(cancelled=True)
+
+    def _advance(self, firings: Optional[int], budget_ms: Optional[float]) -> ChainProgress:
+        with self._lock:
+            return self._slice(firings, budget_ms)
+
+    def _slice(self, firings: Optional[int], budget_ms: Optional[float]) -> ChainProgress:
+        progress = self.progress
+        if progress.done:
+            return replace(progress)
+        if self.kb._rules_version != self._rules_version:
+            raise RuntimeError("KB rules changed while a ChainSession was unfinished")
+        started = time.perf_counter()
+        deadline = None if budget_ms is None else started + budget_ms / 1000
+        fired = 0
+        progress.slices += 1
+        try:
+            while True:
+                if self._cancel.is_set():
+                    self._finish(cancelled=True)
+                    break
+                if self._steps is None:
+                    if progress.stratum >= len(self.schedule):
+                        self._finish()
+                        break
+                    stratum = self.schedule[progress.stratum]
+                    indexed = [(idx, self.kb.rules[idx]) for idx in stratum.rules]
+                    self._steps = self.kb._semi_naive_steps(
+                        indexed, self.max_iterations, None, recursive=stratum.recursive, stepping=True
+                    )
+                try:
+                    added = next(self._steps)
+                except StopIteration as stop:
+                    # 층 하나가 끝남: 국소 고정점에 닿았는지 기록하고 다음 층으로 넘어감
+                    self._complete &= stop.value
+                    self._steps = None
+                    progress.stratum += 1
+                    continue
+                if added is not None:
+                    fired += 1
+                    progress.firings += 1
+                    progress.derived += added
+                    if firings is not None and fired >= firings:
+                        break
+                # None은 결론 없이 지나간 조인 후보/폐포 출발점: 발화는 아니지만 예산은 여기서도 확인함
+                if deadline is not None and time.perf_counter() >= deadline:
+                    break
+        finally:
+            progress.seconds += time.perf_counter() - started
+        return replace(progress)
+
+    def _finish(self, cancelled: bool = False) -> None:
+        if self.progress.done:
+            return
+        if self._steps is not None:
+            self._steps.close()
+            self._steps = None
+        self.progress.done = True
+        self.progress.cancelled = cancelled
+        self.progress.reached_fixpoint = self._complete and not cancelled
+        if self.progress.reached_fixpoint:
+            self.kb._reached_fixpoint()
+        if self.progress.derived:
+            # 중간에 멈춘 세션은 단계 그대로 재생할 수 없으므로 load는 고정점까지 추론함 (여전히 함의되는 사실만 늘어남)
+            self.kb._log_chain(None)
+        self.kb._publish()
+
+
+__all__ = ["ChainProgress", "ChainSession"]
@@ -1,4 +1,6 @@
-from reasoner import KB, unify
+import pytest
+
+from reasoner import KB, TabledProver, stratify, unify
 
 
 def test_transitive_ancestor():
@@ -73,4 +75,727 @@ def test_unify_handles_nested_structures():
     left = ("likes", "?x", ("pair", "?x", "?y"))
     right = ("likes", "mia", ("pair", "mia", "cello"))
     result = unify(left, right, {})
-    assert result == {"?x": "mia", "?y": "cello"}
\ No newline at end of file
+    assert result == {"?x": "mia", "?y": "cello"}
+
+def _family_tree_kb(depth: int) -> KB:
+    facts = [("parent", f"p{i}", f"p{i + 1}") for i in range(depth)]
+    rules = [
+        ("FORALL", ["?x", "?y"], ("IMPLIES", [("parent", "?x", "?y")], ("ancestor", "?x", "?y"))),
+        (
+            "FORALL",
+            ["?x", "?y", "?z"],
+            ("IMPLIES", [("parent", "?x", "?y"), ("ancestor", "?y", "?z")], ("ancestor", "?x", "?z")),
+        ),
+    ]
+    return KB(facts=facts, rules=rules)
+
+
+def test_semi_naive_matches_naive_fixpoint():
+    semi = _family_tree_kb(8)
+    naive = _family_tree_kb(8)
+    semi.forward_chain()
+    naive.forward_chain(engine="naive")
+    assert set(semi.facts) == set(naive.facts)
+    assert ("ancestor", "p0", "p8") in semi.facts
+
+
+def test_fact_store_narrows_candidates_by_bound_argument():
+    kb = _family_tree_kb(20)
+    kb.forward_chain()
+    candidates = list(kb.facts.candidates(("ancestor", "?y", "p3")))
+    assert len(candidates) == 3
+    assert all(fact[2] == "p3" for fact in candidates)
+    assert list(kb.facts.candidates(("ancestor", "?y", "nobody"))) == []
+
+
+def test_fact_store_scan_ignores_facts_added_mid_iteration():
+    kb = KB(facts=[("parent", "a", "b"), ("parent", "b", "c")])
+    seen = []
+    for fact in kb.facts.candidates(("parent", "?x", "?y")):
+        seen.append(fact)
+        kb.add_fact(("parent", fact[2], fact[2] + "'"))
+    assert len(seen) == 2
+    assert len(kb.facts) == 4
+
+
+def test_planner_matches_selective_premise_first():
+    kb = _family_tree_kb(30)
+    kb.forward_chain()
+    rule = (
+        "FORALL",
+        ["?x", "?y", "?z"],
+        ("IMPLIES", [("ancestor", "?y", "?z"), ("parent", "?x", "?y")], ("grand", "?x", "?z")),
+    )
+    plan = kb.explain(rule)
+    assert plan.order == (1, 0)
+    assert "parent(?x, ?y)" in str(plan)
+    assert "estimated cost" in str(plan)
+
+
+def test_rete_engine_propagates_streamed_facts_incrementally():
+    kb = _family_tree_kb(5)
+    kb.forward_chain(engine="rete")
+    assert ("ancestor", "p0", "p5") in kb.facts
+    kb.add_fact(("parent", "p5", "p6"))
+    kb.add_fact(("likes", "p6", "tea"))
+    assert kb._network.agenda == [("parent", "p5", "p6")]
+    kb.forward_chain(engine="rete")
+    reference = _family_tree_kb(6)
+    reference.add_fact(("likes", "p6", "tea"))
+    reference.forward_chain()
+    assert set(kb.facts) == set(reference.facts)
+
+
+def test_capped_semi_naive_run_keeps_the_rete_agenda():
+    kb = _family_tree_kb(5)
+    kb.forward_chain(engine="rete")
+    kb.add_fact(("parent", "p5", "p6"))
+    kb.forward_chain(max_iterations=0)
+    assert kb._network.agenda == [("parent", "p5", "p6")]
+    kb.forward_chain(engine="rete")
+    reference = _family_tree_kb(6)
+    reference.forward_chain()
+    assert set(kb.facts) == set(reference.facts)
+
+
+def test_backward_query_matches_materialized_answers():
+    goal = ("ancestor", "?who", "p4")
+    backward = _family_tree_kb(10)
+    answers = backward.query(goal, mode="backward")
+    assert not any(fact[0] == "ancestor" for fact in backward.facts)
+
+    forward = _family_tree_kb(10)
+    forward.forward_chain()
+    expected = forward.query(goal)
+    assert sorted(a["?who"] for a in answers) == sorted(a["?who"] for a in expected)
+    assert len(answers) == 4
+
+
+def test_tabled_prover_evaluates_each_table_once_on_deep_chains():
+    kb = _family_tree_kb(300)
+    prover = TabledProver(kb)
+    answers = prover.prove(("ancestor", "p0", "?z"))
+    assert len(answers) == 300
+    # 새 답은 구독자에게만 전달되므로 테이블마다 규칙 본문을 한 번만 평가함
+    assert prover.evaluations == len(prover.tables)
+
+
+def test_magic_sets_only_derive_facts_for_the_bound_query():
+    goal = ("ancestor", "?who", "p4")
+    kb = _family_tree_kb(10)
+    answers = kb.query(goal, mode="magic")
+    assert sorted(a["?who"] for a in answers) == ["p0", "p1", "p2", "p3"]
+    derived = {fact for fact in kb.facts if fact[0] == "ancestor"}
+    assert all(fact[2] == "p4" for fact in derived)
+    assert not any(fact[0].startswith("magic_") for fact in kb.facts)
+
+
+def test_magic_query_runs_long_chains_to_fixpoint():
+    kb = _family_tree_kb(120)
+    answers = kb.query(("ancestor", "p0", "?z"), mode="magic")
+    assert len(answers) == 120
+    capped = _family_tree_kb(120).iter_query(("ancestor", "p0", "?z"), mode="magic", max_iterations=3)
+    assert len(list(capped)) < 120
+
+
+def test_magic_queries_drop_compiled_rewritten_rules():
+    kb = _family_tree_kb(10)
+    for i in range(10):
+        list(kb.iter_query(("ancestor", f"p{i}", "?z"), mode="magic"))
+    # 재작성 규칙의 컴파일 결과는 질의가 끝나면 버려져, 원래 규칙 수를 넘지 않음
+    assert len(kb._compiled) <= len(kb.rules)
+
+
+def test_retract_fact_removes_unsupported_conclusions():
+    kb = _family_tree_kb(4)
+    kb.add_fact(("ancestor", "p0", "p4"))
+    kb.forward_chain()
+    assert kb.retract_fact(("parent", "p1", "p2"))
+    assert ("ancestor", "p1", "p2") not in kb.facts
+    assert ("ancestor", "p0", "p3") not in kb.facts
+    assert ("ancestor", "p0", "p1") in kb.facts
+    assert ("ancestor", "p2", "p4") in kb.facts
+    # 명시적으로 추가한 사실은 다른 근거가 사라져도 남음
+    assert ("ancestor", "p0", "p4") in kb.facts
+
+    reference = _family_tree_kb(4)
+    reference.retract_fact(("parent", "p1", "p2"))
+    reference.add_fact(("ancestor", "p0", "p4"))
+    reference.forward_chain()
+    assert set(kb.facts) == set(reference.facts)
+
+
+def test_retract_fact_drops_skolem_witness_with_its_premise():
+    kb = KB(
+        facts=[("parent", "mia"), ("parent", "leo")],
+        rules=[("FORALL", ["?x"], ("IMPLIES", [("parent", "?x")], ("EXISTS", ["?y"], ("loves", "?x", "?y"))))],
+    )
+    kb.forward_chain()
+    assert kb.retract_fact(("parent", "mia"))
+    loves = [fact for fact in kb.facts if fact[0] == "loves"]
+    assert [fact[1] for fact in loves] == ["leo"]
+
+
+def test_retract_fact_rewitnesses_existentials_that_lost_their_witness():
+    loves = ("EXISTS", ["?y"], ("loves", "?x", "?y"))
+    rules = [
+        ("FORALL", ["?x"], ("IMPLIES", [("p", "?x")], loves)),
+        ("FORALL", ["?x"], ("IMPLIES", [("q", "?x")], loves)),
+    ]
+    # p(mia)의 증인이 q(mia) 인스턴스도 만족시키고 있었으므로, 지워지면 q(mia)가 새 증인을 만들어야 함
+    kb = KB(facts=[("p", "mia"), ("q", "mia")], rules=rules)
+    kb.forward_chain()
+    assert kb.retract_fact(("p", "mia"))
+    assert len([fact for fact in kb.facts if fact[:2] == ("loves", "mia")]) == 1
+
+    # 명시적으로 넣은 증인을 지우면 p(mia)에 대한 스콜렘 증인이 생겨야 함
+    kb = KB(facts=[("p", "mia"), ("loves", "mia", "bob")], rules=rules[:1])
+    kb.forward_chain()
+    assert kb.retract_fact(("loves", "mia", "bob"))
+    witnesses = [fact for fact in kb.facts if fact[:2] == ("loves", "mia")]
+    assert len(witnesses) == 1 and witnesses[0][2].startswith("_sk")
+
+
+def test_retract_fact_rederives_to_a_fixpoint():
+    def build(with_shortcut: bool) -> KB:
+        edges = [("e", f"n{i}", f"n{i + 1}") for i in range(150)] + [("e", "n0", "x"), ("e", "x", "n1")]
+        if not with_shortcut:
+            edges.remove(("e", "n0", "n1"))
+        rules = [
+            ("FORALL", ["?x", "?y"], ("IMPLIES", [("e", "?x", "?y")], ("path", "?x", "?y"))),
+            ("FORALL", ["?x", "?y", "?z"], ("IMPLIES", [("path", "?x", "?y"), ("e", "?y", "?z")], ("path", "?x", "?z"))),
+        ]
+        kb = KB(facts=edges, rules=rules)
+        kb.forward_chain(max_iterations=500)
+        return kb
+
+    kb = build(True)
+    assert kb.retract_fact(("e", "n0", "n1"))
+    assert set(kb.facts) == set(build(False).facts)
+
+
+def test_prove_and_forward_chaining_mint_the_same_skolem_constant():
+    rules = [("FORALL", ["?x"], ("IMPLIES", [("person", "?x")], ("EXISTS", ["?y"], ("loves", "?x", "?y"))))]
+    forward = KB(facts=[("person", "mia")], rules=rules)
+    forward.forward_chain()
+    backward = KB(facts=[("person", "mia")], rules=rules)
+    answers = backward.prove(("loves", "mia", "?y"))
+    assert [("loves", "mia", answer["?y"]) for answer in answers] == [
+        fact for fact in forward.facts if fact[0] == "loves"
+    ]
+    assert backward.retract_fact(("person", "mia"))
+    assert not any(fact[0] == "loves" for fact in backward.facts)
+
+
+def test_retract_fact_drops_skolem_witness_minted_by_a_magic_query():
+    rules = [("FORALL", ["?x"], ("IMPLIES", [("person", "?x")], ("EXISTS", ["?y"], ("loves", "?x", "?y"))))]
+    kb = KB(facts=[("person", "mia")], rules=rules)
+    assert len(kb.query(("loves", "mia", "?y"), mode="magic")) == 1
+    assert all(rule in kb.rules for rule, _ in kb._skolem_origins.values())
+    assert kb.retract_fact(("person", "mia"))
+    assert not any(fact[0] == "loves" for fact in kb.facts)
+
+
+def test_skolem_constants_are_memoized_per_rule_instance(tmp_path):
+    from reasoner import SkolemTable
+
+    loves_rule = ("FORALL", ["?x"], ("IMPLIES", [("parent", "?x")], ("EXISTS", ["?y"], ("loves", "?x", "?y"))))
+    kb = KB(facts=[("parent", "mia"), ("parent", "leo")], rules=[loves_rule])
+    kb.forward_chain()
+    before = {fact for fact in kb.facts if fact[0] == "loves"}
+    kb.retract_fact(("parent", "mia"))
+    kb.add_fact(("parent", "mia"))
+    kb.forward_chain(engine="rete")
+    assert {fact for fact in kb.facts if fact[0] == "loves"} == before
+    assert len(kb.skolems) == 2
+
+    path = tmp_path / "skolems.json"
+    kb.skolems.save(str(path))
+    other = KB(facts=[("parent", "leo"), ("parent", "mia")], rules=[loves_rule])
+    other.skolems = SkolemTable.load(str(path))
+    other.forward_chain()
+    assert {fact for fact in other.facts if fact[0] == "loves"} == before
+
+
+def test_compact_storage_matches_indexed_storage():
+    from compact import SymbolTable, memory_report
+
+    indexed = _family_tree_kb(12)
+    compact = KB(facts=list(indexed.facts), rules=list(indexed.rules), storage="compact")
+    indexed.forward_chain()
+    compact.forward_chain()
+    assert set(compact.facts) == set(indexed.facts)
+    assert compact.query(("ancestor", "?who", "p5")) and ("ancestor", "p0", "p12") in compact.facts
+
+    symbols = SymbolTable()
+    encoded = symbols.encode(("ancestor", "?who", "p5"))
+    assert symbols.is_variable_id(encoded[1]) and not symbols.is_variable_id(encoded[2])
+    assert symbols.decode(encoded) == ("ancestor", "?who", "p5")
+
+    large = _family_tree_kb(60)
+    large.forward_chain(max_iterations=100)
+    report = memory_report(large.facts)
+    assert report.facts == len(large.facts)
+    assert report.compact_bytes < report.tuple_bytes
+
+
+def test_trail_bindings_undo_on_backtrack():
+    from reasoner import Bindings, unify_into
+
+    bindings = Bindings({"?x": "mia"})
+    mark = bindings.mark()
+    assert not unify_into(("likes", "?x", "?y"), ("likes", "leo", "cello"), bindings)
+    assert bindings.values == {"?x": "mia"}
+    assert unify_into(("likes", "?x", "?y"), ("likes", "mia", "cello"), bindings)
+    assert bindings.values == {"?x": "mia", "?y": "cello"}
+    bindings.undo(mark)
+    assert bindings.values == {"?x": "mia"}
+
+
+def test_compiled_rules_match_generic_interpretation():
+    from reasoner import CompiledRule
+
+    compiled = _family_tree_kb(10)
+    generic = _family_tree_kb(10)
+    generic.compile_rules = False
+    for kb in (compiled, generic):
+        kb.add_fact(("parent", "mia"))
+        kb.add_rule(("FORALL", ["?x"], ("IMPLIES", [("parent", "?x")], ("EXISTS", ["?y"], ("loves", "?x", "?y")))))
+        kb.forward_chain()
+    assert set(compiled.facts) == set(generic.facts)
+
+    renamed = KB(rules=[("FORALL", ["?a", "?b"], ("IMPLIES", [("parent", "?a", "?b")], ("ancestor", "?a", "?b")))])
+    first = CompiledRule(compiled.rules[0]).matcher((0,))
+    assert CompiledRule(renamed.rules[0]).matcher((0,)) is first
+
+
+def test_columnar_engine_produces_same_facts():
+    pytest.importorskip("numpy")
+    columnar = _family_tree_kb(12)
+    reference = _family_tree_kb(12)
+    for kb in (columnar, reference):
+        kb.add_fact(("parent", "p3", "q0"))
+        kb.add_fact(("parent", "mia"))
+        kb.add_rule(("FORALL", ["?x", "?y"], ("IMPLIES", [("ancestor", "?x", "?y"), ("ancestor", "?y", "q0")], ("near", "?x", "?y"))))
+        kb.add_rule(("FORALL", ["?x"], ("IMPLIES", [("parent", "?x")], ("EXISTS", ["?y"], ("loves", "?x", "?y")))))
+    columnar.forward_chain(engine="columnar")
+    reference.forward_chain()
+    assert set(columnar.facts) == set(reference.facts)
+
+
+def test_columnar_engine_handles_ground_premises_and_conclusions():
+    pytest.importorskip("numpy")
+    columnar = KB(facts=[("flag", "on"), ("p", "a"), ("p", "b")])
+    reference = KB(facts=[("flag", "on"), ("p", "a"), ("p", "b")])
+    for kb in (columnar, reference):
+        kb.add_rule(("FORALL", ["?x"], ("IMPLIES", [("flag", "on"), ("p", "?x")], ("q", "?x"))))
+        kb.add_rule(("FORALL", [], ("IMPLIES", [("flag", "on")], ("ready", "yes"))))
+    columnar.forward_chain(engine="columnar")
+    reference.forward_chain()
+    assert set(columnar.facts) == set(reference.facts)
+    assert {("q", "a"), ("q", "b"), ("ready", "yes")} <= set(columnar.facts)
+
+
+def test_linear_recursive_rules_use_closure_fast_path():
+    from reasoner import find_closures
+
+    kb = _family_tree_kb(30)
+    specs = find_closures(kb.rules)
+    assert [(s.rule_index, s.step, s.target, s.direction) for s in specs] == [(1, "parent", "ancestor", "left")]
+    kb.add_fact(("parent", "p30", "p0"))
+    kb.forward_chain(max_iterations=3)
+    naive = _family_tree_kb(30)
+    naive.add_fact(("parent", "p30", "p0"))
+    naive.forward_chain(max_iterations=100, engine="naive")
+    assert set(kb.facts) == set(naive.facts)
+
+    right = KB(
+        facts=[("edge", "a", "b"), ("edge", "b", "c"), ("edge", "c", "a")],
+        rules=[
+            ("FORALL", ["?x", "?y"], ("IMPLIES", [("edge", "?x", "?y")], ("path", "?x", "?y"))),
+            ("FORALL", ["?x", "?y", "?z"], ("IMPLIES", [("path", "?x", "?y"), ("path", "?y", "?z")], ("path", "?x", "?z"))),
+        ],
+    )
+    assert find_closures(right.rules)[0].direction == "transitive"
+    right.forward_chain()
+    assert len([fact for fact in right.facts if fact[0] == "path"]) == 9
+
+
+def test_save_and_load_snapshot_with_write_ahead_log(tmp_path):
+    kb = _family_tree_kb(20)
+    kb.add_rule(("FORALL", ["?x"], ("IMPLIES", [("parent", "?x", "p1")], ("EXISTS", ["?y"], ("loves", "?x", "?y")))))
+    kb.forward_chain()
+    path = str(tmp_path / "family.kb")
+    kb.save(path)
+    lazy = KB.load(path)
+    assert lazy.facts.cardinality(("ancestor", 3)) == 210 and ("ancestor", 3) not in lazy.facts.loaded
+    assert lazy.query(("ancestor", "p0", "p20")) == [{}] and ("ancestor", 3) in lazy.facts.loaded
+    kb.add_fact(("parent", "p20", "p21"))
+    kb.add_rule(("FORALL", ["?x", "?y"], ("IMPLIES", [("parent", "?x", "?y")], ("child", "?y", "?x"))))
+    kb.retract_fact(("parent", "p0", "p1"))
+    kb.forward_chain()
+
+    loaded = KB.load(path)
+    assert loaded.query(("parent", "p20", "?who")) == [{"?who": "p21"}]
+    loaded.forward_chain()
+    assert set(loaded.facts) == set(kb.facts)
+    assert len(loaded.rules) == 4
+
+    loaded.checkpoint()
+    assert (tmp_path / "family.kb.wal").read_text() == ""
+    assert set(KB.load(path).facts) == set(kb.facts)
+
+
+def test_load_replays_chaining_runs_logged_after_save(tmp_path):
+    kb = _family_tree_kb(5)
+    kb.forward_chain()
+    path = str(tmp_path / "family.kb")
+    kb.save(path)
+    kb.add_fact(("parent", "p5", "p6"))
+    kb.forward_chain()
+    kb.add_fact(("parent", "p6", "p7"))
+    # 로그에 있는 추론 실행을 재생하므로 load 뒤에 다시 추론하지 않아도 같은 사실을 가짐
+    assert set(KB.load(path).facts) == set(kb.facts)
+    assert ("ancestor", "p0", "p6") in kb.facts and ("ancestor", "p0", "p7") not in kb.facts
+    kb.ingest([("parent", "p7", "p8"), ("parent", "p8", "p9")], batch_size=1)
+    assert set(KB.load(path).facts) == set(kb.facts)
+
+
+def test_ingest_streams_batches_and_chains_incrementally(tmp_path):
+    path = tmp_path / "facts.txt"
+    path.write_text("# family\n" + "\n".join(f"parent(p{i},p{i + 1})" for i in range(30)) + "\nparent(p0,p1)\n")
+    kb = _family_tree_kb(0)
+    sizes = []
+    report = kb.ingest(str(path), batch_size=7, on_batch=lambda r: sizes.append(len(kb.facts)))
+    assert (report.read, report.added, report.duplicates, report.batches) == (31, 30, 1, 5)
+    assert report.derived == 465 and report.facts_per_second > 0
+
+    reference = _family_tree_kb(30)
+    reference.forward_chain()
+    assert set(kb.facts) == set(reference.facts)
+    assert sizes == sorted(sizes)
+
+    streamed = _family_tree_kb(0)
+    streamed.ingest((("parent", f"p{i}", f"p{i + 1}") for i in range(30)), batch_size=4)
+    assert set(streamed.facts) == set(reference.facts)
+
+
+def test_ingest_closes_long_chains_after_every_batch():
+    kb = _family_tree_kb(0)
+    kb.ingest((("parent", f"p{i}", f"p{i + 1}") for i in range(120)), batch_size=10)
+    reference = _family_tree_kb(120)
+    reference.forward_chain(max_iterations=200)
+    assert set(kb.facts) == set(reference.facts)
+
+
+def test_ingest_asserts_facts_that_were_already_derived():
+    kb = _family_tree_kb(3)
+    kb.forward_chain()
+    assert ("ancestor", "p0", "p2") in kb.facts
+    report = kb.ingest([("ancestor", "p0", "p2")])
+    assert report.added == 0 and report.duplicates == 1
+    kb.retract_fact(("parent", "p1", "p2"))
+    assert ("ancestor", "p0", "p2") in kb.facts
+
+
+def test_iter_query_pages_projects_and_stops_early():
+    kb = _family_tree_kb(40)
+    kb.forward_chain()
+    scanned = []
+    candidates = kb.facts.candidates
+
+    def counting_candidates(pattern):
+        for fact in candidates(pattern):
+            scanned.append(fact)
+            yield fact
+
+    kb.facts.candidates = counting_candidates
+    first = list(kb.iter_query(("ancestor", "?x", "?y"), limit=10))
+    assert len(first) == 10 and len(scanned) == 10
+    page = list(kb.iter_query(("ancestor", "?x", "?y"), limit=10, offset=10))
+    assert len(page) == 10 and not {tuple(sorted(s.items())) for s in page} & {tuple(sorted(s.items())) for s in first}
+    del kb.facts.candidates
+
+    grandparents = kb.iter_query([("parent", "?x", "?y"), ("parent", "?y", "?z")], select=["?x"], distinct=True)
+    assert sorted(s["?x"] for s in grandparents) == sorted(f"p{i}" for i in range(39))
+    backward = _family_tree_kb(5)
+    answers = backward.iter_query(("AND", ("parent", "?x", "p3"), ("ancestor", "?x", "?z")), select=["?z"], mode="backward")
+    assert sorted(s["?z"] for s in answers) == ["p3", "p4", "p5"]
+
+
+@pytest.mark.parametrize("compile_rules", [True, False])
+def test_forward_chain_profile_reports_per_rule_stats(compile_rules):
+    kb = _family_tree_kb(6)
+    kb.compile_rules = compile_rules
+    kb.add_rule(("FORALL", ["?x", "?y"], ("IMPLIES", [("ancestor", "?x", "?y"), ("parent", "?y", "?x")], ("cycle", "?x"))))
+    reported = []
+    kb.stats_hook = reported.append
+    kb.forward_chain(engine="naive")
+    stats = kb.stats
+    assert reported == [stats] and stats.reached_fixpoint and not stats.hit_iteration_cap
+    totals = stats.per_rule()
+    assert totals[0].added == 6 and totals[0].candidates == totals[0].unifications == 6 * stats.iterations
+    assert totals[1].added == 15 and totals[1].duplicates > 0
+    assert totals[2].substitutions == 0 and 0 < totals[2].failures < totals[2].unifications
+    assert "rule 1" in str(stats)
+
+    capped = _family_tree_kb(30)
+    capped.compile_rules = compile_rules
+    capped.forward_chain(max_iterations=2, engine="naive", profile=True)
+    assert capped.stats.hit_iteration_cap and capped.stats.iterations == 2
+
+
+def test_versioned_snapshots_isolate_readers_from_chaining():
+    import threading
+
+    kb = KB(facts=list(_family_tree_kb(80).facts), rules=list(_family_tree_kb(0).rules), storage="versioned")
+    before = kb.snapshot()
+    assert before.query(("ancestor", "p0", "?who")) == []
+
+    errors = []
+
+    def reader():
+        # 한 스냅숏 안에서는 체이닝이 진행되어도 같은 질의가 늘 같은 답을 내야 함
+        try:
+            for _ in range(30):
+                with kb.snapshot() as snap:
+                    first = snap.query(("ancestor", "?x", "?y"))
+                    assert snap.query(("ancestor", "?x", "?y")) == first
+                    assert len(first) == len(list(snap.iter_query(("ancestor", "?x", "?y"), distinct=True)))
+        except AssertionError as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=reader) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    kb.forward_chain(engine="naive")
+    for thread in threads:
+        thread.join()
+    assert not errors
+
+    assert before.query(("ancestor", "p0", "?who")) == []
+    assert len(kb.query(("ancestor", "p0", "?who"))) == 80
+    after = kb.snapshot()
+    kb.retract_fact(("parent", "p0", "p1"))
+    assert len(after.query(("ancestor", "p0", "?who"))) == 80 and kb.query(("ancestor", "p0", "?who")) == []
+    after.close()
+    with pytest.raises(ValueError):
+        _family_tree_kb(1).snapshot()
+
+
+def test_versioned_readers_are_stable_across_retract_and_re_add():
+    import threading
+
+    from versioned import VersionedFactStore
+
+    store = VersionedFactStore(("p", i) for i in range(200))
+    errors = []
+    done = threading.Event()
+
+    def reader():
+        # 되살린 사실이 버킷 안에서 자리를 옮기면 같은 스냅숏의 두 스캔 순서가 달라짐
+        try:
+            while not done.is_set():
+                view = store.at()
+                first = list(view.relation(("p", 2)))
+                assert list(view.relation(("p", 2))) == first
+                assert len(set(first)) == len(first)
+                view.close()
+        except AssertionError as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=reader) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for round_ in range(300):
+        fact = ("p", round_ % 200)
+        store.discard(fact)
+        store.publish()
+        store.add(fact)
+        store.publish()
+    done.set()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert sorted(store.at()) == [("p", i) for i in range(200)]
+
+
+def test_versioned_compaction_backs_off_when_nothing_is_collectible():
+    from versioned import VersionedFactStore
+
+    calls = []
+
+    class CountingStore(VersionedFactStore):
+        def _compact(self):
+            calls.append(len(self._tombstones))
+            super()._compact()
+
+    # 한 epoch 안의 삭제는 아직 치울 수 없으므로 정리 시도가 삭제 수에 비례해 늘면 안 됨
+    store = CountingStore(("p", i) for i in range(5000))
+    for i in range(5000):
+        store.discard(("p", i))
+    assert len(calls) <= 2
+    store.publish()
+    for i in range(5000):
+        store.add(("q", i))
+        store.discard(("q", i))
+    assert len(calls) <= 16
+    assert not list(store.at().relation(("p", 1)))
+
+
+def test_query_cache_invalidates_only_dependent_predicates():
+    kb = _family_tree_kb(10)
+    kb.add_rule(("FORALL", ["?x"], ("IMPLIES", [("pet", "?x")], ("animal", "?x"))))
+    kb.add_fact(("pet", "rex"))
+    kb.forward_chain()
+    cache = kb.query_cache
+
+    first = kb.query(("ancestor", "?who", "p5"))
+    renamed = kb.query(("ancestor", "?x", "p5"))
+    assert sorted(s["?x"] for s in renamed) == sorted(s["?who"] for s in first) == [f"p{i}" for i in range(5)]
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert kb.query(("animal", "?a")) == [{"?a": "rex"}]
+
+    kb.add_fact(("pet", "tom"))
+    hits = cache.hits
+    kb.query(("ancestor", "?who", "p5"))
+    assert cache.hits == hits + 1
+    kb.query(("animal", "?a"))
+    assert cache.hits == hits + 1
+
+    kb.add_fact(("parent", "q", "p0"))
+    kb.forward_chain()
+    assert len(kb.query(("ancestor", "?who", "p5"))) == 6
+    kb.retract_fact(("parent", "q", "p0"))
+    assert len(kb.query(("ancestor", "?who", "p5"))) == 5
+    assert cache.info()["hit_rate"] == cache.hit_rate > 0
+    assert KB(query_cache_size=0).query_cache is None
+
+
+def test_parallel_engine_matches_serial_fixpoint():
+    rules = [
+        ("FORALL", ["?x", "?y"], ("IMPLIES", [("edge", "?x", "?y")], ("path", "?x", "?y"))),
+        ("FORALL", ["?x", "?y", "?z"], ("IMPLIES", [("path", "?x", "?y"), ("edge", "?y", "?z")], ("path", "?x", "?z"))),
+        ("FORALL", ["?x", "?y"], ("IMPLIES", [("path", "?x", "?y"), ("path", "?y", "?x")], ("scc", "?x", "?y"))),
+        ("FORALL", ["?x"], ("IMPLIES", [("edge", "?x", "v0")], ("entry", "?x", "v0"))),
+    ]
+    facts = [("edge", f"v{i}", f"v{(i * 7 + 3) % 23}") for i in range(23)] + [("edge", "v5", "v0")]
+    serial = KB(facts=facts, rules=rules)
+    serial.forward_chain()
+    for workers in (1, 3):
+        kb = KB(facts=facts, rules=rules)
+        kb.forward_chain(engine="parallel", workers=workers)
+        assert set(kb.facts) == set(serial.facts)
+        assert sorted(s["?x"] for s in kb.query(("entry", "?x", "v0"))) == ["v16", "v5"]
+
+    # 존재 규칙은 Skolem 상수 생성 순서가 달라질 수 있으므로 직렬 엔진으로 처리됨
+    existential = [("FORALL", ["?x"], ("IMPLIES", [("person", "?x")], ("EXISTS", ["?y"], ("loves", "?x", "?y"))))]
+    kb = KB(facts=[("person", "ann")], rules=existential)
+    kb.forward_chain(engine="parallel", workers=2)
+    assert len(kb.query(("loves", "ann", "?y"))) == 1
+
+
+def test_schedule_fires_non_recursive_strata_once():
+    kb = _family_tree_kb(12)
+    kb.add_rule(("FORALL", ["?x", "?y"], ("IMPLIES", [("ancestor", "?x", "?y")], ("connected", "?x", "?y"))))
+    kb.add_rule(("FORALL", ["?x", "?y"], ("IMPLIES", [("knows", "?x", "?y")], ("knows", "?y", "?x"))))
+    schedule = kb.schedule()
+    assert [(s.predicates, s.recursive) for s in schedule] == [
+        (("ancestor",), True),
+        (("connected",), False),
+        (("knows",), True),
+    ]
+    assert str(schedule[1]) == "once {connected}: rules 2"
+
+    kb.forward_chain(profile=True)
+    assert len(kb.query(("connected", "p0", "?y"))) == 12
+    assert [entry.rule_index for entry in kb.stats.rules].count(2) == 1
+    assert kb.stats.reached_fixpoint
+    assert stratify([]) == []
+
+
+def test_chain_session_resumes_in_slices_and_cancels():
+    def build():
+        kb = _family_tree_kb(15)
+        kb.add_rule(("FORALL", ["?x", "?y"], ("IMPLIES", [("ancestor", "?x", "?y")], ("connected", "?x", "?y"))))
+        return kb
+
+    serial = build()
+    serial.forward_chain()
+    whole = build().chain_session().run()
+
+    kb = build()
+    session = kb.chain_session(firings=7)
+    slices = list(session)
+    assert all(p.firings - q.firings <= 7 for q, p in zip(slices, slices[1:]))
+    assert slices[-1].done and slices[-1].reached_fixpoint
+    # 중간에 멈췄다 이어도 같은 일을 다시 하지 않으므로 발화 수가 한 번에 돌린 것과 같음
+    assert slices[-1].firings == whole.firings and len(slices) > 2
+    assert set(kb.facts) == set(serial.facts)
+
+    kb = build()
+    session = kb.chain_session(firings=3)
+    first = session.step()
+    assert not first.done and first.firings == 3
+    session.cancel()
+    assert session.done and session.progress.cancelled and not session.progress.reached_fixpoint
+    assert session.step().firings == 3 and len(kb.facts) < len(serial.facts)
+
+
+def test_chain_session_budget_bounds_joins_that_derive_nothing():
+    # a(?x)와 e(?y, ?y)의 곱을 전부 훑지만 e의 두 인자가 같은 사실이 없어 아무것도 도출하지 않음
+    facts = [("a", f"x{i}") for i in range(3000)] + [("e", f"y{i}", f"z{i}") for i in range(3000)]
+    kb = KB(facts=facts, rules=[("FORALL", ["?x", "?y"], ("IMPLIES", [("a", "?x"), ("e", "?y", "?y")], ("out", "?x")))])
+    session = kb.chain_session(budget_ms=5)
+    first = session.step()
+    assert not first.done and first.firings == 0
+    final = session.run()
+    assert final.done and final.reached_fixpoint and final.firings == 0
+    assert not any(fact[0] == "out" for fact in kb.facts)
+
+
+def test_chain_session_cancel_from_another_thread_stops_the_running_slice():
+    import threading
+
+    facts = [("a", f"x{i}") for i in range(3000)] + [("e", f"y{i}", f"z{i}") for i in range(3000)]
+    kb = KB(facts=facts, rules=[("FORALL", ["?x", "?y"], ("IMPLIES", [("a", "?x"), ("e", "?y", "?y")], ("out", "?x")))])
+    session = kb.chain_session()
+    results = []
+    started = threading.Event()
+    worker = threading.Thread(target=lambda: (started.set(), results.append(session.run())))
+    worker.start()
+    started.wait()
+    # cancel은 도는 조각이 멈출 때까지 기다리므로, 돌아온 뒤에는 세션이 항상 끝나 있음
+    session.cancel()
+    assert session.done and session.progress.cancelled
+    worker.join()
+    assert results[0].done and results[0].cancelled and not results[0].reached_fixpoint
+
+
+def test_rules_and_facts_share_structure():
+    import dataclasses
+    import sys
+
+    from reasoner import CompiledRule, SubstitutionRecord
+
+    kb = KB(rules=[
+        ("FORALL", ["?x", "?y"], ("IMPLIES", [("parent", "?x", "?y")], ("ancestor", "?x", "?y"))),
+        ("FORALL", ["?x", "?y"], ("IMPLIES", [("boss", "?x", "?y")], ("superior", "?x", "?y"))),
+    ])
+    rule = kb.rules[0]
+    assert not hasattr(rule, "__dict__")
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        rule.premises = ()
+
+    # 상수(술어 이름)만 다른 규칙은 생성 코드를 공유하고 상수만 따로 가짐
+    first, second = (CompiledRule(r).matcher((0,)) for r in kb.rules)
+    assert first is not second and first.__code__ is second.__code__
+
+    name = "".join(["ali", "ce"])
+    kb.add_fact(("parent", name, "bob"))
+    kb.add_fact(("boss", "".join(["ali", "ce"]), "carol"))
+    stored = [fact[1] for fact in kb.facts]
+    assert all(arg is sys.intern("alice") for arg in stored)
+
+    record = SubstitutionRecord({"?x": 0, "?y": 1}, ("alice", "bob"))
+    assert record["?y"] == "bob" and record.get("?z") is None and dict(record) == {"?x": "alice", "?y": "bob"}
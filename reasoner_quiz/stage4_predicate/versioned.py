@@ -0,0 +1,187 @@
+﻿from __future__ import annotations
+
+import weakref
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from reasoner import (
+    KB,
+    FactStore,
+    Predicate,
+    RelationKey,
+    Substitution,
+    Term,
+    relation_key,
+)
+
+
+class VersionedFactStore(FactStore):
+    """FactStore that keeps every fact's lifetime as epochs for snapshot reads.
+
+    The writer works on the latest state exactly like a FactStore; its changes
+    are stamped with epoch ``self.epoch + 1`` and become visible to readers
+    only when ``publish()`` advances ``self.epoch``. A reader pinned to epoch
+    E sees a fact iff one of its lifetimes [born, died) contains E. Buckets
+    are append-only, so readers scan them without a lock; removed facts stay
+    in the buckets until no open snapshot can still see them.
+    """
+
+    def __init__(self, facts: Optional[Iterable[Predicate]] = None) -> None:
+        self.epoch = 0
+        self._born: Dict[Predicate, int] = {}
+        self._died: Dict[Predicate, int] = {}
+        self._history: Dict[Predicate, List[Tuple[int, int]]] = {}
+        self._readers: "weakref.WeakSet[EpochView]" = weakref.WeakSet()
+        super().__init__(facts)
+        self.publish()
+
+    def publish(self) -> int:
+        # 정수 하나를 바꾸는 것이므로 읽는 쪽은 이전 epoch 또는 새 epoch 중 하나를 온전히 봄
+        self.epoch += 1
+        return self.epoch
+
+    def add(self, fact: Predicate) -> bool:
+        if fact in self._facts:
+            return False
+        if fact in self._tombstones:
+            # 아직 버킷에 남아 있는 자리를 그대로 되살림; FactStore._purge처럼 버킷을 새 리스트로
+            # 바꾸면 같은 epoch를 읽는 스캔이 순서가 다른 결과를 보게 됨 (정리는 _compact만 함)
+            # 이전 수명과 새 탄생을 먼저 기록하고 _died를 지워야 어느 순간에도 삭제 구간이 보이지 않음
+            self._history.setdefault(fact, []).append((self._born[fact], self._died[fact]))
+            self._born[fact] = self.epoch + 1
+            del self._died[fact]
+            self._tombstones.discard(fact)
+            self._facts.add(fact)
+            return True
+        self._born[fact] = self.epoch + 1
+        return super().add(fact)
+
+    def discard(self, fact: Predicate) -> bool:
+        if fact not in self._facts:
+            return False
+        self._died[fact] = self.epoch + 1
+        return super().discard(fact)
+
+    def visible(self, fact: Predicate, epoch: int) -> bool:
+        born = self._born.get(fact)
+        if born is None:
+            return False
+        if born <= epoch:
+            died = self._died.get(fact)
+            if died is None or epoch < died:
+                return True
+        return any(start <= epoch < end for start, end in self._history.get(fact, ()))
+
+    def at(self, epoch: Optional[int] = None) -> "EpochView":
+        view = EpochView(self, self.epoch if epoch is None else epoch)
+        self._readers.add(view)
+        return view
+
+    def oldest_reader(self) -> int:
+        epochs = [view.epoch for view in list(self._readers)]
+        return min(epochs, default=self.epoch)
+
+    def _compact(self) -> None:
+        # 열린 스냅숏 중 가장 오래된 것도 더는 볼 수 없는 삭제 사실만 버킷에서 치움
+        horizon = min(self.oldest_reader(), self.epoch)
+        tombstones = self._tombstones
+        collectible = {fact for fact in tombstones if self._died.get(fact, 0) <= horizon}
+        # 못 치운 묘비가 남으면 문턱을 그 두 배로 올림; 안 그러면 이후 discard마다 헛된 정리를 반복해 제곱 시간이 됨
+        self._compact_at = max(64, 2 * (len(tombstones) - len(collectible)))
+        if not collectible:
+            return
+        self._tombstones = collectible
+        super()._compact()
+        self._tombstones = tombstones - collectible
+        for fact in collectible:
+            self._born.pop(fact, None)
+            self._died.pop(fact, None)
+            self._history.pop(fact, None)
+
+
+class EpochView:
+    """Read-only view of a VersionedFactStore as of one published epoch."""
+
+    def __init__(self, store: VersionedFactStore, epoch: int) -> None:
+        self.store = store
+        self.epoch = epoch
+
+    def __contains__(self, fact: object) -> bool:
+        return self.store.visible(fact, self.epoch)
+
+    def __iter__(self) -> Iterator[Predicate]:
+        store = self.store
+        for bucket in list(store._relations.values()) + [store._unkeyed]:
+            yield from self._scan(bucket)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def relation(self, key: RelationKey) -> Iterator[Predicate]:
+        return self._scan(self.store._relations.get(key, []))
+
+    def relations(self) -> List[RelationKey]:
+        return self.store.relations()
+
+    def cardinality(self, key: Optional[RelationKey]) -> int:
+        # 계획용 추정치이므로 최신 상태의 크기를 그대로 씀
+        return self.store.cardinality(key)
+
+    def selectivity(self, key: RelationKey, pos: int, arg: Optional[Term] = None) -> int:
+        return self.store.selectivity(key, pos, arg)
+
+    def candidates(self, pattern: Term) -> Iterator[Predicate]:
+        if relation_key(pattern) is None:
+            return iter(self)
+        return self._scan(self.store._smallest_bucket(pattern))
+
+    def _scan(self, bucket: List[Predicate]) -> Iterator[Predicate]:
+        size = len(bucket)
+        visible = self.store.visible
+        epoch = self.epoch
+        for i in range(size):
+            fact = bucket[i]
+            if visible(fact, epoch):
+                yield fact
+
+    def close(self) -> None:
+        self.store._readers.discard(self)
+
+
+class KBSnapshot:
+    """Consistent, lock-free read access to a KB at one published epoch.
+
+    Queries see exactly the facts published when the snapshot was taken, no
+    matter what the chaining thread adds or retracts afterwards.
+    """
+
+    def __init__(self, kb: KB) -> None:
+        if not isinstance(kb.facts, VersionedFactStore):
+            raise ValueError("KB.snapshot() needs KB(storage='versioned')")
+        self.kb = kb
+        self.facts = kb.facts.at()
+        self.epoch = self.facts.epoch
+
+    def __enter__(self) -> "KBSnapshot":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.facts.close()
+
+    def query(self, pattern: Predicate) -> List[Substitution]:
+        return list(self.iter_query(pattern))
+
+    def iter_query(
+        self,
+        patterns: Term,
+        select: Optional[Sequence[str]] = None,
+        distinct: bool = False,
+        limit: Optional[int] = None,
+        offset: int = 0,
+    ) -> Iterator[Substitution]:
+        return self.kb.iter_query(patterns, select, distinct, limit, offset, facts=self.facts)
+
+
+__all__ = ["VersionedFactStore", "EpochView", "KBSnapshot"]
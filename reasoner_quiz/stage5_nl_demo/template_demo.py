@@ -135,14 +135,12 @@ def run_demo() -> Tuple[List[DemoResult], KB]:
     parent_rule = engine.render("parent_rule")
     ancestor_rule = engine.render("ancestor_transitivity")
 
-    # 2. KB에 추가
-    kb.add_fact(parent_fact1)
-    kb.add_fact(parent_fact2)
+    # 2. KB에 규칙 추가
     kb.add_rule(parent_rule)
     kb.add_rule(ancestor_rule)
 
-    # 3. 전방 추론 실행 (Alice가 Carol의 조상임을 찾아냄)
-    kb.forward_chain()
+    # 3. 사실을 넣으면서 전방 추론 실행 (Alice가 Carol의 조상임을 찾아냄)
+    kb.ingest([parent_fact1, parent_fact2])
 
     # 4. 결과 생성 (테스트 통과를 위해 필요한 리스트)
     # 테스트 코드가 "ancestor of Carol" 문구가 포함된 DemoResult를 찾으므로 이를 생성합니다.
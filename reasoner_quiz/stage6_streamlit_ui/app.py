@@ -11,6 +11,7 @@ import streamlit as st
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 sys.path.append(str(PROJECT_ROOT / "stage4_predicate"))
 
+from ingest import IngestError, parse_fact_line  # type: ignore
 from reasoner import KB  # type: ignore
 
 Fact = Tuple[str, ...]
@@ -26,6 +27,9 @@ forall x,y: ancestor(x,y) -> connected(x,y)"""
 
 DEFAULT_QUERY = "ancestor(?who, dana)"
 
+MAX_RESULT_ROWS = 500
+CHAIN_SLICE_MS = 100
+
 
 class ParseError(Exception):
     """Raised when the text-based KB format cannot be parsed."""
@@ -33,15 +37,11 @@ class ParseError(Exception):
 
 def parse_fact(line: str) -> Fact:
     # === QUIZ: parse a textual fact into predicate tuple ===
-    line = line.strip().lower()
-    if not line: return None
-    # 'parent(alice,bob)' 에서 이름과 인자들을 추출
-    match = re.match(r"(\w+)\((.*)\)", line)
-    if not match:
-        raise ParseError(f"Invalid fact format: {line}")
-    pred_name, args_str = match.groups()
-    args = tuple(arg.strip() for arg in args_str.split(","))
-    return (pred_name, *args)
+    # 'parent(alice,bob)' 문법은 stage4 ingest의 파서 하나를 같이 씀 (파일 적재와 UI가 같은 규칙을 따름)
+    try:
+        return parse_fact_line(line)
+    except IngestError as exc:
+        raise ParseError(str(exc)) from exc
     # raise NotImplementedError("QUIZ: parse_fact needs implementation")
 
 
@@ -157,13 +157,14 @@ def main() -> None:
             # 데이터 파싱 및 로딩
             facts = parse_facts_block(facts_text)
             rules = parse_rules_block(rules_text)
-            for f in facts: kb.add_fact(f)
             for r in rules: kb.add_rule(r)
 
-            # 추론 엔진 가동
+            # 추론 엔진 가동 (사실은 배치로 넣고, 추론은 짧은 조각으로 나눠 진행 상황을 갱신)
             with st.status("전방 추론 수행 중...", expanded=True) as status:
-                kb.forward_chain()
-                status.update(label="추론 완료!", state="complete", expanded=False)
+                report = kb.ingest(facts, chain=False)
+                for progress in kb.chain_session(budget_ms=CHAIN_SLICE_MS):
+                    status.update(label=f"전방 추론 수행 중... ({progress})")
+                status.update(label=f"추론 완료! ({report.read} facts, {progress})", state="complete", expanded=False)
             
             # 3. 결과 출력 섹션
             st.divider()
@@ -178,12 +179,16 @@ def main() -> None:
             with res_col2:
                 st.subheader("질의 결과")
                 query_pred = parse_query(query_text)
-                results = kb.query(query_pred)
+                # 표에 보여줄 만큼만 답을 만들고 멈춤 (전체 결과 리스트를 만들지 않음)
+                results = list(kb.iter_query(query_pred, distinct=True, limit=MAX_RESULT_ROWS + 1))
                 
                 if results:
                     # 결과를 표(Table)로 보여주면 변수 매칭을 확인하기 훨씬 편합니다.
-                    st.dataframe(pd.DataFrame(results), use_container_width=True)
-                    st.success(f"총 {len(results)}개의 일치하는 사실을 찾았습니다.")
+                    st.dataframe(pd.DataFrame(results[:MAX_RESULT_ROWS]), use_container_width=True)
+                    if len(results) > MAX_RESULT_ROWS:
+                        st.success(f"일치하는 사실이 많아 처음 {MAX_RESULT_ROWS}개만 표시합니다.")
+                    else:
+                        st.success(f"총 {len(results)}개의 일치하는 사실을 찾았습니다.")
                 else:
                     st.warning("일치하는 결과가 없습니다.")
 